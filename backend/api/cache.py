@@ -0,0 +1,139 @@
+import hashlib
+import time
+
+from core.constants import RESPONSE_CACHE_TIMEOUT
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY = 'version:{}'
+
+# Версии ответов со списком рецептов и с отдельным рецептом
+RECIPE_LIST_VERSION = 'recipe_list'
+RECIPE_VERSION = 'recipe:{}'
+# Версии справочников (api.recipes.ingredient_index, api.catalogue)
+INGREDIENTS_VERSION = 'ingredients'
+TAGS_VERSION = 'tags'
+# Версия корзины пользователя (api.shopping_list)
+CART_VERSION = 'cart:{}'
+
+RESPONSE_CACHE_STATS = ('hits', 'misses')
+RESPONSE_CACHE_STATS_KEY = 'response_cache:{}'
+
+
+def get_version(name):
+    """Текущая версия группы кешированных данных."""
+    return cache.get_or_set(VERSION_KEY.format(name), time.time_ns, None)
+
+
+def bump_version(name):
+    """
+    Увеличивает версию, делая недоступными все записи со старой версией.
+
+    Если ключ версии пропал из кеша, версия начинается с текущего времени,
+    чтобы не совпасть ни с одной из уже выданных.
+    """
+    key = VERSION_KEY.format(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def bump_versions(names):
+    """Выдает новые версии сразу для нескольких групп одним обращением."""
+    version = time.time_ns()
+    cache.set_many(
+        {VERSION_KEY.format(name): version for name in names}, None
+    )
+
+
+def invalidate_recipes(recipe_ids):
+    """Сбрасывает кеш ответов для рецептов и всех списков рецептов."""
+    bump_versions(
+        [RECIPE_LIST_VERSION]
+        + [RECIPE_VERSION.format(recipe_id) for recipe_id in recipe_ids]
+    )
+
+
+def invalidate_carts(user_ids):
+    """Сбрасывает закешированные списки покупок пользователей."""
+    bump_versions([CART_VERSION.format(user_id) for user_id in user_ids])
+
+
+def _request_digest(request):
+    """Хеш адреса запроса с упорядоченными параметрами."""
+    query = sorted(
+        (key, value)
+        for key, values in request.query_params.lists()
+        for value in values
+    )
+    # Хост и схема попадают в ответ через абсолютные ссылки
+    url = f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+    return hashlib.md5(url.encode()).hexdigest()
+
+
+def recipe_list_key(request):
+    return 'response:recipes:{}:{}'.format(
+        get_version(RECIPE_LIST_VERSION), _request_digest(request)
+    )
+
+
+def recipe_detail_key(request, recipe_id):
+    if not str(recipe_id).isdigit():
+        return None
+    recipe_id = int(recipe_id)
+    return 'response:recipe:{}:{}:{}'.format(
+        recipe_id,
+        get_version(RECIPE_VERSION.format(recipe_id)),
+        _request_digest(request)
+    )
+
+
+def _count(stat):
+    key = RESPONSE_CACHE_STATS_KEY.format(stat)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_response_cache_stats():
+    """Количество попаданий и промахов кеша ответов."""
+    values = cache.get_many(
+        [RESPONSE_CACHE_STATS_KEY.format(stat)
+         for stat in RESPONSE_CACHE_STATS]
+    )
+    return {
+        stat: values.get(RESPONSE_CACHE_STATS_KEY.format(stat), 0)
+        for stat in RESPONSE_CACHE_STATS
+    }
+
+
+def cached_response(request, get_key, build_response):
+    """
+    Отдает ответ анонимному пользователю из общего кеша.
+
+    Ответ одинаков для всех анонимных пользователей, поэтому ключ
+    зависит только от адреса запроса. Авторизованные пользователи
+    и запросы, для которых get_key() вернул None, кеш не используют.
+    """
+    key = None if request.user.is_authenticated else get_key()
+    if key is None:
+        return build_response()
+
+    cached = cache.get(key)
+    if cached is not None:
+        _count('hits')
+        data, headers = cached
+        response = Response(data, headers=headers)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    _count('misses')
+    response = build_response()
+    if response.status_code == status.HTTP_200_OK:
+        cache.set(key, (response.data, dict(response.items())),
+                  RESPONSE_CACHE_TIMEOUT)
+    response['X-Cache'] = 'MISS'
+    return response
@@ -0,0 +1,225 @@
+"""
+Снимки справочников (теги, ингредиенты) с хешем содержимого в имени.
+
+Полный список тегов и ингредиентов одинаков для всех клиентов, поэтому
+он сериализуется один раз и сохраняется в хранилище медиафайлов как
+catalogue/<имя>.<хеш>.json вместе со сжатыми вариантами .gz и .br.
+Файл с хешем в имени никогда не меняется: nginx отдает его с вечным
+кешированием, а API отдает те же байты, выбирая вариант по
+Accept-Encoding, с ETag по хешу.
+
+Какой снимок актуален, хранится в общем кеше по версии справочника
+(api.cache). Изменение справочника меняет версию, и следующий запрос
+публикует новый снимок, если его еще не опубликовали команда load_data
+или админка. Одинаковое содержимое дает тот же хеш и тот же файл.
+"""
+import gzip
+import hashlib
+
+from api.cache import INGREDIENTS_VERSION, TAGS_VERSION, get_version
+from api.recipes.serializers import IngredientSerializer, TagSerializer
+from core.constants import CATALOGUE_DIR, CATALOGUE_KEEP_GENERATIONS
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from recipes.models import Ingredient, Tag
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import brotli
+except ImportError:  # без brotli отдаются только gzip и несжатый JSON
+    brotli = None
+
+# Справочник: (версия в кеше, модель, сериализатор)
+CATALOGUES = {
+    'tags': (TAGS_VERSION, Tag, TagSerializer),
+    'ingredients': (INGREDIENTS_VERSION, Ingredient, IngredientSerializer),
+}
+# Варианты снимка в порядке предпочтения: (Content-Encoding, расширение)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'), (None, ''))
+SNAPSHOT_KEY = 'catalogue:{}:{}'
+GENERATIONS_KEY = 'catalogue:{}:generations'
+HASH_LENGTH = 16
+
+# Содержимое снимков в памяти процесса: файлы неизменяемы
+_contents = {}
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content)
+    if encoding == 'gzip':
+        # mtime=0: одинаковое содержимое дает одинаковый файл
+        return gzip.compress(content, mtime=0)
+    return content
+
+
+def available_encodings():
+    return [
+        (encoding, extension) for encoding, extension in ENCODINGS
+        if encoding != 'br' or brotli is not None
+    ]
+
+
+def parse_accept_encoding(header):
+    """
+    Кодировки из Accept-Encoding с весами: {'gzip': 1.0, 'br': 0.5}.
+
+    Кодировка с непонятным весом считается неприемлемой.
+    """
+    weights = {}
+    for item in header.split(','):
+        coding, *params = [part.strip() for part in item.split(';')]
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+    return weights
+
+
+def choose_encoding(header):
+    """
+    Вариант снимка (Content-Encoding, расширение) для Accept-Encoding.
+
+    Выбирается вариант с наибольшим весом, при равных весах — по порядку
+    ENCODINGS. Кодировки с q=0 не отдаются. Несжатый JSON участвует
+    в выборе, только если его вес задан (identity или *), иначе
+    отдается, когда не подошло ничего другого.
+    """
+    weights = parse_accept_encoding(header)
+    default = weights.get('*', 0.0)
+    best, best_weight = (None, ''), 0.0
+    for encoding, extension in available_encodings():
+        weight = weights.get(encoding or 'identity', default)
+        if weight > best_weight:
+            best, best_weight = (encoding, extension), weight
+    return best
+
+
+def snapshot_path(name, digest, extension=''):
+    return f'{CATALOGUE_DIR}{name}.{digest}.json{extension}'
+
+
+def publish(name):
+    """
+    Сохраняет снимок текущего содержимого справочника.
+
+    Возвращает хеш снимка. Версия читается до чтения данных: если
+    справочник изменится во время публикации, снимок запишется
+    под старой версией и не будет использован.
+    """
+    version_name, model, serializer_class = CATALOGUES[name]
+    version = get_version(version_name)
+    content = JSONRenderer().render(
+        serializer_class(model.objects.all(), many=True).data
+    )
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    for encoding, extension in available_encodings():
+        path = snapshot_path(name, digest, extension)
+        if not default_storage.exists(path):
+            default_storage.save(
+                path, ContentFile(compress(content, encoding))
+            )
+    cache.set(SNAPSHOT_KEY.format(name, version), digest, None)
+    prune(name, digest)
+    return digest
+
+
+def prune(name, digest):
+    """
+    Удаляет старые снимки справочника.
+
+    Остаются CATALOGUE_KEEP_GENERATIONS последних опубликованных снимков:
+    предыдущий еще могут читать клиенты и процессы, получившие его хеш
+    до публикации. Порядок публикаций хранится в общем кеше.
+    """
+    key = GENERATIONS_KEY.format(name)
+    generations = [digest] + [
+        generation for generation in cache.get(key, [])
+        if generation != digest
+    ]
+    keep = generations[:CATALOGUE_KEEP_GENERATIONS]
+    cache.set(key, keep, None)
+    try:
+        _, files = default_storage.listdir(CATALOGUE_DIR)
+    except FileNotFoundError:
+        return
+    prefix = f'{name}.'
+    for file_name in files:
+        if (file_name.startswith(prefix)
+                and file_name[len(prefix):].split('.', 1)[0] not in keep):
+            default_storage.delete(f'{CATALOGUE_DIR}{file_name}')
+
+
+def current(name):
+    """Хеш снимка текущей версии справочника, при необходимости новый."""
+    digest = cache.get(SNAPSHOT_KEY.format(
+        name, get_version(CATALOGUES[name][0])
+    ))
+    return digest or publish(name)
+
+
+def read(name, digest, extension):
+    global _contents
+    path = snapshot_path(name, digest, extension)
+    content = _contents.get(path)
+    if content is None:
+        with default_storage.open(path) as snapshot:
+            content = snapshot.read()
+        # Хранится только последний снимок каждого варианта. Словарь
+        # не меняется на месте, а заменяется новым: другие потоки
+        # в это время читают прежний
+        contents = {
+            key: value for key, value in _contents.items()
+            if not (key.startswith(f'{CATALOGUE_DIR}{name}.')
+                    and key.endswith(f'.json{extension}'))
+        }
+        contents[path] = content
+        _contents = contents
+    return content
+
+
+def snapshot_response(request, name):
+    """
+    Ответ API с готовым снимком справочника.
+
+    Клиент может кешировать справочник целиком и перепроверять его
+    по ETag (хеш содержимого) без обращения к БД. Заголовок Link
+    указывает на неизменяемый файл снимка.
+    """
+    digest = current(name)
+    etag = f'W/"{digest}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        encoding, extension = choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        try:
+            content = read(name, digest, extension)
+        except FileNotFoundError:
+            # Файл удалила очистка старых снимков в другом процессе:
+            # публикация записывает снимок заново
+            digest = publish(name)
+            etag = f'W/"{digest}"'
+            content = read(name, digest, extension)
+        response = HttpResponse(content, content_type='application/json')
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['X-Catalogue-Version'] = digest
+    response['Cache-Control'] = 'no-cache'
+    response['Link'] = (
+        f'<{default_storage.url(snapshot_path(name, digest))}>; '
+        f'rel="alternate"; type="application/json"'
+    )
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
@@ -0,0 +1,97 @@
+"""
+Условные GET-запросы (ETag / Last-Modified / 304).
+
+Валидаторы считаются по id и датам изменения одним-двумя лёгкими
+запросами, без сериализации, поэтому ответ 304 отдаётся до того,
+как строится тело ответа.
+"""
+import hashlib
+from functools import partial
+
+from django.db.models import Count, Max, Value
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from recipes.models import Favorite, ShoppingCart
+from rest_framework import status
+from users.models import Subscription
+
+
+def make_etag(request, *parts):
+    """Слабый ETag по адресу запроса, пользователю и переданным данным."""
+    payload = repr((request.get_full_path(), request.user.pk, parts))
+    return 'W/"{}"'.format(hashlib.md5(payload.encode()).hexdigest())
+
+
+def viewer_state(user):
+    """
+    Состояние пользователя, от которого зависят флаги в ответе.
+
+    Количество и время последнего добавления избранного, корзины
+    и подписок одним запросом. Любое добавление или удаление меняет
+    результат, поэтому ETag меняется вместе с флагами is_favorited,
+    is_in_shopping_cart и is_subscribed.
+    """
+    if not user.is_authenticated:
+        return ()
+    parts = [
+        queryset.values(user_field).annotate(
+            kind=Value(kind), count=Count('id'), last=Max(date_field)
+        ).values_list('kind', 'count', 'last')
+        for kind, queryset, user_field, date_field in (
+            ('favorites', Favorite.objects.filter(user=user),
+             'user', 'added'),
+            ('cart', ShoppingCart.objects.filter(user=user),
+             'user', 'added'),
+            ('subscriptions', Subscription.objects.filter(subscriber=user),
+             'subscriber', 'created'),
+        )
+    ]
+    return tuple(sorted(parts[0].union(*parts[1:], all=True)))
+
+
+def conditional_response(request, build_response, etag,
+                         last_modified=None):
+    """
+    Отвечает 304, если клиент прислал актуальные валидаторы.
+
+    Иначе строит ответ через build_response() и добавляет к нему
+    заголовки ETag и Last-Modified.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=timestamp
+    )
+    if response is not None:
+        return response
+
+    response = build_response()
+    if response.status_code == status.HTTP_200_OK:
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+class ConditionalCatalogueMixin:
+    """
+    Условные GET для справочников с полем modified (теги, ингредиенты).
+
+    ETag одного объекта строится по его id и дате изменения. Списки
+    отдаются из снимков справочников (api.catalogue) со своими ETag.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        build_response = partial(super().retrieve, request, *args, **kwargs)
+        try:
+            modified = self.get_queryset().filter(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            ).values_list('modified', flat=True).first()
+        except (TypeError, ValueError):
+            modified = None
+        if modified is None:
+            # Ответ 404 строится обычным путем
+            return build_response()
+        return conditional_response(
+            request, build_response, make_etag(request, modified), modified
+        )
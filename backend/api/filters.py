@@ -1,8 +1,18 @@
-from django.db.models import QuerySet
+from functools import cache
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import Exists, OuterRef, QuerySet
+from django.db.models.functions import Upper
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
 
 
 class RecipeFilter:
-    """Класс для фильтрации рецептов."""
+    """Класс для фильтрации рецептов.
+
+    Связанные таблицы проверяются подзапросами EXISTS (semi-join),
+    а не JOIN: строки рецептов не размножаются и DISTINCT не нужен.
+    """
 
     @staticmethod
     def filter_recipes(queryset: QuerySet, request) -> QuerySet:
@@ -15,16 +25,97 @@ class RecipeFilter:
         # Фильтрация по избранному
         is_favorited = request.query_params.get('is_favorited')
         if is_favorited == '1' and request.user.is_authenticated:
-            queryset = queryset.filter(favorites__user=request.user)
+            queryset = queryset.filter(Exists(Favorite.objects.filter(
+                user=request.user, recipe=OuterRef('pk')
+            )))
 
         # Фильтрация по списку покупок
         is_in_shopping_cart = request.query_params.get('is_in_shopping_cart')
         if is_in_shopping_cart == '1' and request.user.is_authenticated:
-            queryset = queryset.filter(shopping_cart__user=request.user)
+            queryset = queryset.filter(Exists(ShoppingCart.objects.filter(
+                user=request.user, recipe=OuterRef('pk')
+            )))
 
         # Фильтрация по тегам
         tags = request.query_params.getlist('tags')
         if tags:
-            queryset = queryset.filter(tags__slug__in=tags).distinct()
+            queryset = queryset.filter(Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe_id=OuterRef('pk'),
+                    tag_id__in=Tag.objects.filter(slug__in=tags).values('id')
+                )
+            ))
 
         return queryset
+
+    @staticmethod
+    def get_signature(request) -> tuple:
+        """
+        Нормализованное описание фильтров запроса.
+
+        Одинаковые наборы фильтров дают одинаковую сигнатуру независимо
+        от порядка параметров. Пустой кортеж означает выборку без фильтров.
+        """
+        signature = []
+
+        author_id = request.query_params.get('author')
+        if author_id:
+            signature.append(('author', author_id))
+
+        # Фильтры по избранному и корзине зависят от пользователя
+        if request.user.is_authenticated:
+            for param in ('is_favorited', 'is_in_shopping_cart'):
+                if request.query_params.get(param) == '1':
+                    signature.append((param, request.user.pk))
+
+        tags = request.query_params.getlist('tags')
+        if tags:
+            signature.append(('tags', tuple(sorted(set(tags)))))
+
+        return tuple(signature)
+
+
+@cache
+def trigram_available() -> bool:
+    """Установлено ли в БД расширение pg_trgm (проверяется один раз)."""
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+class IngredientFilter:
+    """Поиск ингредиентов по подстроке и с опечатками."""
+
+    @staticmethod
+    def other_matches(queryset: QuerySet, query: str, limit: int) -> list:
+        """
+        До limit ингредиентов, название которых не начинается с query.
+
+        Сначала названия, содержащие query, затем похожие по триграммам
+        pg_trgm (опечатки). Каждая группа выбирается своим запросом
+        с LIMIT, и следующая запрашивается, только если результатов
+        не хватило. Условия записаны через UPPER(name), по которому
+        построен GIN-индекс триграмм (миграция 0006_ingredient_name_trgm).
+        Совпадения по началу названия отдает индекс в памяти
+        (api.recipes.ingredient_index).
+        """
+        groups = [
+            queryset.filter(name__icontains=query).exclude(
+                name__istartswith=query
+            ).order_by('name'),
+        ]
+        if trigram_available():
+            groups.append(queryset.alias(upper_name=Upper('name')).filter(
+                upper_name__trigram_similar=query.upper()
+            ).exclude(name__icontains=query).annotate(
+                similarity=TrigramSimilarity(Upper('name'), query.upper())
+            ).order_by('-similarity', 'name'))
+
+        results = []
+        for group in groups:
+            if len(results) >= limit:
+                break
+            results += group[:limit - len(results)]
+        return results
@@ -0,0 +1,264 @@
+"""
+Уменьшенные копии изображений рецептов и аватарок (WebP и JPEG).
+
+Когда сохраняется новое изображение (api.signals), копии нужных ширин
+строятся после коммита в пуле потоков. Готовность хранится в поле
+модели (Recipe.image_variants, CustomUser.avatar_variants) в виде
+{'name': исходный файл, 'widths': [ширины]}. Пока копии не готовы или
+построены для прежнего файла, вместо них отдается исходный файл.
+
+Имена копий выводятся из имени исходного файла, поэтому ссылки
+строятся без обращения к хранилищу.
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Lock
+
+from core.constants import (AVATAR_IMAGE_WIDTHS, IMAGE_VARIANT_FORMATS,
+                            IMAGE_VARIANT_QUALITY, IMAGE_VARIANT_WORKERS,
+                            IMAGE_VARIANTS_DIR, RECIPE_IMAGE_WIDTHS)
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import ExifTags, Image, ImageOps
+from recipes.models import Recipe
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+# Модель: (поле файла, поле готовности, ширины копий)
+KINDS = {
+    Recipe: ('image', 'image_variants', RECIPE_IMAGE_WIDTHS),
+    User: ('avatar', 'avatar_variants', AVATAR_IMAGE_WIDTHS),
+}
+# Формат копий: (формат Pillow, расширение файла)
+FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+# Формат ссылки на аватарку: ее показывают только маленькой
+AVATAR_FORMAT = 'webp'
+
+_executor = None
+_executor_lock = Lock()
+
+
+def file_url(storage, name, request):
+    """Ссылка на файл, абсолютная, если есть запрос."""
+    if not name:
+        return None
+    url = storage.url(name)
+    return request.build_absolute_uri(url) if request else url
+
+
+def variant_name(name, width, variant_format):
+    """Имя копии: variants/<исходное имя без расширения>.<ширина>w.<ext>."""
+    stem = os.path.splitext(name)[0]
+    return f'{IMAGE_VARIANTS_DIR}{stem}.{width}w.{FORMATS[variant_format][1]}'
+
+
+def ready_widths(name, state):
+    """Ширины готовых копий файла name (пусто, если копии не готовы)."""
+    if not name or not state or state.get('name') != name:
+        return ()
+    return state.get('widths', ())
+
+
+def variant_urls(name, state, widths, storage, request):
+    """
+    Ссылки на копии {формат: {ширина: ссылка}}.
+
+    Пока копии не готовы, на месте каждой — ссылка на исходный файл.
+    """
+    if not name:
+        return None
+    ready = ready_widths(name, state)
+    original = file_url(storage, name, request)
+    return {
+        variant_format: {
+            str(width): (
+                file_url(storage, variant_name(name, width, variant_format),
+                         request)
+                if width in ready else original
+            )
+            for width in widths
+        }
+        for variant_format in IMAGE_VARIANT_FORMATS
+    }
+
+
+def recipe_image_urls(name, state, request):
+    return variant_urls(name, state, RECIPE_IMAGE_WIDTHS,
+                        Recipe._meta.get_field('image').storage, request)
+
+
+def avatar_url(name, state, request):
+    """Наибольшая копия аватарки или исходный файл, пока копий нет."""
+    storage = User._meta.get_field('avatar').storage
+    width = max(AVATAR_IMAGE_WIDTHS)
+    if width in ready_widths(name, state):
+        name = variant_name(name, width, AVATAR_FORMAT)
+    return file_url(storage, name, request)
+
+
+def prepare(image, width):
+    """
+    Загружает изображение для уменьшения до ширины width.
+
+    JPEG сразу декодируется в уменьшенном масштабе (draft), поворот
+    по EXIF применяется до изменения размера. Поворот еще не известен,
+    поэтому draft оставляет обе стороны не меньше width.
+    """
+    image.draft('RGB', (width, width))
+    image = ImageOps.exif_transpose(image)
+    image.load()
+    return image
+
+
+def fits(image, width):
+    """
+    Изображение не шире width и уменьшать его не нужно.
+
+    Ширина учитывает поворот по EXIF: после exif_transpose (prepare)
+    тега поворота уже нет, и это просто image.width.
+    """
+    orientation = image.getexif().get(ExifTags.Base.Orientation)
+    rotated = orientation in (5, 6, 7, 8)
+    return (image.height if rotated else image.width) <= width
+
+
+def resize(image, width):
+    """Уменьшает изображение до ширины width, не увеличивая его."""
+    if fits(image, width):
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+
+def convert(image, pillow_format):
+    """
+    Переводит изображение в режим, который сохраняется в pillow_format.
+
+    Палитра, оттенки серого и другие режимы переводятся в RGB или RGBA,
+    чтобы сжатие с потерями не портило их. В JPEG нет прозрачности:
+    прозрачные места заливаются белым.
+    """
+    has_alpha = image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info
+    )
+    if pillow_format == 'JPEG' and has_alpha:
+        # В JPEG нет прозрачности: подкладываем белый фон
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image.convert('RGBA'),
+                         mask=image.convert('RGBA').getchannel('A'))
+        image = background
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    return image
+
+
+def _encode(image, variant_format):
+    pillow_format, _ = FORMATS[variant_format]
+    image = convert(image, pillow_format)
+    buffer = io.BytesIO()
+    image.save(buffer, pillow_format, quality=IMAGE_VARIANT_QUALITY)
+    return buffer.getvalue()
+
+
+def build_variants(name, widths, storage):
+    """Строит недостающие копии файла name. Возвращает их ширины."""
+    with storage.open(name) as file, Image.open(file) as image:
+        image = prepare(image, max(widths))
+        for width in widths:
+            resized = None
+            for variant_format in IMAGE_VARIANT_FORMATS:
+                target = variant_name(name, width, variant_format)
+                if storage.exists(target):
+                    continue
+                if resized is None:
+                    resized = resize(image, width)
+                storage.save(target, ContentFile(
+                    _encode(resized, variant_format)
+                ))
+    return list(widths)
+
+
+def generate(model, pk):
+    """Строит копии изображения объекта и отмечает их готовность."""
+    file_field, state_field, widths = KINDS[model]
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None:
+        return
+    if not needs_variants(instance):
+        return
+    name = getattr(instance, file_field).name
+    storage = model._meta.get_field(file_field).storage
+    try:
+        built = build_variants(name, widths, storage)
+    except (OSError, SyntaxError, ValueError):
+        logger.exception('Не удалось построить копии %s', name)
+        return
+    # Файл мог смениться, пока строились копии
+    if not model._default_manager.filter(
+        pk=pk, **{file_field: name}
+    ).exists():
+        return
+    setattr(instance, state_field, {'name': name, 'widths': built})
+    # Сохранение через save(): сигналы сбрасывают кеш ответов
+    update_fields = [state_field]
+    if model is Recipe:
+        update_fields.append('modified')
+    instance.save(update_fields=update_fields)
+
+
+def delete_variants(name, widths, storage):
+    """
+    Удаляет копии файла name всех ширин widths.
+
+    Копии общие для всех объектов с этим файлом (api.media), поэтому
+    удаляются все, а не только отмеченные готовыми у одного объекта.
+    """
+    for width in widths:
+        for variant_format in IMAGE_VARIANT_FORMATS:
+            storage.delete(variant_name(name, width, variant_format))
+
+
+def _executor_instance():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=IMAGE_VARIANT_WORKERS,
+                thread_name_prefix='image-variants'
+            )
+    return _executor
+
+
+def _run(model, pk):
+    try:
+        generate(model, pk)
+    finally:
+        # Соединения потоков пула не закрываются Django сами
+        connections.close_all()
+
+
+def _submit(model, pk):
+    _executor_instance().submit(_run, model, pk)
+
+
+def schedule(model, pk):
+    """Ставит построение копий в пул после коммита транзакции."""
+    transaction.on_commit(partial(_submit, model, pk))
+
+
+def needs_variants(instance):
+    """Есть изображение, для которого построены не все копии."""
+    file_field, state_field, widths = KINDS[type(instance)]
+    name = getattr(instance, file_field).name
+    return bool(name) and list(
+        ready_widths(name, getattr(instance, state_field))
+    ) != list(widths)
@@ -0,0 +1,93 @@
+"""
+Изображения рецептов и аватарки с хешем содержимого в имени.
+
+Файл сохраняется как <каталог>/<хеш>.<ext> (хеш считает
+api.utils.decode_base64_image). Одинаковое содержимое дает то же имя:
+повторная загрузка того же фото и PATCH с прежним изображением ничего
+не пишут в хранилище. Файл с таким именем никогда не меняется, поэтому
+nginx отдает его с вечным кешированием.
+
+Один файл могут использовать несколько объектов. Ссылки на файл —
+строки моделей из api.image_variants.KINDS с этим именем; они
+проверяются при освобождении файла, и файл вместе с уменьшенными
+копиями удаляется, только когда ссылок не осталось. В PostgreSQL
+сохранение и удаление файла с одним именем разделены рекомендательной
+блокировкой до конца транзакции: файл не удалится между проверкой его
+наличия при загрузке и коммитом новой ссылки.
+"""
+import hashlib
+import re
+from functools import partial
+
+from api.image_variants import KINDS, delete_variants
+from core.constants import MEDIA_HASH_LENGTH
+from django.db import connection, transaction
+
+# Имя файла с хешем содержимого и заголовок вечного кеширования для него
+CONTENT_ADDRESSED_NAME = re.compile(
+    rf'(^|/)[0-9a-f]{{{MEDIA_HASH_LENGTH}}}\.[a-z]+$'
+)
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def is_content_addressed(name):
+    """Имя файла — хеш содержимого: файл никогда не меняется."""
+    return CONTENT_ADDRESSED_NAME.search(name) is not None
+
+
+def _lock(name):
+    """Блокирует имя файла до конца транзакции (только PostgreSQL)."""
+    if connection.vendor != 'postgresql':
+        return
+    key = int.from_bytes(
+        hashlib.sha256(name.encode()).digest()[:8], 'big', signed=True
+    )
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+
+
+def store(instance, file_field, file):
+    """
+    Присваивает полю file_field объекта файл file.
+
+    Вызывается в транзакции, которая сохраняет объект. Файл, который
+    уже есть в хранилище, повторно не записывается. Возвращает прежнее
+    имя, если оно сменилось (его нужно освободить — release), иначе None.
+    """
+    field = instance._meta.get_field(file_field)
+    old_name = getattr(instance, file_field).name
+    name = field.generate_filename(instance, file.name)
+    if name == old_name:
+        return None
+    _lock(name)
+    if not field.storage.exists(name):
+        name = field.storage.save(name, file, max_length=field.max_length)
+    setattr(instance, file_field, name)
+    return old_name or None
+
+
+def is_referenced(name):
+    """Есть ли объекты, которые используют файл name."""
+    return any(
+        model._default_manager.filter(**{file_field: name}).exists()
+        for model, (file_field, _, _) in KINDS.items()
+    )
+
+
+def collect(model, name):
+    """Удаляет файл name и его копии, если на него нет ссылок."""
+    file_field, _, widths = KINDS[model]
+    storage = model._meta.get_field(file_field).storage
+    with transaction.atomic():
+        _lock(name)
+        if is_referenced(name):
+            return False
+        storage.delete(name)
+        delete_variants(name, widths, storage)
+    return True
+
+
+def release(model, name):
+    """Освобождает файл объекта model: после коммита — collect."""
+    if name:
+        transaction.on_commit(partial(collect, model, name))
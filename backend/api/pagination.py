@@ -1,16 +1,219 @@
-from core.constants import PAGINATION_NUM
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from datetime import datetime
+from functools import partial
+
+from core.constants import (APPROXIMATE_COUNT_THRESHOLD, COUNT_CACHE_TIMEOUT,
+                            PAGINATION_NUM)
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
 from rest_framework.response import Response
 
+from .cache import get_version
+
+# Версия кеша количества рецептов (сбрасывается в api.signals)
+RECIPE_COUNTS_VERSION = 'recipe_counts'
+
+
+def estimate_count(queryset):
+    """Оценка числа строк таблицы планировщиком PostgreSQL (reltuples)."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator, который не считает COUNT(*) на каждой странице.
+
+    Для выборки без фильтров на большой таблице берется оценка
+    планировщика, иначе точное количество кешируется по ключу count_key.
+    """
+
+    def __init__(self, object_list, per_page, count_key=None,
+                 cache_timeout=None, approximate_threshold=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_key = count_key
+        self.cache_timeout = cache_timeout
+        self.approximate_threshold = approximate_threshold
+
+    @cached_property
+    def _count_info(self):
+        """Пара (количество объектов, точное ли оно)."""
+        if self.approximate_threshold is not None:
+            estimate = estimate_count(self.object_list)
+            if estimate is not None and (
+                estimate >= self.approximate_threshold
+            ):
+                return estimate, False
+
+        count = cache.get(self.count_key)
+        if count is None:
+            count = super().count
+            cache.set(self.count_key, count, self.cache_timeout)
+        return count, True
+
+    @property
+    def count(self):
+        return self._count_info[0]
+
+    @property
+    def count_is_exact(self):
+        return self._count_info[1]
+
+    def validate_number(self, number):
+        if self.count_is_exact:
+            return super().validate_number(number)
+        # Оценка может быть меньше реального числа строк,
+        # поэтому верхняя граница номера страницы не проверяется
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger(self.error_messages['invalid_page'])
+        if number < 1:
+            raise EmptyPage(self.error_messages['min_page'])
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_is_exact:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self
+        )
+
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     max_page_size = PAGINATION_NUM
+    count_cache_timeout = COUNT_CACHE_TIMEOUT
+    approximate_count_threshold = APPROXIMATE_COUNT_THRESHOLD
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Передает в paginator ключ кеша количества объектов.
+
+        Количество кешируется, только если view описывает свои фильтры
+        методом get_count_signature(); иначе считается как обычно.
+        """
+        get_signature = getattr(view, 'get_count_signature', None)
+        signature = get_signature() if get_signature else None
+        if signature is None:
+            self.django_paginator_class = Paginator
+        else:
+            self.django_paginator_class = partial(
+                CachedCountPaginator,
+                count_key=self.get_count_key(queryset, signature),
+                cache_timeout=self.count_cache_timeout,
+                approximate_threshold=(
+                    None if signature else self.approximate_count_threshold
+                )
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count_key(self, queryset, signature):
+        digest = hashlib.md5(repr(signature).encode()).hexdigest()
+        return 'count:{}:{}:{}'.format(
+            queryset.model._meta.label_lower,
+            get_version(RECIPE_COUNTS_VERSION),
+            digest
+        )
 
     def get_paginated_response(self, data):
-        return Response({
+        response = Response({
             'count': self.page.paginator.count,
             'next': self.get_next_link(),
             'previous': self.get_previous_link(),
             'results': data
         })
+        response['X-Count-Exact'] = str(
+            getattr(self.page.paginator, 'count_is_exact', True)
+        ).lower()
+        return response
+
+
+class RecipeCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация рецептов по (created, id) от новых к старым.
+
+    Страница выбирается условием по индексированному полю created,
+    а не OFFSET, и без COUNT(*), поэтому стоимость страницы не зависит
+    от её номера. Включается параметром запроса pagination=cursor.
+    """
+
+    ordering = ('-created', '-id')
+    page_size_query_param = 'limit'
+    max_page_size = PAGINATION_NUM
+
+
+class TimelineCursorPagination(RecipeCursorPagination):
+    """
+    Курсорная пагинация ленты подписок по ключам (created, id рецепта).
+
+    Страницу выбирает не queryset, а функция get_keys (api.timeline):
+    курсор хранит ключ последней строки страницы, и следующая страница
+    читается по индексу ленты от него. Ключи уникальны, поэтому
+    смещение в курсоре не нужно.
+    """
+
+    def paginate_keys(self, get_keys, request):
+        """
+        Ключи страницы от новых к старым.
+
+        get_keys(limit, position, reverse) возвращает до limit ключей
+        после позиции (с reverse — до нее, в обратном порядке).
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = None
+        if self.cursor is not None and self.cursor.position is not None:
+            position = self.parse_position(self.cursor.position)
+
+        keys = get_keys(self.page_size + 1, position, reverse)
+        has_more = len(keys) > self.page_size
+        self.page = keys[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+        return self.page
+
+    def parse_position(self, position):
+        recipe_id, _, created = position.partition(':')
+        try:
+            return datetime.fromisoformat(created), int(recipe_id)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+
+    def link(self, key, reverse):
+        created, recipe_id = key
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=reverse,
+            position=f'{recipe_id}:{created.isoformat()}'
+        ))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.link(self.page[0], reverse=True)
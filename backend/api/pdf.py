@@ -0,0 +1,275 @@
+"""
+Простой PDF из строк текста без сторонних библиотек и сервисов.
+
+Текст набирается шрифтом TrueType из settings.PDF_FONT_PATH (DejaVu
+Sans): в файл встраивается его урезанная копия (api.truetype) с
+глифами латиницы и кириллицы. Строки кодируются однобайтовой
+кодировкой: коды cp1251, а кириллическим кодам сопоставлены имена
+глифов (afii...) через /Differences поверх WinAnsiEncoding. Таблица
+/ToUnicode позволяет скопировать и найти текст в документе. Если файла
+шрифта нет, используется стандартная Helvetica, которую не нужно
+встраивать (программы просмотра подставляют ее сами, кириллица
+при этом видна не везде).
+
+Документ отдается кусками по странице, объекты страниц не копятся
+в памяти.
+"""
+import logging
+import os
+import re
+import struct
+import textwrap
+import zlib
+from functools import lru_cache
+
+from api.truetype import Font
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 в пунктах
+MARGIN = 56
+FONT_SIZE = 11
+LEADING = 15
+# DejaVu Sans 11pt: примерно столько символов умещается в ширину страницы
+LINE_LENGTH = 72
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+
+# Номера объектов, которые пишутся в конце, но нужны ссылкам раньше
+CATALOG, PAGES, FONT = 1, 2, 3
+
+HEADER = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+
+UPPERCASE = 'АБВГДЕЁЖЗИЙКЛМНОПРСТУФХЦЧШЩЪЫЬЭЮЯ'
+LOWERCASE = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+# Коды, которые есть в шрифте PDF, и код символов вне кодировки
+FIRST_CODE, LAST_CODE = 32, 255
+REPLACEMENT = ord('?')
+# Записей в одном блоке bfchar таблицы /ToUnicode (не больше 100)
+TO_UNICODE_BLOCK = 100
+
+
+def _characters():
+    """
+    Символы однобайтовой кодировки текста {код: символ}.
+
+    Кроме ASCII и кириллицы, в нее входят символы cp1251, у которых
+    тот же код в WinAnsiEncoding (cp1252): тире, кавычки-елочки и др.
+    """
+    characters = {code: chr(code) for code in range(FIRST_CODE, 127)}
+    for code in range(128, LAST_CODE + 1):
+        character = bytes([code]).decode('cp1251', 'ignore')
+        if character and (
+            character in UPPERCASE + LOWERCASE
+            or character == bytes([code]).decode('cp1252', 'ignore')
+        ):
+            characters[code] = character
+    return characters
+
+
+CHARACTERS = _characters()
+CODES = {character: code for code, character in CHARACTERS.items()}
+
+
+def _differences():
+    """Коды cp1251 кириллических букв и имена их глифов."""
+    glyphs = [
+        (letter.encode('cp1251')[0], f'/afii{first + index}')
+        for letters, first in ((UPPERCASE, 10017), (LOWERCASE, 10065))
+        for index, letter in enumerate(letters)
+    ]
+    return ' '.join(f'{code} {name}' for code, name in sorted(glyphs))
+
+
+ENCODING = (
+    '/Encoding << /Type /Encoding /BaseEncoding /WinAnsiEncoding '
+    f'/Differences [{_differences()}] >>'
+)
+
+
+def _to_unicode():
+    """CMap /ToUnicode: коды кодировки и символы Unicode."""
+    entries = [f'<{code:02X}> <{ord(character):04X}>'
+               for code, character in sorted(CHARACTERS.items())]
+    blocks = ''.join(
+        '{} beginbfchar\n{}\nendbfchar\n'.format(
+            len(block), '\n'.join(block)
+        )
+        for block in (entries[index:index + TO_UNICODE_BLOCK]
+                      for index in range(0, len(entries), TO_UNICODE_BLOCK))
+    )
+    return (
+        '/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n'
+        '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) '
+        '/Supplement 0 >> def\n'
+        '/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n'
+        '1 begincodespacerange\n<00> <FF>\nendcodespacerange\n'
+        f'{blocks}endcmap\n'
+        'CMapName currentdict /CMap defineresource pop\nend\nend'
+    ).encode('ascii')
+
+
+TO_UNICODE = _to_unicode()
+
+
+@lru_cache(maxsize=None)
+def _embedded_font(path):
+    """
+    Встраиваемый шрифт из файла path или None, если его нет.
+
+    Возвращает (имя шрифта, сжатый урезанный файл, размер файла
+    до сжатия, ширины кодов FIRST_CODE..LAST_CODE, описание шрифта).
+    Файл читается один раз на процесс.
+    """
+    try:
+        with open(path, 'rb') as file:
+            font = Font(file.read())
+    except (OSError, ValueError, struct.error):
+        logger.warning('Шрифт %s не прочитан, в PDF будет Helvetica', path,
+                       exc_info=True)
+        return None
+    glyphs = [
+        font.glyph(CHARACTERS[code]) if code in CHARACTERS else 0
+        for code in range(FIRST_CODE, LAST_CODE + 1)
+    ]
+    data = font.subset(glyphs)
+    # Шесть заглавных букв и + в имени: урезанная копия шрифта
+    name = 'FOODGR+' + re.sub(
+        r'[^A-Za-z0-9-]', '', os.path.splitext(os.path.basename(path))[0]
+    )
+
+    def scale(value):
+        return round(value * 1000 / font.units_per_em)
+
+    descriptor = (
+        f'/Type /FontDescriptor /FontName /{name} /Flags 32 '
+        '/FontBBox [{}] /ItalicAngle 0 /Ascent {} /Descent {} '
+        '/CapHeight {} /StemV 80'.format(
+            ' '.join(str(scale(value)) for value in font.bbox),
+            scale(font.ascent), scale(font.descent), scale(font.ascent)
+        )
+    )
+    widths = ' '.join(str(font.width(glyph)) for glyph in glyphs)
+    return name, zlib.compress(data, 9), len(data), widths, descriptor
+
+
+def _font(writer):
+    """Объект шрифта FONT и объекты, на которые он ссылается."""
+    to_unicode = writer.reserve()
+    chunks = [writer.stream(to_unicode, TO_UNICODE)]
+    embedded = _embedded_font(settings.PDF_FONT_PATH)
+    if embedded is None:
+        return b''.join(chunks) + writer.object(FONT, (
+            '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+            f'{ENCODING} /ToUnicode {to_unicode} 0 R >>'
+        ).encode('ascii'))
+    name, data, length, widths, descriptor = embedded
+    font_file, font_descriptor = writer.reserve(), writer.reserve()
+    chunks.append(writer.stream(
+        font_file, data, b'/Length1 %d /Filter /FlateDecode' % length
+    ))
+    chunks.append(writer.object(font_descriptor, (
+        f'<< {descriptor} /FontFile2 {font_file} 0 R >>'
+    ).encode('ascii')))
+    chunks.append(writer.object(FONT, (
+        f'<< /Type /Font /Subtype /TrueType /BaseFont /{name} '
+        f'/FirstChar {FIRST_CODE} /LastChar {LAST_CODE} '
+        f'/Widths [{widths}] {ENCODING} '
+        f'/FontDescriptor {font_descriptor} 0 R '
+        f'/ToUnicode {to_unicode} 0 R >>'
+    ).encode('ascii')))
+    return b''.join(chunks)
+
+
+def encode(line):
+    """Байты строки в кодировке шрифта, чужие символы — '?'."""
+    return bytes(CODES.get(character, REPLACEMENT) for character in line)
+
+
+def wrap(lines):
+    """Переносит длинные строки, пустые строки сохраняются."""
+    for line in lines:
+        yield from textwrap.wrap(line, LINE_LENGTH) or ['']
+
+
+def _page_content(lines):
+    text = ''.join(
+        '<{}> Tj T*\n'.format(encode(line).hex())
+        for line in lines
+    )
+    return (
+        f'BT /F1 {FONT_SIZE} Tf {LEADING} TL '
+        f'{MARGIN} {PAGE_HEIGHT - MARGIN} Td\n{text}ET'
+    ).encode('ascii')
+
+
+class _Writer:
+    """Нумерует объекты и запоминает их смещения для таблицы xref."""
+
+    def __init__(self):
+        self.size = 0
+        self.offsets = {}
+        self.last = FONT
+
+    def reserve(self):
+        self.last += 1
+        return self.last
+
+    def raw(self, data):
+        self.size += len(data)
+        return data
+
+    def object(self, number, body):
+        self.offsets[number] = self.size
+        return self.raw(b'%d 0 obj\n%s\nendobj\n' % (number, body))
+
+    def stream(self, number, data, entries=b''):
+        return self.object(number, (
+            b'<< /Length %d %s>>\nstream\n%s\nendstream'
+            % (len(data), entries and entries + b' ', data)
+        ))
+
+    def xref(self):
+        start = self.size
+        entries = b''.join(
+            b'%010d 00000 n \n' % self.offsets[number]
+            for number in range(1, self.last + 1)
+        )
+        return (
+            b'xref\n0 %d\n0000000000 65535 f \n%s'
+            b'trailer\n<< /Size %d /Root %d 0 R >>\n'
+            b'startxref\n%d\n%%%%EOF\n'
+            % (self.last + 1, entries, self.last + 1, CATALOG, start)
+        )
+
+
+def document(lines):
+    """Генерирует PDF со строками lines кусками байтов по странице."""
+    writer = _Writer()
+    yield writer.raw(HEADER) + _font(writer)
+
+    pages = []
+    lines = wrap(lines)
+    while True:
+        page_lines = [line for _, line in zip(range(LINES_PER_PAGE), lines)]
+        if not page_lines and pages:
+            break
+        content, page = writer.reserve(), writer.reserve()
+        pages.append(page)
+        yield writer.stream(content, _page_content(page_lines)) + (
+            writer.object(page, (
+                f'<< /Type /Page /Parent {PAGES} 0 R '
+                f'/MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+                f'/Resources << /Font << /F1 {FONT} 0 R >> >> '
+                f'/Contents {content} 0 R >>'
+            ).encode('ascii'))
+        )
+        if len(page_lines) < LINES_PER_PAGE:
+            break
+
+    kids = ' '.join(f'{page} 0 R' for page in pages)
+    yield writer.object(PAGES, (
+        f'<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>'
+    ).encode('ascii')) + writer.object(
+        CATALOG, f'<< /Type /Catalog /Pages {PAGES} 0 R >>'.encode('ascii')
+    ) + writer.xref()
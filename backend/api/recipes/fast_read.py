@@ -0,0 +1,86 @@
+"""
+Быстрое чтение рецептов без полей DRF.
+
+Собирает тот же JSON, что и RecipeListSerializer, из проекций .values()
+и обычных словарей. Эталоном остаётся RecipeListSerializer: при изменении
+его полей нужно менять и этот модуль (совпадение проверяется тестами).
+"""
+from api.image_variants import avatar_url, file_url, recipe_image_urls
+from api.users.loaders import SubscriptionLoader
+from recipes.models import IngredientInRecipe, Recipe
+
+# Поля рецепта, которые выбираются одним запросом вместе с автором
+RECIPE_VALUES = (
+    'id', 'name', 'image', 'image_variants', 'text', 'cooking_time',
+    'created', 'is_favorited', 'is_in_shopping_cart',
+    'author__id', 'author__email', 'author__username',
+    'author__first_name', 'author__last_name', 'author__avatar',
+    'author__avatar_variants',
+)
+
+
+def recipe_values(queryset):
+    """Проекция queryset рецептов для быстрого чтения."""
+    return queryset.prefetch_related(None).values(*RECIPE_VALUES)
+
+
+def serialize_recipes(rows, request):
+    """Собирает представления рецептов из строк recipe_values()."""
+    rows = list(rows)
+    recipe_ids = [row['id'] for row in rows]
+
+    tags = {recipe_id: [] for recipe_id in recipe_ids}
+    tag_rows = Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('tag__name').values_list(
+        'recipe_id', 'tag__id', 'tag__name', 'tag__slug'
+    )
+    for recipe_id, tag_id, name, slug in tag_rows:
+        tags[recipe_id].append({'id': tag_id, 'name': name, 'slug': slug})
+
+    ingredients = {recipe_id: [] for recipe_id in recipe_ids}
+    ingredient_rows = IngredientInRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('pk').values_list(
+        'recipe_id', 'ingredient__id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount'
+    )
+    for recipe_id, ingredient_id, name, unit, amount in ingredient_rows:
+        ingredients[recipe_id].append({
+            'id': ingredient_id,
+            'name': name,
+            'measurement_unit': unit,
+            'amount': amount,
+        })
+
+    loader = SubscriptionLoader.for_request(request)
+    loader.add(row['author__id'] for row in rows)
+    image_storage = Recipe._meta.get_field('image').storage
+
+    return [
+        {
+            'id': row['id'],
+            'tags': tags[row['id']],
+            'author': {
+                'email': row['author__email'],
+                'id': row['author__id'],
+                'username': row['author__username'],
+                'first_name': row['author__first_name'],
+                'last_name': row['author__last_name'],
+                'is_subscribed': loader.is_subscribed(row['author__id']),
+                'avatar': avatar_url(row['author__avatar'],
+                                     row['author__avatar_variants'], request),
+            },
+            'ingredients': ingredients[row['id']],
+            'is_favorited': row['is_favorited'],
+            'is_in_shopping_cart': row['is_in_shopping_cart'],
+            'name': row['name'],
+            'image': file_url(image_storage, row['image'], request),
+            'image_variants': recipe_image_urls(
+                row['image'], row['image_variants'], request
+            ),
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+        }
+        for row in rows
+    ]
@@ -0,0 +1,106 @@
+"""
+Индекс ингредиентов в памяти процесса для автодополнения по названию.
+
+Справочник небольшой (тысячи строк) и меняется редко, а поиск
+по префиксу вызывается на каждое нажатие клавиши. Поэтому каждый процесс
+один раз загружает весь справочник и отвечает на запрос двумя бинарными
+поисками по списку названий в верхнем регистре, без обращения к БД.
+Ответ собирается из заранее закодированных JSON-фрагментов ингредиентов.
+
+Совпадения отдаются в порядке БД (order_by('name'), то есть по правилам
+сортировки БД), как раньше отдавал queryset. Регистр сравнивается
+так же, как в name__istartswith: по UPPER(name).
+
+Индекс помечен версией справочника из общего кеша (api.cache). Сигналы
+изменения ингредиентов меняют версию, и каждый процесс перестраивает
+индекс при следующем запросе.
+
+Ранжированный поиск (?search=) берет из индекса совпадения по началу
+названия и только при их нехватке обращается к БД за совпадениями
+по подстроке и похожими названиями.
+"""
+from bisect import bisect_left
+from threading import Lock
+
+from api.cache import INGREDIENTS_VERSION, get_version
+from api.filters import IngredientFilter
+from api.recipes.serializers import IngredientSerializer
+from recipes.models import Ingredient
+from rest_framework.renderers import JSONRenderer
+
+# Символ больше любого другого: верхняя граница диапазона префикса
+MAX_CHAR = chr(0x10FFFF)
+
+_index = None
+_lock = Lock()
+
+
+class IngredientIndex:
+    """Названия в верхнем регистре для поиска и JSON ингредиентов."""
+
+    def __init__(self, version):
+        self.version = version
+        renderer = JSONRenderer()
+        # Поля сериализатора без его накладных расходов на каждую строку
+        rows = Ingredient.objects.order_by('name').values(
+            *IngredientSerializer.Meta.fields
+        )
+        # Фрагменты — в порядке БД, ключи поиска ссылаются на позиции
+        self.fragments = [renderer.render(item) for item in rows]
+        keys = sorted(
+            (item['name'].upper(), position)
+            for position, item in enumerate(rows)
+        )
+        self.keys = [key for key, _ in keys]
+        self.positions = [position for _, position in keys]
+
+    def find(self, prefix):
+        """Позиции в порядке БД названий, начинающихся с prefix."""
+        prefix = prefix.upper()
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + MAX_CHAR, start)
+        if start == 0 and end == len(self.keys):
+            return range(end)
+        return sorted(self.positions[start:end])
+
+    def search(self, prefix=''):
+        """JSON-массив ингредиентов, название которых начинается с prefix."""
+        return b'[' + b','.join(
+            self.fragments[position] for position in self.find(prefix)
+        ) + b']'
+
+    def ranked_search(self, query, limit):
+        """
+        JSON-массив из не более чем limit лучших совпадений с query.
+
+        Совпадения по началу названия берутся из индекса; БД
+        запрашивается, только если их меньше limit
+        (IngredientFilter.other_matches).
+        """
+        fragments = [self.fragments[position]
+                     for position in self.find(query)[:limit]]
+        if query and len(fragments) < limit:
+            renderer = JSONRenderer()
+            fragments += [
+                renderer.render(item) for item in IngredientSerializer(
+                    IngredientFilter.other_matches(
+                        Ingredient.objects.all(), query,
+                        limit - len(fragments)
+                    ),
+                    many=True
+                ).data
+            ]
+        return b'[' + b','.join(fragments) + b']'
+
+
+def get_index():
+    """Индекс текущей версии справочника, при необходимости перестроенный."""
+    global _index
+    version = get_version(INGREDIENTS_VERSION)
+    index = _index
+    if index is None or index.version != version:
+        with _lock:
+            if _index is None or _index.version != version:
+                _index = IngredientIndex(version)
+            index = _index
+    return index
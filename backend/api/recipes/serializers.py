@@ -1,5 +1,11 @@
+from api import media
+from api.image_variants import recipe_image_urls
+from api.serializers import PrefetchListSerializer
+from api.users.loaders import SubscriptionLoader
 from api.users.serializers import UserSerializer
-from api.utils import save_base64_image
+from api.utils import decode_base64_image
+from core.constants import BULK_RECIPES_MAX
+from django.db import transaction
 from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
                             ShoppingCart, Tag)
 from rest_framework import serializers
@@ -37,16 +43,68 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeMinifiedSerializer(serializers.ModelSerializer):
+class ImageVariantsMixin(serializers.Serializer):
+    """Ссылки на уменьшенные копии изображения (api.image_variants)."""
+
+    image_variants = serializers.SerializerMethodField()
+
+    def get_image_variants(self, obj):
+        return recipe_image_urls(obj.image.name, obj.image_variants,
+                                 self.context.get('request'))
+
+
+class RecipeMinifiedSerializer(ImageVariantsMixin,
+                               serializers.ModelSerializer):
     """Упрощенный сериализатор для рецептов (для избранного и корзины)."""
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетного избранного и списка покупок."""
+
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_RECIPES_MAX
+    )
+
+    def validate_recipes(self, value):
+        # Повторы убираются с сохранением порядка
+        return list(dict.fromkeys(value))
 
 
-class RecipeListSerializer(serializers.ModelSerializer):
-    """Сериализатор для списка рецептов."""
+class RecipeListManySerializer(PrefetchListSerializer):
+    """Список рецептов: заранее сообщает загрузчику подписок авторов."""
+
+    def prefetch(self, objects, request):
+        SubscriptionLoader.for_request(request).add(
+            recipe.author_id for recipe in objects
+        )
+
+
+class RecipeListSerializer(ImageVariantsMixin, serializers.ModelSerializer):
+    """
+    Сериализатор для списка рецептов.
+
+    Поддерживает выборочные поля: если в контексте передан набор fields,
+    остаются только эти поля, а связанные объекты (автор, теги,
+    ингредиенты) отдаются списком id, если их нет в наборе expand.
+    """
+
+    # Поля, которые без expand заменяются на id связанных объектов
+    collapsed_fields = {
+        'author': lambda: serializers.PrimaryKeyRelatedField(read_only=True),
+        'tags': lambda: serializers.PrimaryKeyRelatedField(
+            many=True, read_only=True
+        ),
+        'ingredients': lambda: serializers.SlugRelatedField(
+            source='ingredient_list', slug_field='ingredient_id',
+            many=True, read_only=True
+        ),
+    }
 
     author = UserSerializer()
     tags = TagSerializer(many=True, read_only=True)
@@ -63,16 +121,34 @@ class RecipeListSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time'
+            'name', 'image', 'image_variants', 'text', 'cooking_time'
         )
+        list_serializer_class = RecipeListManySerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        if fields is None:
+            return
+        expand = self.context.get('expand', ())
+        for name in set(self.fields) - set(fields):
+            self.fields.pop(name)
+        for name, make_field in self.collapsed_fields.items():
+            if name in self.fields and name not in expand:
+                self.fields[name] = make_field()
 
     def get_is_favorited(self, obj):
+        # Флаг аннотируется в queryset (Recipe.objects.with_user_flags)
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if user.is_authenticated:
             return Favorite.objects.filter(user=user, recipe=obj).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
         if user.is_authenticated:
             return ShoppingCart.objects.filter(user=user, recipe=obj).exists()
@@ -183,17 +259,17 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         return value
 
     def validate_image(self, value):
-        # Базовая валидация base64 изображения
-        if not value.startswith('data:image/'):
-            raise serializers.ValidationError(
-                'Неверный формат изображения. Ожидается base64 строка'
-            )
-        return value
+        # Изображение декодируется во временный файл (api.utils)
+        try:
+            return decode_base64_image(value)
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         tags_data = validated_data.pop('tags')
-        image_data = validated_data.pop('image')
+        image = validated_data.pop('image')
 
         # Создаем рецепт БЕЗ передачи author здесь
         recipe = Recipe.objects.create(**validated_data)
@@ -209,29 +285,35 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
                 amount=ingredient_data['amount']
             )
 
-        # Сохраняем изображение
-        recipe.image = save_base64_image(image_data)
+        # Сохраняем изображение (имя — хеш содержимого, api.media)
+        media.store(recipe, 'image', image)
         recipe.save()
+        # Временный файл уже перенесен в хранилище
+        image.close()
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop('ingredients', None)
         tags_data = validated_data.pop('tags', None)
-        image_data = validated_data.pop('image', None)
+        image = validated_data.pop('image', None)
 
         # Обновляем основные поля
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
 
-        # Обновляем изображение если предоставлено
-        if image_data is not None:
-            # Удаляем старое изображение если оно есть
-            if instance.image:
-                instance.image.delete(save=False)
-            instance.image = save_base64_image(image_data)
+        # Обновляем изображение если предоставлено: то же содержимое
+        # дает то же имя, и файл не перезаписывается
+        old_image = None
+        if image is not None:
+            old_image = media.store(instance, 'image', image)
 
         instance.save()
+        if image is not None:
+            image.close()
+        # Старый файл удаляется, если его не использует другой рецепт
+        media.release(Recipe, old_image)
 
         # Обновляем теги если они предоставлены
         if tags_data is not None:
@@ -253,4 +335,10 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         return instance
 
     def to_representation(self, instance):
+        # Перечитываем рецепт с флагами пользователя и связанными данными
+        instance = Recipe.objects.with_user_flags(
+            self.context['request'].user
+        ).select_related('author').prefetch_related(
+            'tags', 'ingredient_list__ingredient'
+        ).get(pk=instance.pk)
         return RecipeListSerializer(instance, context=self.context).data
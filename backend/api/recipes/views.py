@@ -1,17 +1,34 @@
+from functools import partial
+
+from api import catalogue, shopping_list, timeline
+from api.cache import (RECIPE_LIST_VERSION, bump_version, cached_response,
+                       get_version, invalidate_carts, recipe_detail_key,
+                       recipe_list_key)
+from api.conditional import (ConditionalCatalogueMixin, conditional_response,
+                             make_etag, viewer_state)
+from api.recipes import fast_read, ingredient_index
 from api.recipes.serializers import (IngredientSerializer,
                                      RecipeCreateUpdateSerializer,
-                                     RecipeListSerializer,
+                                     RecipeIdsSerializer, RecipeListSerializer,
                                      RecipeMinifiedSerializer, TagSerializer)
-from api.utils import shopping_list
-from django.http import HttpResponse
+from api.toggles import add_link, add_links, remove_link, remove_links
+from core.constants import INGREDIENT_SEARCH_LIMIT, INGREDIENT_SEARCH_MAX_LIMIT
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import redirect
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
-from rest_framework import status, viewsets
+from django.utils.cache import patch_vary_headers
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from rest_framework import generics, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
 from ..filters import RecipeFilter
+from ..pagination import (RECIPE_COUNTS_VERSION, RecipeCursorPagination,
+                          TimelineCursorPagination)
 from ..permissions import RecipePermission
 
 
@@ -23,7 +40,7 @@ def recipe_short_link_redirect(request, short_link):
     return redirect('/')
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ConditionalCatalogueMixin, viewsets.ReadOnlyModelViewSet):
     """
     ViewSet для работы с тегами.
     Только чтение, так как теги создаются через админку.
@@ -33,8 +50,13 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [AllowAny]  # Доступно всем
     pagination_class = None  # Отключаем пагинацию для тегов
 
+    def list(self, request, *args, **kwargs):
+        """Список тегов из снимка справочника (api.catalogue)."""
+        return catalogue.snapshot_response(request, 'tags')
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+
+class IngredientViewSet(ConditionalCatalogueMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """ViewSet для работы с ингредиентами."""
 
     queryset = Ingredient.objects.all()
@@ -42,12 +64,43 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [AllowAny]
     pagination_class = None
 
-    def get_queryset(self):
-        queryset = super().get_queryset()
-        name = self.request.query_params.get('name')
-        if name:
-            queryset = queryset.filter(name__istartswith=name)
-        return queryset
+    def list(self, request, *args, **kwargs):
+        """
+        Поиск ингредиентов через индекс в памяти процесса.
+
+        ?name= — все ингредиенты, название которых начинается с name.
+        ?search= — ранжированный поиск (по началу названия, подстроке
+        и с опечатками), не больше ?limit= результатов. ETag строится
+        по версии справочника, поэтому ответ 304 не обращается к БД.
+        Полный справочник отдается из снимка (api.catalogue).
+        """
+        params = request.query_params
+        if not params.get('name') and 'search' not in params:
+            return catalogue.snapshot_response(request, 'ingredients')
+        index = ingredient_index.get_index()
+        if 'search' in params:
+            content = partial(index.ranked_search, params['search'],
+                              self.get_search_limit())
+        else:
+            content = partial(index.search, params.get('name', ''))
+        return conditional_response(
+            request,
+            lambda: HttpResponse(content(), content_type='application/json'),
+            make_etag(request, index.version)
+        )
+
+    def get_search_limit(self):
+        limit = self.request.query_params.get('limit')
+        if limit is None:
+            return INGREDIENT_SEARCH_LIMIT
+        if not limit.isdigit() or not (
+            1 <= int(limit) <= INGREDIENT_SEARCH_MAX_LIMIT
+        ):
+            raise ValidationError({
+                'limit': f'Ожидается число от 1 '
+                         f'до {INGREDIENT_SEARCH_MAX_LIMIT}.'
+            })
+        return int(limit)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
@@ -56,6 +109,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = [RecipePermission]
 
+    @property
+    def paginator(self):
+        # Курсорная пагинация включается явно: ?pagination=cursor,
+        # лента подписок пагинируется курсором по строкам ленты
+        if not hasattr(self, '_paginator'):
+            if self.action == 'feed':
+                self._paginator = TimelineCursorPagination()
+            elif self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = RecipeCursorPagination()
+        return super().paginator
+
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
             return RecipeCreateUpdateSerializer
@@ -66,91 +130,341 @@ class RecipeViewSet(viewsets.ModelViewSet):
         # Применяем фильтры
         queryset = RecipeFilter.filter_recipes(queryset, self.request)
 
-        return queryset.select_related('author').prefetch_related(
+        fields, expand = self.get_fieldset()
+        if fields is not None:
+            return self.trim_queryset(queryset, fields, expand)
+
+        return queryset.with_user_flags(
+            self.request.user
+        ).select_related('author').prefetch_related(
             'tags', 'ingredient_list__ingredient'
         )
 
+    def get_fieldset(self):
+        """
+        Выборочные поля из параметров ?fields= и ?expand=.
+
+        Возвращает (None, ()) для полного ответа. Учитываются только
+        при чтении рецептов (list и retrieve).
+        """
+        if self.action not in ('list', 'retrieve'):
+            return None, ()
+        params = self.request.query_params
+        if 'fields' not in params:
+            return None, ()
+
+        fields = {name for name in params['fields'].split(',') if name}
+        expand = {name for name in params.get('expand', '').split(',')
+                  if name}
+        unknown_fields = fields - set(RecipeListSerializer.Meta.fields)
+        if unknown_fields:
+            raise ValidationError({
+                'fields': f'Неизвестные поля: '
+                          f'{", ".join(sorted(unknown_fields))}'
+            })
+        unknown_expand = expand - set(RecipeListSerializer.collapsed_fields)
+        if unknown_expand:
+            raise ValidationError({
+                'expand': f'Эти поля нельзя раскрыть: '
+                          f'{", ".join(sorted(unknown_expand))}'
+            })
+        return fields, expand
+
+    def trim_queryset(self, queryset, fields, expand):
+        """
+        Загружает только то, что нужно выбранным полям.
+
+        Колонки ограничиваются .only(), аннотации флагов и prefetch
+        связанных объектов добавляются, только если поля запрошены.
+        """
+        # id автора нужен всегда: по нему заранее грузятся подписки
+        columns = {'id', 'author'} | (
+            fields & {'name', 'image', 'image_variants', 'text',
+                      'cooking_time'}
+        )
+        if 'image_variants' in fields:
+            columns.add('image')
+        if {'is_favorited', 'is_in_shopping_cart'} & fields:
+            queryset = queryset.with_user_flags(self.request.user)
+        if 'author' in fields and 'author' in expand:
+            queryset = queryset.select_related('author')
+            columns |= {
+                f'author__{name}' for name in (
+                    'id', 'email', 'username', 'first_name', 'last_name',
+                    'avatar', 'avatar_variants'
+                )
+            }
+        if 'tags' in fields:
+            queryset = queryset.prefetch_related(Prefetch(
+                'tags', queryset=Tag.objects.all() if 'tags' in expand
+                else Tag.objects.only('id')
+            ))
+        if 'ingredients' in fields:
+            queryset = queryset.prefetch_related(
+                'ingredient_list__ingredient' if 'ingredients' in expand
+                else Prefetch('ingredient_list',
+                              queryset=IngredientInRecipe.objects.only(
+                                  'recipe', 'ingredient'
+                              ))
+            )
+        return queryset.only(*columns)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        fields, expand = self.get_fieldset()
+        if fields is not None:
+            context.update(fields=fields, expand=expand)
+        return context
+
+    def get_count_signature(self):
+        """Ключ кеша количества рецептов для пагинации."""
+        return RecipeFilter.get_signature(self.request)
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(
+            request,
+            partial(cached_response, request,
+                    partial(recipe_list_key, request),
+                    partial(self.build_list, request, *args, **kwargs)),
+            self.get_list_etag(request)
+        )
+
+    def get_list_etag(self, request):
+        """
+        ETag списка по версии кеша списков и состоянию пользователя.
+
+        Версия RECIPE_LIST_VERSION меняется при любом изменении,
+        удалении или добавлении рецепта (api.cache.invalidate_recipes),
+        поэтому для ETag не нужно выбирать страницу. Удаление рецепта
+        не отражается в датах изменения, поэтому Last-Modified для
+        списка не отдается.
+        """
+        return make_etag(request, get_version(RECIPE_LIST_VERSION),
+                         viewer_state(request.user))
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        build_response = partial(
+            cached_response, request,
+            partial(recipe_detail_key, request, pk),
+            partial(self.build_retrieve, request, *args, **kwargs)
+        )
+        modified = Recipe.objects.filter(pk=pk).values_list(
+            'modified', flat=True
+        ).first() if str(pk).isdigit() else None
+        if modified is None:
+            # Ответ 404 строится обычным путем
+            return build_response()
+        # Флаги пользователя не имеют дат изменения, поэтому
+        # Last-Modified отдается только анонимным пользователям
+        return conditional_response(
+            request, build_response,
+            make_etag(request, modified, viewer_state(request.user)),
+            None if request.user.is_authenticated else modified
+        )
+
+    def build_list(self, request, *args, **kwargs):
+        # Выборочные поля собирает сериализатор, не быстрый путь
+        if (not settings.RECIPES_FAST_READ
+           or self.get_fieldset()[0] is not None):
+            return super().list(request, *args, **kwargs)
+
+        queryset = fast_read.recipe_values(
+            self.filter_queryset(self.get_queryset())
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(
+                fast_read.serialize_recipes(page, request)
+            )
+        return Response(fast_read.serialize_recipes(queryset, request))
+
+    def build_retrieve(self, request, *args, **kwargs):
+        if (not settings.RECIPES_FAST_READ
+           or self.get_fieldset()[0] is not None):
+            return super().retrieve(request, *args, **kwargs)
+
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = generics.get_object_or_404(
+            fast_read.recipe_values(self.get_queryset()),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+        return Response(fast_read.serialize_recipes([row], request)[0])
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def add_recipe_link(self, model, pk, error):
+        """
+        Добавляет рецепт в избранное или список покупок.
+
+        Проверка существования рецепта, повтора и вставка выполняются
+        одним запросом (api.toggles).
+        """
+        recipe, created = add_link(
+            model, 'user', self.request.user, 'recipe', self.get_pk(pk),
+            RecipeMinifiedSerializer.Meta.fields
+        )
+        if recipe is None:
+            raise Http404
+        if not created:
+            return Response({'errors': error},
+                            status=status.HTTP_400_BAD_REQUEST)
+        serializer = RecipeMinifiedSerializer(Recipe(**recipe))
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def remove_recipe_link(self, model, pk, error):
+        """Удаляет рецепт из избранного или списка покупок."""
+        pk = self.get_pk(pk)
+        if remove_link(model, 'user', self.request.user, 'recipe', pk):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        # Рецепта могло не быть вовсе: это выясняется только при ошибке
+        if not Recipe.objects.filter(pk=pk).exists():
+            raise Http404
+        return Response({'errors': error},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    def bulk_recipe_links(self, request, model):
+        """
+        Пакетно добавляет или удаляет рецепты из {"recipes": [id, ...]}.
+
+        Существование рецептов и вставка (удаление) проверяются одним
+        запросом на весь список (api.toggles). Ответ — статус каждого id:
+        added или exists при добавлении, removed или missing при
+        удалении, not_found для несуществующих рецептов.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        if request.method == 'POST':
+            result = add_links(model, 'user', request.user, 'recipe',
+                               recipe_ids)
+            done, skipped = 'added', 'exists'
+        else:
+            result = remove_links(model, 'user', request.user, 'recipe',
+                                  recipe_ids)
+            done, skipped = 'removed', 'missing'
+        # Пакетные изменения идут без сигналов post_save и post_delete
+        if any(result.values()):
+            bump_version(RECIPE_COUNTS_VERSION)
+            if model is ShoppingCart:
+                invalidate_carts([request.user.pk])
+        return Response({
+            recipe_id: 'not_found' if recipe_id not in result
+            else done if result[recipe_id] else skipped
+            for recipe_id in recipe_ids
+        })
+
+    @staticmethod
+    def get_pk(pk):
+        if not str(pk).isdigit():
+            raise Http404
+        return int(pk)
+
     @action(detail=True,
             methods=['post'],
             permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
         """Добавить рецепт в избранное."""
-        recipe = self.get_object()
-        user = request.user
-
-        if Favorite.objects.filter(user=user, recipe=recipe).exists():
-            return Response(
-                {'errors': 'Рецепт уже в избранном'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        Favorite.objects.create(user=user, recipe=recipe)
-        serializer = RecipeMinifiedSerializer(recipe)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.add_recipe_link(Favorite, pk, 'Рецепт уже в избранном')
 
     @favorite.mapping.delete
     def delete_favorite(self, request, pk=None):
         """Удалить рецепт из избранного."""
-        recipe = self.get_object()
-        user = request.user
-
-        favorite = Favorite.objects.filter(user=user, recipe=recipe).first()
-        if not favorite:
-            return Response(
-                {'errors': 'Рецепта нет в избранном'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        favorite.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.remove_recipe_link(Favorite, pk,
+                                       'Рецепта нет в избранном')
 
     @action(detail=True,
             methods=['post'],
             permission_classes=[IsAuthenticated])
     def shopping_cart(self, request, pk=None):
         """Добавить рецепт в список покупок."""
-        recipe = self.get_object()
-        user = request.user
-
-        if ShoppingCart.objects.filter(user=user, recipe=recipe).exists():
-            return Response(
-                {'errors': 'Рецепт уже в списке покупок'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        ShoppingCart.objects.create(user=user, recipe=recipe)
-        serializer = RecipeMinifiedSerializer(recipe)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.add_recipe_link(ShoppingCart, pk,
+                                    'Рецепт уже в списке покупок')
 
     @shopping_cart.mapping.delete
     def delete_shopping_cart(self, request, pk=None):
         """Удалить рецепт из списка покупок."""
-        recipe = self.get_object()
-        user = request.user
+        return self.remove_recipe_link(ShoppingCart, pk,
+                                       'Рецепта нет в списке покупок')
 
-        cart_item = ShoppingCart.objects.filter(user=user,
-                                                recipe=recipe).first()
-        if not cart_item:
-            return Response(
-                {'errors': 'Рецепта нет в списке покупок'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+    @action(detail=False,
+            methods=['post'],
+            permission_classes=[IsAuthenticated],
+            url_path='favorite/bulk',
+            url_name='favorite-bulk')
+    def favorite_bulk(self, request):
+        """Добавить несколько рецептов в избранное."""
+        return self.bulk_recipe_links(request, Favorite)
+
+    @favorite_bulk.mapping.delete
+    def delete_favorite_bulk(self, request):
+        """Удалить несколько рецептов из избранного."""
+        return self.bulk_recipe_links(request, Favorite)
 
-        cart_item.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+    @action(detail=False,
+            methods=['post'],
+            permission_classes=[IsAuthenticated],
+            url_path='shopping_cart/bulk',
+            url_name='shopping-cart-bulk')
+    def shopping_cart_bulk(self, request):
+        """Добавить несколько рецептов в список покупок."""
+        return self.bulk_recipe_links(request, ShoppingCart)
+
+    @shopping_cart_bulk.mapping.delete
+    def delete_shopping_cart_bulk(self, request):
+        """Удалить несколько рецептов из списка покупок."""
+        return self.bulk_recipe_links(request, ShoppingCart)
 
     @action(detail=False,
             methods=['get'],
             permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """
+        Лента рецептов авторов, на которых подписан пользователь.
+
+        Страница выбирается по строкам ленты (api.timeline.feed_keys),
+        затем загружаются только рецепты этой страницы.
+        """
+        recipes = None
+        if RecipeFilter.get_signature(request):
+            recipes = RecipeFilter.filter_recipes(
+                Recipe.objects.all(), request
+            )
+        keys = self.paginator.paginate_keys(
+            partial(timeline.feed_keys, request.user, recipes=recipes),
+            request
+        )
+        recipe_ids = [recipe_id for _, recipe_id in keys]
+        found = self.get_queryset().in_bulk(recipe_ids)
+        page = [found[pk] for pk in recipe_ids if pk in found]
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=[IsAuthenticated],
+            renderer_classes=shopping_list.RENDERERS)
     def download_shopping_cart(self, request):
-        """Скачать список покупок."""
-        content = shopping_list(request.user)
-        response = HttpResponse(content, content_type='text/plain')
-        response['Content-Disposition'] = 'attachment; ' \
-                                          'filename="shopping_list.txt"'
+        """
+        Скачать список покупок (потоком, без сборки файла в памяти).
+
+        Формат выбирается по ?format= (txt, csv, json, pdf) или Accept.
+        """
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(shopping_list.items(request.user)),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{renderer.format}"'
+        )
+        patch_vary_headers(response, ['Accept'])
+        # nginx отдает куски клиенту сразу, не дожидаясь всего ответа
+        response['X-Accel-Buffering'] = 'no'
         return response
 
     @action(detail=True, methods=['get'],
@@ -0,0 +1,255 @@
+"""
+Уменьшенные копии изображений по запросу: /media/<файл>?w=320.
+
+nginx передает в Django только запросы с ?w=, остальные файлы отдает
+сам. Ширина округляется вверх до одной из RENDITION_WIDTHS, так что
+копий одного файла немного. Копия строится при первом запросе и
+сохраняется в дисковый кеш MEDIA_ROOT/RENDITIONS_DIR/<ширина>/<имя>,
+следующие запросы отдают файл с диска без Pillow. Копия, которая
+старше исходного файла, строится заново. Копия сохраняется в формате
+исходного файла (от него зависит Content-Type), палитра и другие
+режимы переводятся в RGB или RGBA; анимированные файлы отдаются
+как есть.
+
+Одновременные запросы одной копии строят ее один раз: построение идет
+под файловой блокировкой (она действует и между процессами gunicorn),
+и запрос, дождавшийся блокировки, находит готовый файл. Файлов
+блокировок RENDITION_LOCK_STRIPES, копия выбирает свой по хешу пути.
+
+Объем кеша ограничен RENDITION_CACHE_MAX_SIZE. Время изменения копии —
+время последнего чтения (отмечается не чаще RENDITION_TOUCH_INTERVAL).
+Когда объем превышает предел, давно не читавшиеся копии удаляются,
+пока он не опустится до доли RENDITION_CACHE_LOW_WATER. Объем между
+очистками считается в кеше Django.
+"""
+import logging
+import mimetypes
+import os
+import shutil
+import time
+import zlib
+from contextlib import contextmanager
+
+from api.image_variants import convert, fits, prepare, resize
+from api.media import IMMUTABLE_CACHE_CONTROL, is_content_addressed
+from core.constants import (IMAGE_VARIANT_QUALITY, RENDITION_CACHE_LOW_WATER,
+                            RENDITION_CACHE_MAX_SIZE, RENDITION_LOCK_STRIPES,
+                            RENDITION_TOUCH_INTERVAL, RENDITION_WIDTHS,
+                            RENDITIONS_DIR)
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import locks
+from django.http import FileResponse, Http404, HttpResponseBadRequest
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+SIZE_KEY = 'renditions:size'
+LOCKS_DIR = '.locks'
+EVICT_LOCK = '.evict.lock'
+TEMPORARY_SUFFIX = '.tmp'
+# Форматы, которым передается качество сжатия
+LOSSY_FORMATS = ('JPEG', 'WEBP')
+
+
+def cache_root():
+    return os.path.join(settings.MEDIA_ROOT, RENDITIONS_DIR)
+
+
+def source_path(name):
+    return os.path.join(settings.MEDIA_ROOT, name)
+
+
+def rendition_path(name, width):
+    return os.path.join(cache_root(), str(width), name)
+
+
+def rendition_width(value):
+    """
+    Ширина копии для ?w=: наименьшая из RENDITION_WIDTHS не меньше value.
+
+    ValueError, если value — не положительное целое число.
+    """
+    width = int(value)
+    if width <= 0:
+        raise ValueError(value)
+    return next(
+        (candidate for candidate in RENDITION_WIDTHS if candidate >= width),
+        RENDITION_WIDTHS[-1]
+    )
+
+
+def _fresh(path, source_mtime):
+    """stat копии, если она есть и не старше исходного файла."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat if stat.st_mtime >= source_mtime else None
+
+
+@contextmanager
+def _lock(path):
+    """Файловая блокировка построения копии path."""
+    stripe = zlib.crc32(path.encode()) % RENDITION_LOCK_STRIPES
+    lock_path = os.path.join(cache_root(), LOCKS_DIR, str(stripe))
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'ab') as lock:
+        locks.lock(lock, locks.LOCK_EX)
+        try:
+            yield
+        finally:
+            locks.unlock(lock)
+
+
+def _render(name, width, path):
+    """Строит копию: пишет во временный файл и переносит на место."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + TEMPORARY_SUFFIX
+    try:
+        with Image.open(source_path(name)) as image:
+            image_format = image.format
+            if fits(image, width) or getattr(image, 'is_animated', False):
+                # Исходный файл не шире копии (то же правило, что
+                # в resize) или анимирован: отдается как есть
+                shutil.copyfile(source_path(name), temporary)
+            else:
+                # Режим переводится до уменьшения: палитра уменьшается
+                # сглаживанием, а не по ближайшему соседу
+                resized = resize(
+                    convert(prepare(image, width), image_format), width
+                )
+                options = (
+                    {'quality': IMAGE_VARIANT_QUALITY}
+                    if image_format in LOSSY_FORMATS else {}
+                )
+                resized.save(temporary, image_format, **options)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return os.path.getsize(path)
+
+
+def _account(size):
+    """Учитывает записанную копию, при превышении предела — очистка."""
+    try:
+        total = cache.incr(SIZE_KEY, size)
+    except ValueError:
+        # Объем неизвестен (после перезапуска кеша): его считает evict
+        total = None
+    if total is None or total > RENDITION_CACHE_MAX_SIZE:
+        evict()
+
+
+def evict():
+    """
+    Удаляет давно не читавшиеся копии, если кеш больше предела.
+
+    Возвращает объем кеша после очистки или None, если очистку уже
+    выполняет другой процесс.
+    """
+    root = cache_root()
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, EVICT_LOCK), 'ab') as lock:
+        if not locks.lock(lock, locks.LOCK_EX | locks.LOCK_NB):
+            return None
+        try:
+            files = []
+            for directory, subdirectories, names in os.walk(root):
+                if directory == root:
+                    subdirectories[:] = [
+                        subdirectory for subdirectory in subdirectories
+                        if subdirectory != LOCKS_DIR
+                    ]
+                for name in names:
+                    if name == EVICT_LOCK or name.endswith(TEMPORARY_SUFFIX):
+                        continue
+                    path = os.path.join(directory, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in files)
+            if total > RENDITION_CACHE_MAX_SIZE:
+                target = RENDITION_CACHE_MAX_SIZE * RENDITION_CACHE_LOW_WATER
+                for _, size, path in sorted(files):
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+            cache.set(SIZE_KEY, total, None)
+            return total
+        finally:
+            locks.unlock(lock)
+
+
+def rendition(name, width):
+    """
+    Путь к копии файла name шириной width, при необходимости — новой.
+
+    FileNotFoundError, если исходного файла нет.
+    """
+    source_mtime = os.stat(source_path(name)).st_mtime
+    path = rendition_path(name, width)
+    stat = _fresh(path, source_mtime)
+    if stat is None:
+        with _lock(path):
+            # Копию мог построить запрос, который ждал ту же блокировку
+            if _fresh(path, source_mtime) is None:
+                _account(_render(name, width, path))
+    elif time.time() - stat.st_mtime > RENDITION_TOUCH_INTERVAL:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+    return path
+
+
+def _open_rendition(name, width):
+    try:
+        return open(rendition(name, width), 'rb')
+    except FileNotFoundError:
+        # Копию могла удалить очистка кеша между проверкой и чтением
+        return open(rendition(name, width), 'rb')
+
+
+def image_response(request, name):
+    """Изображение рецепта или аватарка, с ?w= — уменьшенная копия."""
+    value = request.GET.get('w')
+    width = None
+    if value is not None:
+        try:
+            width = rendition_width(value)
+        except ValueError:
+            return HttpResponseBadRequest(
+                'Параметр w должен быть положительным целым числом'
+            )
+    # Имя вида recipes/.. указывает на каталог: такого файла нет
+    if not os.path.isfile(source_path(name)):
+        raise Http404('Файл не найден')
+    try:
+        if width is None:
+            file = open(source_path(name), 'rb')
+        else:
+            file = _open_rendition(name, width)
+    except FileNotFoundError:
+        raise Http404('Файл не найден')
+    except (OSError, SyntaxError):
+        # Pillow не прочитал файл: отдается исходный
+        logger.exception('Не удалось построить копию %s', name)
+        try:
+            file = open(source_path(name), 'rb')
+        except OSError:
+            raise Http404('Файл не найден')
+    response = FileResponse(
+        file, content_type=mimetypes.guess_type(name)[0]
+    )
+    if is_content_addressed(name):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
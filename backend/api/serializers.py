@@ -0,0 +1,25 @@
+from django.db import models
+from rest_framework import serializers
+
+
+class PrefetchListSerializer(serializers.ListSerializer):
+    """
+    Список объектов с пакетной подготовкой связанных данных.
+
+    Перед сериализацией элементов весь список передается в prefetch():
+    подкласс сообщает загрузчикам (например, SubscriptionLoader) id,
+    которые понадобятся элементам, и загрузчик читает их одним запросом.
+    """
+
+    def to_representation(self, data):
+        iterable = list(
+            data.all() if isinstance(data, models.manager.BaseManager)
+            else data
+        )
+        request = self.context.get('request')
+        if request:
+            self.prefetch(iterable, request)
+        return super().to_representation(iterable)
+
+    def prefetch(self, objects, request):
+        """Готовит загрузчики запроса request к сериализации objects."""
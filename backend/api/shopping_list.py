@@ -0,0 +1,202 @@
+"""
+Список покупок: суммы ингредиентов из корзины и форматы выгрузки.
+
+Суммы кешируются. Ключ складывается из версии корзины пользователя
+(ее меняют добавление и удаление рецептов, api.signals) и последнего
+Recipe.modified среди рецептов корзины: изменение ингредиентов рецепта
+тоже дает новый ключ. Повторная выгрузка в любом формате не запускает
+агрегацию.
+
+Форматы — рендереры DRF из RENDERERS. Формат выбирается по ?format=
+или по заголовку Accept, по умолчанию — текст. Новый формат добавляется
+декоратором register.
+"""
+import csv
+import json
+from itertools import chain
+
+from api import pdf
+from api.cache import CART_VERSION, get_version
+from core.constants import (SHOPPING_LIST_CACHE_MAX_ROWS,
+                            SHOPPING_LIST_CACHE_TIMEOUT,
+                            SHOPPING_LIST_CHUNK_SIZE, SHOPPING_LIST_FETCH_SIZE)
+from django.core.cache import cache
+from django.db.models import F, Max
+from recipes.models import CartIngredient, ShoppingCart
+from rest_framework import renderers
+
+SHOPPING_LIST_KEY = 'shopping_list:{}:{}:{}'
+
+TITLE = 'Список покупок'
+CSV_HEADER = ('Ингредиент', 'Количество', 'Единица измерения')
+
+RENDERERS = []
+
+
+def shopping_list_items(user):
+    """
+    Ингредиенты из списка покупок с суммарным количеством.
+
+    Суммы хранятся готовыми (CartIngredient), чтение — проход по строкам
+    пользователя в индексе (user, ingredient). Строки читаются по мере
+    надобности (.iterator(): в PostgreSQL — курсор на сервере).
+    """
+    return CartIngredient.objects.filter(
+        user=user
+    ).values(
+        name=F('ingredient__name'),
+        unit=F('ingredient__measurement_unit'),
+        total_amount=F('amount')
+    ).order_by('name', 'unit').iterator(chunk_size=SHOPPING_LIST_FETCH_SIZE)
+
+
+def cart_key(user):
+    """Ключ кеша списка покупок для текущего состояния корзины."""
+    modified = ShoppingCart.objects.filter(user=user).aggregate(
+        modified=Max('recipe__modified')
+    )['modified']
+    return SHOPPING_LIST_KEY.format(
+        user.pk, get_version(CART_VERSION.format(user.pk)),
+        modified and modified.isoformat()
+    )
+
+
+def items(user):
+    """
+    Строки списка покупок (название, количество, единица).
+
+    Генератор: БД читается при первом обращении, то есть уже после
+    того, как рендерер отдал начало файла. Строки отдаются по мере
+    чтения и попутно копятся для кеша; список длиннее
+    SHOPPING_LIST_CACHE_MAX_ROWS не кешируется.
+    """
+    key = cart_key(user)
+    rows = cache.get(key)
+    if rows is not None:
+        yield from rows
+        return
+    rows = []
+    for item in shopping_list_items(user):
+        row = (item['name'], item['total_amount'], item['unit'])
+        if rows is not None:
+            rows.append(row)
+            if len(rows) > SHOPPING_LIST_CACHE_MAX_ROWS:
+                rows = None
+        yield row
+    if rows is not None:
+        cache.set(key, rows, SHOPPING_LIST_CACHE_TIMEOUT)
+
+
+def chunks(strings):
+    """Склеивает строки в куски примерно по SHOPPING_LIST_CHUNK_SIZE."""
+    parts, size = [], 0
+    for string in strings:
+        parts.append(string)
+        size += len(string)
+        if size >= SHOPPING_LIST_CHUNK_SIZE:
+            yield ''.join(parts)
+            parts, size = [], 0
+    if parts:
+        yield ''.join(parts)
+
+
+def messages(data):
+    """Строки сообщения об ошибке (например, 401) для render()."""
+    if isinstance(data, dict):
+        return [f'{key}: {value}' for key, value in data.items()]
+    return [str(data)]
+
+
+def register(renderer_class):
+    """Добавляет формат выгрузки списка покупок."""
+    RENDERERS.append(renderer_class)
+    return renderer_class
+
+
+class ShoppingListRenderer(renderers.BaseRenderer):
+    """
+    Формат списка покупок.
+
+    Файл отдается потоком из stream(), через render() проходят только
+    ответы с ошибками.
+    """
+
+    charset = 'utf-8'
+
+    def stream(self, items):
+        """Куски файла (str или bytes) для строк списка покупок."""
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ''.join(f'{line}\n' for line in messages(data)).encode(
+            self.charset
+        )
+
+
+@register
+class TextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, items):
+        yield f'{TITLE}:\n\n'
+        yield from chunks(
+            f'{name} - {amount} {unit}\n' for name, amount, unit in items
+        )
+
+
+class _Echo:
+    """Файл для csv.writer, который возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+@register
+class CSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, items):
+        writer = csv.writer(_Echo())
+        # BOM: Excel открывает UTF-8 без него в кодировке системы
+        yield '\ufeff' + writer.writerow(CSV_HEADER)
+        yield from chunks(writer.writerow(item) for item in items)
+
+
+@register
+class JSONRenderer(ShoppingListRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def stream(self, items):
+        yield '['
+        yield from chunks(
+            (',' if index else '') + json.dumps(
+                {'name': name, 'amount': amount, 'measurement_unit': unit},
+                ensure_ascii=False
+            )
+            for index, (name, amount, unit) in enumerate(items)
+        )
+        yield ']'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return renderers.JSONRenderer().render(data)
+
+
+@register
+class PDFRenderer(ShoppingListRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    render_style = 'binary'
+
+    def stream(self, items):
+        yield from pdf.document(chain(
+            [f'{TITLE}:', ''],
+            (f'{name} - {amount} {unit}' for name, amount, unit in items)
+        ))
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return b''.join(pdf.document(messages(data)))
@@ -0,0 +1,224 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+from recipes.models import (CartIngredient, Favorite, Ingredient,
+                            IngredientInRecipe, Recipe, ShoppingCart, Tag)
+from users.models import Subscription
+
+from . import image_variants, media, timeline
+from .cache import (INGREDIENTS_VERSION, TAGS_VERSION, bump_version,
+                    invalidate_carts, invalidate_recipes)
+from .pagination import RECIPE_COUNTS_VERSION
+
+User = get_user_model()
+
+# Поля пользователя, которые входят в представление его рецептов
+AUTHOR_FIELDS = frozenset((
+    'username', 'first_name', 'last_name', 'email', 'avatar',
+    'avatar_variants',
+))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def invalidate_recipe_counts(sender, created=True, **kwargs):
+    """Сбрасывает кеш количества рецептов при изменении их состава."""
+    if created:
+        bump_version(RECIPE_COUNTS_VERSION)
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def cart_changed(sender, instance, created=True, **kwargs):
+    """
+    Меняет версию корзины: закешированный список покупок устаревает.
+
+    Версия меняется сразу и еще раз после коммита, как у справочников
+    (catalogue_changed).
+    """
+    if created:
+        invalidate_carts([instance.user_id])
+        transaction.on_commit(partial(invalidate_carts, [instance.user_id]))
+
+
+def recipes_changed(recipes):
+    """
+    Отмечает изменение рецептов, которое не затронуло саму строку рецепта.
+
+    Обновляет Recipe.modified (для ETag) и сбрасывает кеш ответов
+    для этих рецептов.
+    """
+    recipe_ids = list(recipes)
+    if not recipe_ids:
+        return
+    Recipe.objects.filter(pk__in=recipe_ids).update(modified=timezone.now())
+    invalidate_recipes(recipe_ids)
+    transaction.on_commit(partial(invalidate_recipes, recipe_ids))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    """Изменение тегов рецептов."""
+    if action == 'pre_clear' and reverse:
+        # После очистки уже не узнать, какие рецепты были у тега
+        recipes_changed(instance.recipes.values_list('id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    bump_version(RECIPE_COUNTS_VERSION)
+    if not reverse:
+        recipes_changed([instance.pk])
+    elif pk_set:
+        recipes_changed(pk_set)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    """
+    Сбрасывает кеш ответов при изменении рецепта.
+
+    Версии меняются сразу и еще раз после коммита, как у справочников
+    (catalogue_changed): по ним строится и ETag списка рецептов.
+    """
+    invalidate_recipes([instance.pk])
+    transaction.on_commit(partial(invalidate_recipes, [instance.pk]))
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    """Изменение ингредиентов рецепта."""
+    recipes_changed([instance.recipe_id])
+
+
+@receiver(pre_save, sender=IngredientInRecipe)
+def remember_recipe_ingredient(sender, instance, raw=False, **kwargs):
+    """Запоминает прежние ингредиент и количество перед изменением."""
+    if raw or instance._state.adding:
+        return
+    instance._previous = sender.objects.filter(pk=instance.pk).values_list(
+        'ingredient_id', 'amount'
+    ).first()
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+def update_cart_totals(sender, instance, created=None, raw=False,
+                       **kwargs):
+    """Переносит изменение рецепта в суммы корзин, где он лежит."""
+    if raw:
+        return
+    totals = CartIngredient.objects.db_manager(instance._state.db)
+    if created is None:
+        # Удаление
+        totals.add_ingredient(instance.recipe_id, instance.ingredient_id,
+                              -instance.amount)
+        return
+    previous = getattr(instance, '_previous', None)
+    if previous == (instance.ingredient_id, instance.amount):
+        return
+    if previous is not None:
+        totals.add_ingredient(instance.recipe_id, previous[0], -previous[1])
+    totals.add_ingredient(instance.recipe_id, instance.ingredient_id,
+                          instance.amount)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def tag_changed(sender, instance, signal, **kwargs):
+    """Изменение тега затрагивает все рецепты с этим тегом."""
+    recipes_changed(instance.recipes.values_list('id', flat=True))
+    if signal is pre_delete:
+        # Связи с рецептами удаляются каскадом, без m2m_changed: кеш
+        # количества для ?tags= сбрасывается здесь, сразу и после коммита
+        bump_version(RECIPE_COUNTS_VERSION)
+        transaction.on_commit(partial(bump_version, RECIPE_COUNTS_VERSION))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    """Изменение ингредиента затрагивает все рецепты с ним."""
+    recipes_changed(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def catalogue_changed(sender, **kwargs):
+    """
+    Меняет версию справочника: индексы ингредиентов в процессах
+    (ingredient_index) и снимки справочников (api.catalogue) устаревают.
+
+    Версия меняется сразу и еще раз после коммита: индекс или снимок,
+    который другой процесс успел собрать до коммита, содержит старые
+    данные.
+    """
+    version = TAGS_VERSION if sender is Tag else INGREDIENTS_VERSION
+    bump_version(version)
+    transaction.on_commit(partial(bump_version, version))
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields=None,
+                   **kwargs):
+    """
+    Профиль автора входит в представление его рецептов.
+
+    Сохранение только других полей (last_login при входе, пароль)
+    рецепты не затрагивает.
+    """
+    if created or (update_fields and AUTHOR_FIELDS.isdisjoint(update_fields)):
+        return
+    recipes_changed(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def schedule_image_variants(sender, instance, update_fields=None,
+                            raw=False, **kwargs):
+    """Для нового изображения строятся уменьшенные копии."""
+    file_field = image_variants.KINDS[sender][0]
+    if raw or (update_fields and file_field not in update_fields):
+        return
+    if image_variants.needs_variants(instance):
+        image_variants.schedule(sender, instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def release_image(sender, instance, **kwargs):
+    """Файл удаленного объекта удаляется, если его никто не использует."""
+    file_field = image_variants.KINDS[sender][0]
+    media.release(sender, getattr(instance, file_field).name)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    """Новый рецепт попадает в ленты подписчиков отложенным заданием."""
+    if created:
+        timeline.enqueue(recipe_id=instance.pk)
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def subscription_changed(sender, instance, created=None, **kwargs):
+    """
+    Дополняет или очищает ленту после подписки и отписки.
+
+    Работа выполняется отложенным заданием, вне запроса.
+    """
+    if created is False:
+        return
+    timeline.enqueue(subscriber_id=instance.subscriber_id,
+                     author_id=instance.author_id)
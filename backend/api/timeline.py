@@ -0,0 +1,260 @@
+"""
+Лента рецептов авторов, на которых подписан пользователь.
+
+Рецепты обычных авторов раскладываются по лентам подписчиков при
+публикации (fan-out-on-write, таблица TimelineEntry). Авторы, у которых
+больше FEED_FANOUT_MAX_SUBSCRIBERS подписчиков, в таблицу не пишутся:
+их рецепты подмешиваются в ленту при чтении (fan-out-on-read).
+
+Строка ленты хранит копию даты создания рецепта, и страница ленты
+выбирается по индексу (user, -created, -recipe) от позиции курсора,
+без просмотра рецептов.
+
+Раскладка нового рецепта, дополнение ленты после подписки и очистка
+после отписки не выполняются в запросе: запрос только записывает
+задание (TimelineJob) в своей транзакции. После коммита задания
+выполняет фоновый поток, а то, что он не успел (перезапуск процесса),
+выполняет команда process_timeline_jobs, запускаемая по расписанию.
+
+Если автор перестал быть популярным, его рецепты за время популярности
+в лентах отсутствуют; ленты пересобирает команда rebuild_timelines.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from threading import Lock
+
+from core.constants import (FEED_BACKFILL_LIMIT, FEED_FANOUT_MAX_SUBSCRIBERS,
+                            TIMELINE_BATCH_SIZE, TIMELINE_WORKERS)
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models import Q
+from recipes.models import Recipe, TimelineEntry, TimelineJob
+from users.models import Subscription
+
+User = get_user_model()
+
+_executor = None
+_executor_lock = Lock()
+
+
+def is_popular(author_id):
+    """Слишком много подписчиков для раскладки по лентам."""
+    return User.objects.filter(
+        pk=author_id, subscribers_count__gt=FEED_FANOUT_MAX_SUBSCRIBERS
+    ).exists()
+
+
+def popular_authors(user):
+    """Популярные авторы из подписок пользователя (queryset их id)."""
+    return User.objects.filter(
+        subscribers__subscriber=user,
+        subscribers_count__gt=FEED_FANOUT_MAX_SUBSCRIBERS
+    ).values('pk')
+
+
+def _after(position, reverse, recipe_field):
+    """Условие «после позиции (created, id рецепта)» в порядке ленты."""
+    lookup = 'gt' if reverse else 'lt'
+    created, recipe_id = position
+    return Q(**{f'created__{lookup}': created}) | Q(
+        created=created, **{f'{recipe_field}__{lookup}': recipe_id}
+    )
+
+
+def feed_keys(user, limit, position=None, reverse=False, recipes=None):
+    """
+    До limit ключей (created, id рецепта) ленты от новых к старым.
+
+    Строки ленты и рецепты популярных авторов объединяются одним
+    запросом (UNION ALL), каждая часть читается по своему индексу
+    от позиции position. С reverse ключи идут к новым, от позиции
+    назад. recipes — отфильтрованный queryset рецептов, если
+    в запросе есть фильтры.
+    """
+    popular = popular_authors(user)
+    # Строки, оставшиеся от времени, когда автор не был популярным,
+    # не дублируют рецепты, прочитанные напрямую
+    entries = TimelineEntry.objects.filter(user=user).exclude(
+        author__in=popular
+    )
+    authored = Recipe.objects.filter(author__in=popular)
+    if recipes is not None:
+        entries = entries.filter(recipe__in=recipes.values('pk'))
+        authored = authored.filter(pk__in=recipes.values('pk'))
+    if position is not None:
+        entries = entries.filter(_after(position, reverse, 'recipe'))
+        authored = authored.filter(_after(position, reverse, 'id'))
+    ordering = ('created', 'recipe') if reverse else ('-created', '-recipe')
+    return list(
+        entries.order_by().values_list('created', 'recipe').union(
+            authored.order_by().values_list('created', 'id'), all=True
+        ).order_by(*ordering)[:limit]
+    )
+
+
+def _bulk_add(entries):
+    """Записывает строки ленты пачками, пропуская уже существующие."""
+    entries = iter(entries)
+    while batch := list(islice(entries, TIMELINE_BATCH_SIZE)):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out_recipe(recipe_id):
+    """Добавляет новый рецепт в ленты подписчиков автора."""
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'author_id', 'created'
+    ).first()
+    if recipe is None or is_popular(recipe['author_id']):
+        return
+    subscriber_ids = Subscription.objects.filter(
+        author_id=recipe['author_id']
+    ).values_list('subscriber_id', flat=True)
+    _bulk_add(
+        TimelineEntry(user_id=subscriber_id, recipe_id=recipe_id,
+                      author_id=recipe['author_id'],
+                      created=recipe['created'])
+        for subscriber_id in subscriber_ids.iterator(
+            chunk_size=TIMELINE_BATCH_SIZE
+        )
+    )
+
+
+def backfill(user_id, author_id):
+    """
+    Добавляет в ленту последние рецепты автора после подписки.
+
+    Не больше FEED_BACKFILL_LIMIT рецептов одной вставкой.
+    """
+    if is_popular(author_id):
+        return
+    recipes = Recipe.objects.filter(
+        author_id=author_id
+    ).order_by('-created', '-id').values_list(
+        'id', 'created'
+    )[:FEED_BACKFILL_LIMIT]
+    _bulk_add(
+        TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                      author_id=author_id, created=created)
+        for recipe_id, created in recipes
+    )
+
+
+def prune(user_id, author_id):
+    """
+    Убирает из ленты рецепты автора после отписки.
+
+    Строки удаляются пачками по TIMELINE_BATCH_SIZE: длинная лента
+    не блокируется одним большим DELETE.
+    """
+    entries = TimelineEntry.objects.filter(
+        user_id=user_id, author_id=author_id
+    )
+    while True:
+        batch = list(entries.values_list('pk', flat=True)[
+            :TIMELINE_BATCH_SIZE
+        ])
+        if not batch:
+            return
+        TimelineEntry.objects.filter(pk__in=batch).delete()
+
+
+def sync_subscription(user_id, author_id):
+    """
+    Приводит ленту в соответствие с подпиской: дополняет или очищает.
+
+    Состояние подписки читается заново: подписка и отписка подряд
+    дают верный результат в любом порядке выполнения.
+    """
+    if Subscription.objects.filter(
+        subscriber_id=user_id, author_id=author_id
+    ).exists():
+        backfill(user_id, author_id)
+    else:
+        prune(user_id, author_id)
+
+
+def run_job(job):
+    """Выполняет задание TimelineJob."""
+    if job.recipe_id is not None:
+        fan_out_recipe(job.recipe_id)
+    else:
+        sync_subscription(job.subscriber_id, job.author_id)
+
+
+def run_jobs(limit=None):
+    """
+    Выполняет отложенные задания по порядку, до limit заданий.
+
+    Задание удаляется в той же транзакции, в которой выполнено: сбой
+    оставляет его в таблице. В PostgreSQL задание, которое уже взял
+    другой процесс, пропускается (SKIP LOCKED). Возвращает количество
+    выполненных заданий.
+    """
+    processed = 0
+    while limit is None or processed < limit:
+        with transaction.atomic():
+            job = TimelineJob.objects.select_for_update(
+                skip_locked=True
+            ).order_by('pk').first()
+            if job is None:
+                break
+            run_job(job)
+            job.delete()
+        processed += 1
+    return processed
+
+
+def _executor_instance():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=TIMELINE_WORKERS,
+                thread_name_prefix='timeline'
+            )
+    return _executor
+
+
+def _run():
+    try:
+        run_jobs()
+    finally:
+        # Соединения потоков пула не закрываются Django сами
+        connections.close_all()
+
+
+def _submit():
+    _executor_instance().submit(_run)
+
+
+def enqueue(**fields):
+    """
+    Записывает задание в транзакции запроса.
+
+    После коммита задания выполняет фоновый поток; если поток их
+    не выполнил, их выполнит команда process_timeline_jobs.
+    """
+    TimelineJob.objects.create(**fields)
+    transaction.on_commit(_submit)
+
+
+def rebuild(user_ids=None):
+    """
+    Пересобирает ленты пользователей (всех, если user_ids не передан).
+
+    Возвращает количество обработанных подписок.
+    """
+    entries = TimelineEntry.objects.all()
+    subscriptions = Subscription.objects.order_by('pk')
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+        subscriptions = subscriptions.filter(subscriber_id__in=user_ids)
+    entries.delete()
+
+    processed = 0
+    for subscriber_id, author_id in subscriptions.values_list(
+        'subscriber_id', 'author_id'
+    ).iterator(chunk_size=TIMELINE_BATCH_SIZE):
+        backfill(subscriber_id, author_id)
+        processed += 1
+    return processed
@@ -0,0 +1,280 @@
+"""
+Идемпотентное добавление и удаление связей пользователя с объектом.
+
+Избранное, список покупок и подписки — строки (пользователь, объект)
+с уникальным ограничением. В PostgreSQL добавление выполняется одним
+INSERT ... ON CONFLICT DO NOTHING RETURNING, который заодно читает
+нужные поля объекта, а удаление — одним DELETE ... RETURNING. Повторные
+и одновременные запросы не приводят к IntegrityError.
+
+Сырой SQL обходит save() и delete(), поэтому счетчики (CounterMixin)
+и сигналы post_save/post_delete обрабатываются здесь же, в той же
+транзакции. В остальных СУБД используется ORM.
+
+add_links и remove_links делают то же для списка объектов: проверка
+существования и вставка или удаление — один запрос на весь список.
+"""
+from django.db import IntegrityError, connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+
+def _link(model, user_field, user, target_field, target_id, **values):
+    """Экземпляр связи без обращения к базе."""
+    meta = model._meta
+    return model(**{
+        meta.get_field(user_field).attname: user.pk,
+        meta.get_field(target_field).attname: target_id,
+        **values,
+    })
+
+
+def _columns(model, user_field, target_field):
+    """Экранированные таблица и колонки связи, поле даты добавления."""
+    quote = connection.ops.quote_name
+    meta = model._meta
+    added_field = next(
+        field for field in meta.concrete_fields
+        if getattr(field, 'auto_now_add', False)
+    )
+    return (
+        quote(meta.db_table),
+        quote(meta.pk.column),
+        quote(meta.get_field(user_field).column),
+        quote(meta.get_field(target_field).column),
+        added_field,
+    )
+
+
+def _returning(model):
+    """Колонки для RETURNING всей строки связи и имена их полей."""
+    quote = connection.ops.quote_name
+    fields = model._meta.concrete_fields
+    return (', '.join(quote(field.column) for field in fields),
+            [field.attname for field in fields])
+
+
+def _from_db(meta, names, row):
+    """Значения полей из строки сырого SQL с преобразованием (JSON)."""
+    values = {}
+    for name, value in zip(names, row):
+        field = meta.get_field(name)
+        if hasattr(field, 'from_db_value'):
+            value = field.from_db_value(value, None, connection)
+        values[name] = value
+    return values
+
+
+def add_link(model, user_field, user, target_field, target_id,
+             target_columns):
+    """
+    Добавляет строку (user, target) и возвращает (target, created).
+
+    target — словарь target_columns объекта или None, если объекта
+    с target_id нет; created — False, если связь уже была.
+    """
+    if connection.vendor != 'postgresql':
+        return _add_link_orm(model, user_field, user, target_field,
+                             target_id, target_columns)
+
+    quote = connection.ops.quote_name
+    table, _, user_column, target_column, added_field = _columns(
+        model, user_field, target_field
+    )
+    target_meta = model._meta.get_field(target_field).related_model._meta
+    target_pk = quote(target_meta.pk.column)
+    selected = [quote(target_meta.get_field(name).column)
+                for name in target_columns]
+    returning, attnames = _returning(model)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'WITH target AS ('
+                f' SELECT {target_pk} AS target_id, {", ".join(selected)}'
+                f' FROM {quote(target_meta.db_table)}'
+                f' WHERE {target_pk} = %s'
+                f'), inserted AS ('
+                f' INSERT INTO {table}'
+                f' ({user_column}, {target_column},'
+                f' {quote(added_field.column)})'
+                f' SELECT %s, target_id, %s FROM target'
+                f' ON CONFLICT DO NOTHING RETURNING {returning}'
+                f') SELECT '
+                + ', '.join(f'target.{column}' for column in selected)
+                + ', inserted.* FROM target LEFT JOIN inserted ON TRUE',
+                [target_id, user.pk, timezone.now()]
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None, False
+        link_row = row[len(selected):]
+        created = link_row[attnames.index(model._meta.pk.attname)] is not None
+        if created:
+            instance = model.from_db(connection.alias, attnames, link_row)
+            instance.update_counters(1)
+            post_save.send(sender=model, instance=instance, created=True,
+                           update_fields=None, raw=False,
+                           using=connection.alias)
+    return _from_db(target_meta, target_columns, row), created
+
+
+def _add_link_orm(model, user_field, user, target_field, target_id,
+                  target_columns):
+    target_model = model._meta.get_field(target_field).related_model
+    target = target_model._default_manager.filter(
+        pk=target_id
+    ).values(*target_columns).first()
+    if target is None:
+        return None, False
+    try:
+        with transaction.atomic():
+            _link(model, user_field, user, target_field, target_id).save()
+    except IntegrityError:
+        return target, False
+    return target, True
+
+
+def remove_link(model, user_field, user, target_field, target_id):
+    """Удаляет строку (user, target); False, если ее не было."""
+    if connection.vendor != 'postgresql':
+        deleted, _ = model._default_manager.filter(**{
+            user_field: user, target_field: target_id
+        }).delete()
+        return bool(deleted)
+
+    table, _, user_column, target_column, _ = _columns(
+        model, user_field, target_field
+    )
+    returning, attnames = _returning(model)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table}'
+                f' WHERE {user_column} = %s AND {target_column} = %s'
+                f' RETURNING {returning}',
+                [user.pk, target_id]
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return False
+        # Приемник post_delete уменьшает счетчики (core.signals).
+        # Экземпляр — удаленная строка, как после Model.delete()
+        post_delete.send(
+            sender=model,
+            instance=model.from_db(connection.alias, attnames, row),
+            using=connection.alias,
+            origin=None
+        )
+    return True
+
+
+def add_links(model, user_field, user, target_field, target_ids):
+    """
+    Добавляет строки (user, target) для многих объектов сразу.
+
+    Возвращает словарь {target_id: created} только для существующих
+    объектов. Как и bulk_create, сигналы post_save не отправляются,
+    счетчики обновляются одним UPDATE на группу объектов.
+    """
+    if connection.vendor != 'postgresql':
+        return _add_links_orm(model, user_field, user, target_field,
+                              target_ids)
+
+    quote = connection.ops.quote_name
+    table, _, user_column, target_column, added_field = _columns(
+        model, user_field, target_field
+    )
+    target_meta = model._meta.get_field(target_field).related_model._meta
+    target_pk = quote(target_meta.pk.column)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'WITH target AS ('
+                f' SELECT {target_pk} AS id'
+                f' FROM {quote(target_meta.db_table)}'
+                f' WHERE {target_pk} = ANY(%s)'
+                f'), inserted AS ('
+                f' INSERT INTO {table}'
+                f' ({user_column}, {target_column},'
+                f' {quote(added_field.column)})'
+                f' SELECT %s, id, %s FROM target'
+                f' ON CONFLICT DO NOTHING RETURNING {target_column}'
+                f') SELECT target.id, inserted.{target_column} IS NOT NULL'
+                f' FROM target LEFT JOIN inserted'
+                f' ON inserted.{target_column} = target.id',
+                [list(target_ids), user.pk, timezone.now()]
+            )
+            result = dict(cursor.fetchall())
+        model.bulk_update_counters(
+            [_link(model, user_field, user, target_field, target_id)
+             for target_id, created in result.items() if created],
+            1, using=connection.alias
+        )
+    return result
+
+
+def _add_links_orm(model, user_field, user, target_field, target_ids):
+    target_model = model._meta.get_field(target_field).related_model
+    existing = set(target_model._default_manager.filter(
+        pk__in=target_ids
+    ).values_list('pk', flat=True))
+    linked = set(model._default_manager.filter(**{
+        user_field: user, f'{target_field}__in': existing
+    }).values_list(target_field, flat=True))
+    links = [
+        _link(model, user_field, user, target_field, target_id)
+        for target_id in existing - linked
+    ]
+    with transaction.atomic():
+        model._default_manager.bulk_create(links)
+        model.bulk_update_counters(links, 1)
+    return {target_id: target_id not in linked for target_id in existing}
+
+
+def remove_links(model, user_field, user, target_field, target_ids):
+    """
+    Удаляет строки (user, target) для многих объектов сразу.
+
+    Возвращает словарь {target_id: removed} только для существующих
+    объектов. В PostgreSQL сигналы post_delete не отправляются,
+    счетчики обновляются одним UPDATE на группу объектов.
+    """
+    target_model = model._meta.get_field(target_field).related_model
+    if connection.vendor != 'postgresql':
+        existing = set(target_model._default_manager.filter(
+            pk__in=target_ids
+        ).values_list('pk', flat=True))
+        links = model._default_manager.filter(**{
+            user_field: user, f'{target_field}__in': existing
+        })
+        removed = set(links.values_list(target_field, flat=True))
+        links.delete()
+        return {target_id: target_id in removed for target_id in existing}
+
+    quote = connection.ops.quote_name
+    table, _, user_column, target_column, _ = _columns(
+        model, user_field, target_field
+    )
+    target_pk = quote(target_model._meta.pk.column)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'WITH deleted AS ('
+                f' DELETE FROM {table}'
+                f' WHERE {user_column} = %s AND {target_column} = ANY(%s)'
+                f' RETURNING {target_column}'
+                f') SELECT target.{target_pk},'
+                f' deleted.{target_column} IS NOT NULL'
+                f' FROM {quote(target_model._meta.db_table)} target'
+                f' LEFT JOIN deleted'
+                f' ON deleted.{target_column} = target.{target_pk}'
+                f' WHERE target.{target_pk} = ANY(%s)',
+                [user.pk, list(target_ids), list(target_ids)]
+            )
+            result = dict(cursor.fetchall())
+        model.bulk_update_counters(
+            [_link(model, user_field, user, target_field, target_id)
+             for target_id, removed in result.items() if removed],
+            -1, using=connection.alias
+        )
+    return result
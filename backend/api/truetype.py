@@ -0,0 +1,194 @@
+"""
+Шрифт TrueType для встраивания в PDF (api.pdf).
+
+Из файла шрифта читаются метрики и таблица символов (cmap), а в PDF
+встраивается урезанная копия: остаются только таблицы, нужные для
+вывода текста (без кернинга, лигатур и названий), и контуры нужных
+глифов. Номера глифов не меняются, поэтому cmap и hmtx переносятся
+как есть.
+"""
+import struct
+
+# Таблицы, которые нужны программе просмотра для вывода глифов
+TABLES = (b'cmap', b'cvt ', b'fpgm', b'glyf', b'head', b'hhea', b'hmtx',
+          b'loca', b'maxp', b'prep')
+
+# Флаги ссылки на другой глиф в составном глифе
+ARG_1_AND_2_ARE_WORDS = 0x0001
+WE_HAVE_A_SCALE = 0x0008
+MORE_COMPONENTS = 0x0020
+WE_HAVE_AN_X_AND_Y_SCALE = 0x0040
+WE_HAVE_A_TWO_BY_TWO = 0x0080
+
+
+def _checksum(data):
+    data += b'\0' * (-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+
+def _build(tables):
+    """Файл TrueType из таблиц {тег: данные}."""
+    count = len(tables)
+    power = 1 << (count.bit_length() - 1)
+    header = struct.pack('>IHHHH', 0x00010000, count, power * 16,
+                         power.bit_length() - 1, (count - power) * 16)
+    offset = len(header) + 16 * count
+    directory, body = [], []
+    for tag in sorted(tables):
+        data = tables[tag]
+        directory.append(struct.pack('>4sIII', tag, _checksum(data),
+                                     offset, len(data)))
+        padded = data + b'\0' * (-len(data) % 4)
+        body.append(padded)
+        offset += len(padded)
+    return header + b''.join(directory) + b''.join(body)
+
+
+class Font:
+    """
+    Шрифт TrueType, прочитанный из байтов файла.
+
+    ValueError или struct.error, если файл не TrueType или в нем нет
+    таблицы символов Unicode (cmap формата 4).
+    """
+
+    def __init__(self, data):
+        self.data = data
+        count, = struct.unpack_from('>H', data, 4)
+        self.tables = {}
+        for index in range(count):
+            tag, _, offset, length = struct.unpack_from(
+                '>4sIII', data, 12 + 16 * index
+            )
+            self.tables[tag] = (offset, length)
+        if b'glyf' not in self.tables or b'loca' not in self.tables:
+            raise ValueError('Шрифт без контуров TrueType')
+        head = self.table(b'head')
+        self.units_per_em, = struct.unpack_from('>H', head, 18)
+        self.bbox = struct.unpack_from('>4h', head, 36)
+        self.long_loca = struct.unpack_from('>h', head, 50)[0] == 1
+        hhea = self.table(b'hhea')
+        self.ascent, self.descent = struct.unpack_from('>hh', hhea, 4)
+        metrics, = struct.unpack_from('>H', hhea, 34)
+        self.advances = struct.unpack_from(
+            '>' + 'Hh' * metrics, self.table(b'hmtx')
+        )[::2]
+        self.glyph_count, = struct.unpack_from('>H', self.table(b'maxp'), 4)
+        self.glyphs = self._cmap()
+
+    def table(self, tag):
+        offset, length = self.tables[tag]
+        return self.data[offset:offset + length]
+
+    def _cmap(self):
+        """Номера глифов символов {код Unicode: глиф} из cmap формата 4."""
+        cmap = self.table(b'cmap')
+        count, = struct.unpack_from('>H', cmap, 2)
+        for index in range(count):
+            platform, encoding, offset = struct.unpack_from(
+                '>HHI', cmap, 4 + 8 * index
+            )
+            if ((platform, encoding) == (3, 1)
+                    and struct.unpack_from('>H', cmap, offset)[0] == 4):
+                return self._format4(cmap, offset)
+        raise ValueError('В шрифте нет таблицы символов Unicode')
+
+    @staticmethod
+    def _format4(cmap, offset):
+        segments = struct.unpack_from('>H', cmap, offset + 6)[0] // 2
+        ends = offset + 14
+        starts = ends + 2 * segments + 2
+        deltas = starts + 2 * segments
+        ranges = deltas + 2 * segments
+        glyphs = {}
+        for segment in range(segments):
+            end, = struct.unpack_from('>H', cmap, ends + 2 * segment)
+            start, = struct.unpack_from('>H', cmap, starts + 2 * segment)
+            delta, = struct.unpack_from('>H', cmap, deltas + 2 * segment)
+            range_offset, = struct.unpack_from('>H', cmap,
+                                               ranges + 2 * segment)
+            for code in range(start, min(end, 0xFFFE) + 1):
+                if range_offset:
+                    glyph, = struct.unpack_from(
+                        '>H', cmap,
+                        ranges + 2 * segment + range_offset
+                        + 2 * (code - start)
+                    )
+                    glyph = (glyph + delta) & 0xFFFF if glyph else 0
+                else:
+                    glyph = (code + delta) & 0xFFFF
+                if glyph:
+                    glyphs[code] = glyph
+        return glyphs
+
+    def glyph(self, character):
+        """Номер глифа символа, 0 (.notdef) — если символа нет."""
+        return self.glyphs.get(ord(character), 0)
+
+    def width(self, glyph):
+        """Ширина глифа в тысячных долях кегля, как в PDF."""
+        advance = self.advances[min(glyph, len(self.advances) - 1)]
+        return round(advance * 1000 / self.units_per_em)
+
+    def _offsets(self):
+        loca = self.table(b'loca')
+        if self.long_loca:
+            return struct.unpack_from(f'>{self.glyph_count + 1}I', loca)
+        return [offset * 2 for offset in struct.unpack_from(
+            f'>{self.glyph_count + 1}H', loca
+        )]
+
+    @staticmethod
+    def _components(glyph):
+        """Глифы, из которых собран составной глиф."""
+        offset = 10
+        while True:
+            flags, component = struct.unpack_from('>HH', glyph, offset)
+            yield component
+            offset += 8 if flags & ARG_1_AND_2_ARE_WORDS else 6
+            if flags & WE_HAVE_A_SCALE:
+                offset += 2
+            elif flags & WE_HAVE_AN_X_AND_Y_SCALE:
+                offset += 4
+            elif flags & WE_HAVE_A_TWO_BY_TWO:
+                offset += 8
+            if not flags & MORE_COMPONENTS:
+                return
+
+    def subset(self, glyphs):
+        """
+        Файл шрифта, в котором есть контуры только глифов glyphs.
+
+        Остальные глифы остаются пустыми, их номера не меняются.
+        """
+        offsets = self._offsets()
+        glyf = self.table(b'glyf')
+        needed = {0} | set(glyphs)
+        pending = list(needed)
+        while pending:
+            glyph = pending.pop()
+            data = glyf[offsets[glyph]:offsets[glyph + 1]]
+            if len(data) > 10 and struct.unpack_from('>h', data)[0] < 0:
+                for component in self._components(data):
+                    if component not in needed:
+                        needed.add(component)
+                        pending.append(component)
+        contours, locations = [], [0]
+        for glyph in range(self.glyph_count):
+            data = (glyf[offsets[glyph]:offsets[glyph + 1]]
+                    if glyph in needed else b'')
+            data += b'\0' * (-len(data) % 4)
+            contours.append(data)
+            locations.append(locations[-1] + len(data))
+        head = bytearray(self.table(b'head'))
+        # Сумма файла не пересчитывается, смещения в loca — 32-битные
+        head[8:12] = bytes(4)
+        head[50:52] = struct.pack('>h', 1)
+        tables = {tag: self.table(tag) for tag in TABLES
+                  if tag in self.tables}
+        tables.update({
+            b'head': bytes(head),
+            b'glyf': b''.join(contours),
+            b'loca': struct.pack(f'>{len(locations)}I', *locations),
+        })
+        return _build(tables)
@@ -0,0 +1,48 @@
+class SubscriptionLoader:
+    """
+    Загрузчик подписок текущего пользователя в рамках одного запроса.
+
+    Сериализаторы сообщают загрузчику id авторов, которых собираются
+    отрисовать, а при первой проверке подписки все накопленные id
+    запрашиваются одним запросом. Результат запоминается до конца запроса.
+    """
+
+    attr_name = '_subscription_loader'
+
+    def __init__(self, user):
+        self.user = user
+        self._pending = set()
+        self._loaded = set()
+        self._subscribed = set()
+
+    @classmethod
+    def for_request(cls, request):
+        """Возвращает загрузчик, привязанный к запросу."""
+        loader = getattr(request, cls.attr_name, None)
+        if loader is None:
+            loader = cls(request.user)
+            setattr(request, cls.attr_name, loader)
+        return loader
+
+    def add(self, author_ids):
+        """Запоминает id авторов, подписку на которых нужно проверить."""
+        self._pending.update(author_ids)
+
+    def is_subscribed(self, author_id):
+        """Подписан ли текущий пользователь на автора."""
+        if not self.user.is_authenticated:
+            return False
+        if author_id not in self._loaded:
+            self._pending.add(author_id)
+            self._load()
+        return author_id in self._subscribed
+
+    def _load(self):
+        author_ids = self._pending - self._loaded
+        self._pending.clear()
+        self._subscribed.update(
+            self.user.subscriptions.filter(
+                author_id__in=author_ids
+            ).values_list('author_id', flat=True)
+        )
+        self._loaded |= author_ids
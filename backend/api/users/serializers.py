@@ -1,10 +1,12 @@
-import base64
-
+from api import media
+from api.image_variants import avatar_url
+from api.serializers import PrefetchListSerializer
+from api.users.loaders import SubscriptionLoader
+from api.utils import decode_base64_image
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
-from users.models import Subscription
 
 User = get_user_model()
 
@@ -20,6 +22,15 @@ class UserCreateSerializer(UserCreateSerializer):
         }
 
 
+class UserListSerializer(PrefetchListSerializer):
+    """Список пользователей: заранее сообщает загрузчику подписок их id."""
+
+    def prefetch(self, objects, request):
+        SubscriptionLoader.for_request(request).add(
+            user.pk for user in objects
+        )
+
+
 class UserSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
     avatar = serializers.SerializerMethodField()
@@ -28,19 +39,18 @@ class UserSerializer(UserSerializer):
         model = User
         fields = ('email', 'id', 'username', 'first_name',
                   'last_name', 'is_subscribed', 'avatar')
+        list_serializer_class = UserListSerializer
 
     def get_is_subscribed(self, obj):
         request = self.context.get('request')
         if not request or not request.user.is_authenticated:
             return False
-        return request.user.subscriptions.filter(author=obj).exists()
+        return SubscriptionLoader.for_request(request).is_subscribed(obj.pk)
 
     def get_avatar(self, obj):
-        request = self.context.get('request')
-        if not obj.avatar:
-            return None
-        return (request.build_absolute_uri(obj.avatar.url)
-                if request else obj.avatar.url)
+        # Уменьшенная копия, пока ее нет — исходный файл
+        return avatar_url(obj.avatar.name, obj.avatar_variants,
+                          self.context.get('request'))
 
 
 class AvatarSerializer(serializers.ModelSerializer):
@@ -51,33 +61,32 @@ class AvatarSerializer(serializers.ModelSerializer):
         fields = ('avatar',)
 
     def validate_avatar(self, value):
-        """Проверяем, что это валидный base64"""
-        if value and not value.startswith('data:image/'):
-            raise serializers.ValidationError(
-                'Неверный формат изображения. Ожидается base64 encoded image.')
-        return value
-
+        """Декодируем base64 во временный файл (api.utils)."""
+        if not value:
+            return value
+        try:
+            return decode_base64_image(value)
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
+
+    @transaction.atomic
     def update(self, instance, validated_data):
         avatar_data = validated_data.get('avatar')
 
         if avatar_data is None or avatar_data == '':
             # Удаляем аватарку
-            if instance.avatar:
-                instance.avatar.delete()
-                instance.avatar = None
+            old_avatar = instance.avatar.name
+            instance.avatar = None
         else:
-            # Создаем новую аватарку из base64
-            format, imgstr = avatar_data.split(';base64,')
-            ext = format.split('/')[-1]
-
-            # Генерируем имя файла
-            filename = f'avatar_{instance.id}.{ext}'
-
-            # Декодируем и сохраняем
-            data = ContentFile(base64.b64decode(imgstr), name=filename)
-            instance.avatar = data
+            # Имя — хеш содержимого (api.media)
+            old_avatar = media.store(instance, 'avatar', avatar_data)
 
         instance.save()
+        if avatar_data:
+            # Временный файл уже перенесен в хранилище
+            avatar_data.close()
+        # Старый файл удаляется, если его никто больше не использует
+        media.release(User, old_avatar)
         return instance
 
     def to_representation(self, instance):
@@ -91,31 +100,3 @@ class AvatarSerializer(serializers.ModelSerializer):
         return {
             'avatar': avatar_url
         }
-
-
-class SubscriptionSerializer(serializers.ModelSerializer):
-    """Сериализатор для операций с подписками."""
-
-    class Meta:
-        model = Subscription
-        fields = ('subscriber', 'author')
-        read_only_fields = ('subscriber',)
-
-    def validate(self, attrs):
-        """Валидация данных подписки."""
-        author = attrs.get('author')
-        subscriber = self.context['request'].user
-
-        # Нельзя подписаться на себя
-        if subscriber == author:
-            raise serializers.ValidationError(
-                'Нельзя подписаться на самого себя.')
-
-        # Проверяем, не подписан ли уже
-        if Subscription.objects.filter(subscriber=subscriber,
-                                       author=author).exists():
-            raise serializers.ValidationError(
-                'Вы уже подписаны на этого пользователя.')
-
-        attrs['subscriber'] = subscriber
-        return attrs
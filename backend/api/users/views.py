@@ -1,8 +1,11 @@
 from api.recipes.serializers import RecipeMinifiedSerializer
-from api.users.serializers import (AvatarSerializer, SubscriptionSerializer,
-                                   UserCreateSerializer, UserSerializer)
+from api.toggles import add_link, remove_link
+from api.users.loaders import SubscriptionLoader
+from api.users.serializers import (AvatarSerializer, UserCreateSerializer,
+                                   UserSerializer)
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
+from django.db.models import Prefetch
+from django.http import Http404
 from djoser.serializers import SetPasswordSerializer
 from recipes.models import Recipe
 from rest_framework import permissions, status, viewsets
@@ -113,9 +116,36 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
         Возвращает queryset пользователей,
         на которых подписан текущий пользователь.
         """
-        return User.objects.filter(
-            subscribers__subscriber=self.request.user
-        ).prefetch_related('subscribers', 'subscriptions')
+        return self.with_recipes(
+            User.objects.filter(subscribers__subscriber=self.request.user)
+        )
+
+    def with_recipes(self, queryset):
+        """
+        Добавляет авторам первые recipes_limit рецептов.
+
+        Рецепты загружаются одним запросом для всей страницы: срез
+        в Prefetch Django выполняет оконной функцией с разбиением
+        по автору. Количество рецептов хранится в CustomUser.recipes_count.
+        """
+        recipes = Recipe.objects.order_by('-created')
+        # Получаем параметр recipes_limit из запроса
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes[:int(recipes_limit)]
+        return queryset.prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
+
+    def get_author_data(self, author):
+        """Автор с рецептами из queryset with_recipes()."""
+        context = {'request': self.request}
+        author_data = UserSerializer(author, context=context).data
+        author_data['recipes'] = RecipeMinifiedSerializer(
+            author.limited_recipes, many=True, context=context
+        ).data
+        author_data['recipes_count'] = author.recipes_count
+        return author_data
 
     def list(self, request):
         """Список моих подписок. GET /api/users/subscriptions/"""
@@ -123,80 +153,54 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
         page = self.paginate_queryset(self.get_queryset())
 
         if page is not None:
-            users_with_recipes = []
-            for user in page:
-                user_data = UserSerializer(user,
-                                           context={'request': request}).data
-                user_data['recipes'] = self.get_user_recipes(user, request)
-                user_data['recipes_count'] = self.get_user_recipes_count(user)
-                users_with_recipes.append(user_data)
-
-            return self.get_paginated_response(users_with_recipes)
+            SubscriptionLoader.for_request(request).add(
+                user.pk for user in page
+            )
+            return self.get_paginated_response(
+                [self.get_author_data(user) for user in page]
+            )
 
-        return Response(users_with_recipes)
+        return Response(
+            [self.get_author_data(user) for user in self.get_queryset()]
+        )
 
     def manage_subscription(self, request, pk=None):
         """Управление подпиской: POST - подписаться, DELETE - отписаться."""
-        author = get_object_or_404(User, id=pk)
-
         if request.method == 'POST':
-            return self._subscribe(request, author)
+            return self._subscribe(request, pk)
         elif request.method == 'DELETE':
-            return self._unsubscribe(request, author)
-
-    def _subscribe(self, request, author):
-        """Подписаться на пользователя."""
-        serializer = SubscriptionSerializer(
-            data={'author': author.id},
-            context={'request': request}
-        )
+            return self._unsubscribe(request, pk)
 
-        if serializer.is_valid():
-            serializer.save()
-            author_data = UserSerializer(
-                author,
-                context={'request': request}
-            ).data
-            author_data['recipes'] = self.get_user_recipes(author, request)
-            author_data['recipes_count'] = self.get_user_recipes_count(author)
-            return Response(author_data, status=status.HTTP_201_CREATED)
-
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-    def _unsubscribe(self, request, author):
-        """Отписаться от пользователя."""
-        try:
-            subscription = Subscription.objects.get(
-                subscriber=request.user,
-                author=author
+    def _subscribe(self, request, author_id):
+        """Подписаться на пользователя (один INSERT, см. api.toggles)."""
+        if author_id == request.user.pk:
+            return Response(
+                {'non_field_errors': ['Нельзя подписаться на самого себя.']},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            subscription.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        except Subscription.DoesNotExist:
+        author, created = add_link(Subscription, 'subscriber', request.user,
+                                   'author', author_id, ('id',))
+        if author is None:
+            raise Http404
+        if not created:
             return Response(
-                {'errors': 'Вы не подписаны на этого пользователя'},
+                {'non_field_errors': [
+                    'Вы уже подписаны на этого пользователя.'
+                ]},
                 status=status.HTTP_400_BAD_REQUEST
             )
-
-    def get_user_recipes(self, user, request):
-        # Получаем параметр recipes_limit из запроса
-        recipes_limit = request.query_params.get('recipes_limit')
-
-        # Получаем рецепты пользователя
-        recipes = Recipe.objects.filter(author=user)
-
-        # Если передан limit, применяем его
-        if recipes_limit and recipes_limit.isdigit():
-            recipes = recipes[:int(recipes_limit)]
-
-        # Сериализуем рецепты
-        serializer = RecipeMinifiedSerializer(
-            recipes,
-            many=True,
-            context={'request': request}
+        author = self.with_recipes(User.objects.filter(pk=author_id)).get()
+        return Response(self.get_author_data(author),
+                        status=status.HTTP_201_CREATED)
+
+    def _unsubscribe(self, request, author_id):
+        """Отписаться от пользователя (один DELETE, см. api.toggles)."""
+        if remove_link(Subscription, 'subscriber', request.user,
+                       'author', author_id):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if not User.objects.filter(pk=author_id).exists():
+            raise Http404
+        return Response(
+            {'errors': 'Вы не подписаны на этого пользователя'},
+            status=status.HTTP_400_BAD_REQUEST
         )
-        return serializer.data
-
-    def get_user_recipes_count(self, user):
-        """Количество рецептов пользователя."""
-        return Recipe.objects.filter(author=user).count()
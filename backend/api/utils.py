@@ -1,57 +1,136 @@
 import base64
-import os
-import uuid
+import binascii
+import hashlib
+import io
 
-from core.constants import RECIEP_IMG_DIR
-from django.conf import settings
-from django.core.files.base import ContentFile
-from django.db.models import F, Sum
-from recipes.models import ShoppingCart
+from core.constants import (IMAGE_DECODE_CHUNK_SIZE, IMAGE_FORMATS,
+                            IMAGE_HEADER_SIZE, IMAGE_MAX_PIXELS,
+                            IMAGE_MAX_SIZE, MEDIA_HASH_LENGTH)
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
 
+DATA_URL_PREFIX = 'data:image/'
+BASE64_MARKER = ';base64,'
+# Пробельные символы ASCII: base64 часто переносят по строкам (MIME),
+# при декодировании они отбрасываются
+ASCII_WHITESPACE = ' \t\n\r\f\v'
+REMOVE_WHITESPACE = str.maketrans('', '', ASCII_WHITESPACE)
 
-def save_base64_image(base64_string):
-    """Сохраняет base64 изображение в файл и возвращает путь к нему."""
 
-    if not base64_string or not base64_string.startswith('data:image/'):
-        return None
+def base64_length(data_url, start):
+    """Число символов base64 после start, без пробельных символов."""
+    return len(data_url) - start - sum(
+        data_url.count(character, start) for character in ASCII_WHITESPACE
+    )
+
+
+def decoded_size(data_url, start):
+    """Размер данных после декодирования, без самого декодирования."""
+    end = len(data_url)
+    while end > start and data_url[end - 1] in ASCII_WHITESPACE:
+        end -= 1
+    padding = data_url[max(start, end - 2):end].count('=')
+    return base64_length(data_url, start) * 3 // 4 - padding
 
-    try:
-        # Извлекаем данные из base64 строки
-        format, imgstr = base64_string.split(';base64,')
-        ext = format.split('/')[-1]
 
-        # Генерируем уникальное имя файла
-        filename = f"{uuid.uuid4().hex}.{ext}"
+def base64_chunks(data_url, start):
+    """
+    Куски строки base64 после start без пробельных символов.
 
-        # Создаем путь для сохранения
-        file_path = os.path.join(settings.MEDIA_ROOT, RECIEP_IMG_DIR, filename)
-        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    Первый кусок берется из IMAGE_HEADER_SIZE символов строки,
+    остальные — из IMAGE_DECODE_CHUNK_SIZE. Длина каждого куска
+    кратна 4: символы, которые не вошли в кусок из-за переносов
+    строк, переходят в следующий. Каждый кусок декодируется отдельно.
+    """
+    rest = ''
+    offset, size = start, IMAGE_HEADER_SIZE
+    while offset < len(data_url):
+        chunk = rest + data_url[offset:offset + size].translate(
+            REMOVE_WHITESPACE
+        )
+        offset += size
+        size = IMAGE_DECODE_CHUNK_SIZE
+        cut = len(chunk) - len(chunk) % 4
+        chunk, rest = chunk[:cut], chunk[cut:]
+        if chunk:
+            yield chunk
 
-        # Декодируем и сохраняем файл
-        data = ContentFile(base64.b64decode(imgstr), name=filename)
 
-        return data
+def check_image_header(head):
+    """
+    Проверяет заголовок изображения по первым байтам файла.
 
-    except (ValueError, AttributeError, TypeError) as e:
-        raise ValueError(f"Ошибка обработки изображения: {str(e)}")
+    Pillow при открытии читает только заголовок: размеры известны
+    до декодирования пикселей. Возвращает формат (PNG, JPEG, ...).
+    """
+    try:
+        with Image.open(io.BytesIO(head)) as image:
+            image_format, (width, height) = image.format, image.size
+    except Image.DecompressionBombError:
+        raise ValueError('Слишком большое разрешение изображения')
+    except (OSError, SyntaxError):
+        raise ValueError('Файл не является изображением')
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(
+            f'Формат {image_format} не поддерживается, ожидается один из: '
+            f'{", ".join(IMAGE_FORMATS)}'
+        )
+    if width * height > IMAGE_MAX_PIXELS:
+        raise ValueError('Слишком большое разрешение изображения')
+    return image_format
 
 
-def shopping_list(user):
-    """Формируем список покупок."""
+def decode_base64_image(data_url):
+    """
+    Декодирует изображение из data URL во временный файл.
 
-    shopping_data = ShoppingCart.objects.filter(
-        user=user
-    ).values(
-        name=F('recipe__ingredient_list__ingredient__name'),
-        unit=F('recipe__ingredient_list__ingredient__measurement_unit')
-    ).annotate(
-        total_amount=Sum('recipe__ingredient_list__amount')
-    ).order_by('name')
+    До декодирования проверяются размер (по длине строки) и заголовок
+    изображения из первых IMAGE_HEADER_SIZE символов. Дальше строка
+    декодируется кусками сразу в файл, без второй копии в памяти.
+    Переносы строк и пробелы в base64 допускаются и отбрасываются.
+    Файл сохраняется в хранилище переносом (TemporaryUploadedFile).
+    Имя файла — хеш содержимого (api.media), расширение — по формату.
+    При ошибке — ValueError с описанием.
+    """
+    if not data_url or not data_url.startswith(DATA_URL_PREFIX):
+        raise ValueError(
+            'Неверный формат изображения. Ожидается base64 строка'
+        )
+    marker = data_url.find(BASE64_MARKER)
+    if marker == -1:
+        raise ValueError(
+            'Неверный формат изображения. Ожидается base64 строка'
+        )
+    content_type = data_url[len('data:'):marker]
+    start = marker + len(BASE64_MARKER)
+    if base64_length(data_url, start) % 4:
+        raise ValueError('Некорректные данные base64')
+    size = decoded_size(data_url, start)
+    if size > IMAGE_MAX_SIZE:
+        raise ValueError(
+            f'Изображение больше {IMAGE_MAX_SIZE // (1024 * 1024)} МБ'
+        )
 
-    # Создаем текстовый файл
-    content = "Список покупок:\n\n"
-    for item in shopping_data:
-        content += f"{item['name']} - {item['total_amount']} "
-        content += f"{item['unit']}\n"
+    chunks = base64_chunks(data_url, start)
+    try:
+        head = base64.b64decode(next(chunks, ''), validate=True)
+    except binascii.Error:
+        raise ValueError('Некорректные данные base64')
+    image_format = check_image_header(head)
 
-    return content
+    file = TemporaryUploadedFile('image', content_type, size, None)
+    digest = hashlib.sha256(head)
+    try:
+        file.write(head)
+        for chunk in chunks:
+            chunk = base64.b64decode(chunk, validate=True)
+            digest.update(chunk)
+            file.write(chunk)
+    except binascii.Error:
+        file.close()
+        raise ValueError('Некорректные данные base64')
+    file.name = (
+        f'{digest.hexdigest()[:MEDIA_HASH_LENGTH]}.{image_format.lower()}'
+    )
+    file.seek(0)
+    return file
@@ -1,9 +1,76 @@
 # Дериктории с изображениями
 AVATARS_DIR = 'avatars/'
 RECIEP_IMG_DIR = 'recipes/'
+# Снимки справочников (api.catalogue)
+CATALOGUE_DIR = 'catalogue/'
+# Сколько последних снимков справочника хранится (текущий и предыдущий)
+CATALOGUE_KEEP_GENERATIONS = 2
+
+# Загрузка изображений в base64: наибольший размер файла и разрешение
+IMAGE_MAX_SIZE = 7 * 1024 * 1024
+IMAGE_MAX_PIXELS = 40_000_000
+IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+# Символов base64 для проверки заголовка и в одном куске декодирования
+# (кратны 4, чтобы куски декодировались независимо)
+IMAGE_HEADER_SIZE = 256 * 1024
+IMAGE_DECODE_CHUNK_SIZE = 64 * 1024
+# Длина хеша содержимого в имени изображения (api.media), hex-символов
+MEDIA_HASH_LENGTH = 32
+
+# Уменьшенные копии изображений (api.image_variants): ширины в пикселях,
+# форматы, качество сжатия и число потоков, которые их строят
+IMAGE_VARIANTS_DIR = 'variants/'
+RECIPE_IMAGE_WIDTHS = (320, 640)
+AVATAR_IMAGE_WIDTHS = (160,)
+IMAGE_VARIANT_FORMATS = ('webp', 'jpeg')
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_WORKERS = 2
+
+# Копии изображений по запросу ?w= (api.renditions): каталог дискового
+# кеша внутри MEDIA_ROOT, ширины (запрошенная округляется вверх),
+# наибольший объем кеша и доля, до которой его очищают старые копии,
+# число файлов блокировок и как часто отмечается чтение копии (секунды)
+RENDITIONS_DIR = 'renditions/'
+RENDITION_WIDTHS = (160, 320, 480, 640, 960, 1280)
+RENDITION_CACHE_MAX_SIZE = 512 * 1024 * 1024
+RENDITION_CACHE_LOW_WATER = 0.9
+RENDITION_LOCK_STRIPES = 64
+RENDITION_TOUCH_INTERVAL = 60
 
 # Пагинация (испортируется в settings)
 PAGINATION_NUM = 6
+# Время жизни закешированного количества объектов (секунды)
+COUNT_CACHE_TIMEOUT = 60 * 60
+# Начиная с этого размера таблицы count без фильтров берется из pg_class
+APPROXIMATE_COUNT_THRESHOLD = 100_000
+
+# Время жизни закешированных ответов API для анонимных пользователей
+RESPONSE_CACHE_TIMEOUT = 60 * 60
+
+# Лента подписок: авторы с большим числом подписчиков читаются при запросе
+FEED_FANOUT_MAX_SUBSCRIBERS = 5000
+# Сколько последних рецептов автора добавляется в ленту при подписке
+FEED_BACKFILL_LIMIT = 100
+# Размер пачки строк при записи в ленты и при их очистке
+TIMELINE_BATCH_SIZE = 1000
+# Потоков для дополнения и очистки лент после подписки и отписки
+TIMELINE_WORKERS = 1
+
+# Сколько рецептов можно добавить в избранное или покупки одним запросом
+BULK_RECIPES_MAX = 100
+
+# Поиск ингредиентов (?search=): количество результатов по умолчанию
+# и наибольшее значение параметра limit
+INGREDIENT_SEARCH_LIMIT = 20
+INGREDIENT_SEARCH_MAX_LIMIT = 100
+
+# Список покупок: строк за одно чтение из БД и символов в куске ответа
+SHOPPING_LIST_FETCH_SIZE = 2000
+SHOPPING_LIST_CHUNK_SIZE = 64 * 1024
+# Время жизни закешированного списка покупок (версия корзины та же)
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60 * 24
+# Списки длиннее кешу не передаются: они только отдаются потоком
+SHOPPING_LIST_CACHE_MAX_ROWS = 5000
 
 # Переменные для моделей
 NAME_MAX_LENGTH = 256
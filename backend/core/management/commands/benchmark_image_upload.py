@@ -0,0 +1,87 @@
+import base64
+import io
+import multiprocessing
+import os
+import resource
+
+from api.utils import decode_base64_image
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+
+def current_rss():
+    """Текущий RSS процесса в КБ (Linux)."""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+
+
+def legacy_decode(data_url):
+    """Прежний способ: split, b64decode целиком и ContentFile."""
+    format, imgstr = data_url.split(';base64,')
+    return ContentFile(base64.b64decode(imgstr), name='image.png')
+
+
+def streaming_decode(data_url):
+    return decode_base64_image(data_url)
+
+
+def measure(decode, data_url, queue):
+    """Прирост пикового RSS за одну загрузку, в отдельном процессе."""
+    before = current_rss()
+    file = decode(data_url)
+    file.close()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put(peak - before)
+
+
+class Command(BaseCommand):
+    help = ('Замер пикового RSS при декодировании изображения из base64 '
+            'прежним способом и потоковым декодером')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size', type=float, default=6,
+            help='Примерный размер изображения, МБ'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=3,
+            help='Сколько раз выполнить замер для каждого способа'
+        )
+
+    def handle(self, *args, **options):
+        data_url = self.make_data_url(options['size'])
+        self.stdout.write(
+            f'data URL: {len(data_url) / 1024 / 1024:.1f} МБ символов'
+        )
+        # fork: строка уже в памяти дочернего процесса, как тело запроса
+        context = multiprocessing.get_context('fork')
+        for name, decode in (('legacy', legacy_decode),
+                             ('streaming', streaming_decode)):
+            peaks = []
+            for _ in range(options['repeat']):
+                queue = context.Queue()
+                process = context.Process(
+                    target=measure, args=(decode, data_url, queue)
+                )
+                process.start()
+                peaks.append(queue.get())
+                process.join()
+            self.stdout.write(
+                f'{name:>10}: пиковый RSS +{max(peaks) / 1024:.1f} МБ '
+                f'(мин. +{min(peaks) / 1024:.1f} МБ)'
+            )
+
+    @staticmethod
+    def make_data_url(size):
+        # Шум не сжимается: PNG примерно равен сырым пикселям
+        side = int((size * 1024 * 1024 / 3) ** 0.5)
+        image = Image.frombytes('RGB', (side, side),
+                                os.urandom(side * side * 3))
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG', compress_level=0)
+        return 'data:image/png;base64,' + base64.b64encode(
+            buffer.getvalue()
+        ).decode()
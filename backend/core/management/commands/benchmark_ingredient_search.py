@@ -0,0 +1,118 @@
+import random
+import time
+
+from api.cache import INGREDIENTS_VERSION, bump_version
+from api.filters import trigram_available
+from api.recipes import ingredient_index
+from core.constants import INGREDIENT_SEARCH_LIMIT
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from recipes.models import Ingredient
+
+SYLLABLES = ('ка', 'му', 'ро', 'ли', 'на', 'то', 'се', 'ва', 'пе', 'ре',
+             'ша', 'мо', 'ло', 'ко', 'ри', 'да', 'со', 'ты', 'чи', 'бу')
+UNITS = ('г', 'кг', 'мл', 'шт', 'ст. л.')
+PERCENTILES = (50, 95, 99)
+
+
+class Command(BaseCommand):
+    help = ('Замер времени поиска ингредиентов (?search=) '
+            'на синтетическом справочнике')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count', type=int, default=100_000,
+            help='Сколько ингредиентов добавить на время замера'
+        )
+        parser.add_argument(
+            '--queries', type=int, default=300,
+            help='Сколько запросов каждого вида выполнить'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=INGREDIENT_SEARCH_LIMIT,
+            help='Количество результатов поиска'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Данные добавляются в транзакции, которая затем откатывается
+        with transaction.atomic():
+            names = self.fill(rng, options['count'])
+            # bulk_create не отправляет сигналы: индекс сбрасывается явно
+            bump_version(INGREDIENTS_VERSION)
+            start = time.perf_counter()
+            ingredient_index.get_index()
+            build_time = (time.perf_counter() - start) * 1000
+            timings = {
+                kind: self.measure(make_query, rng, names, options)
+                for kind, make_query in (
+                    ('prefix', self.prefix_query),
+                    ('substring', self.substring_query),
+                    ('typo', self.typo_query),
+                )
+            }
+            transaction.set_rollback(True)
+        bump_version(INGREDIENTS_VERSION)
+
+        self.stdout.write(
+            f'pg_trgm: {"да" if trigram_available() else "нет"}, '
+            f'ингредиентов: {options["count"]}, '
+            f'limit: {options["limit"]}, '
+            f'построение индекса: {build_time:.0f} мс'
+        )
+        for kind, values in timings.items():
+            self.stdout.write(f'{kind:>10}: ' + ', '.join(
+                f'p{percentile} {self.percentile(values, percentile):.2f} мс'
+                for percentile in PERCENTILES
+            ))
+
+    def fill(self, rng, count):
+        names = set()
+        while len(names) < count:
+            names.add(' '.join(
+                ''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+                for _ in range(rng.randint(1, 3))
+            ))
+        names = sorted(names)
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=name, measurement_unit=rng.choice(UNITS))
+             for name in names),
+            batch_size=5000
+        )
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {Ingredient._meta.db_table}')
+        return names
+
+    def measure(self, make_query, rng, names, options):
+        timings = []
+        for _ in range(options['queries']):
+            query = make_query(rng, rng.choice(names))
+            start = time.perf_counter()
+            ingredient_index.get_index().ranked_search(query,
+                                                       options['limit'])
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    @staticmethod
+    def percentile(values, percentile):
+        values = sorted(values)
+        return values[min(len(values) - 1, len(values) * percentile // 100)]
+
+    @staticmethod
+    def prefix_query(rng, name):
+        return name[:rng.randint(2, 4)]
+
+    @staticmethod
+    def substring_query(rng, name):
+        word = max(name.split(), key=len)
+        start = rng.randint(1, max(1, len(word) - 3))
+        return word[start:start + 3]
+
+    @staticmethod
+    def typo_query(rng, name):
+        word = max(name.split(), key=len)
+        position = rng.randrange(len(word))
+        return (word[:position] + rng.choice('аеиоуя')
+                + word[position + 1:])
@@ -0,0 +1,22 @@
+from api.image_variants import KINDS, generate, needs_variants
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Построение уменьшенных копий изображений рецептов и аватарок, '
+            'загруженных до их появления')
+
+    def handle(self, *args, **options):
+        built = 0
+        for model, (file_field, state_field, _) in KINDS.items():
+            instances = model._default_manager.exclude(
+                **{file_field: ''}
+            ).only('pk', file_field, state_field)
+            for instance in instances.iterator():
+                if needs_variants(instance):
+                    # Синхронно: команда и есть фоновая работа
+                    generate(model, instance.pk)
+                    built += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано изображений: {built}')
+        )
@@ -2,6 +2,7 @@ import csv
 import os
 from pathlib import Path
 
+from api import catalogue
 from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand
 from django.db import transaction
@@ -34,6 +35,13 @@ class Command(BaseCommand):
         base_path = Path(options['path'])
         self.load_ingredients(base_path / 'ingredients.csv')
         self.load_tags(base_path / 'tags.csv')
+        transaction.on_commit(self.publish_snapshots)
+
+    def publish_snapshots(self):
+        """Снимки справочников для API (api.catalogue)."""
+        for name in catalogue.CATALOGUES:
+            digest = catalogue.publish(name)
+            self.stdout.write(f'Snapshot {name}: {digest}')
 
     def load_ingredients(self, file_path):
         """Загрузка ингридентов."""
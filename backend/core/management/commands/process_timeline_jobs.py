@@ -0,0 +1,20 @@
+from api.timeline import run_jobs
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Выполнение отложенных заданий лент подписок, которые '
+            'не выполнил фоновый поток')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Выполнить не больше этого количества заданий',
+        )
+
+    def handle(self, *args, **options):
+        processed = run_jobs(options['limit'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Выполнено заданий: {processed}')
+        )
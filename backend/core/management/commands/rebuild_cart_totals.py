@@ -0,0 +1,35 @@
+from functools import partial
+
+from api.cache import invalidate_carts
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import CartIngredient, ShoppingCart
+
+
+class Command(BaseCommand):
+    help = 'Пересчет сумм ингредиентов списков покупок из корзин'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Пересчитать только список этого пользователя (id)',
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        if user_ids is None:
+            user_ids = set(CartIngredient.objects.values_list(
+                'user_id', flat=True
+            ).distinct()) | set(ShoppingCart.objects.values_list(
+                'user_id', flat=True
+            ).distinct())
+        written = CartIngredient.objects.rebuild(options['user_ids'])
+        # Закешированные списки покупок могли собираться из неверных сумм
+        transaction.on_commit(partial(invalidate_carts, user_ids))
+        self.stdout.write(
+            self.style.SUCCESS(f'Записано сумм: {written}')
+        )
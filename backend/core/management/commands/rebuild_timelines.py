@@ -0,0 +1,23 @@
+from api.timeline import rebuild
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = 'Пересборка лент подписок из таблицы подписок'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='Пересобрать ленту только этого пользователя (id)',
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        processed = rebuild(options['user_ids'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Обработано подписок: {processed}')
+        )
@@ -0,0 +1,43 @@
+from core.models import CounterMixin
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+
+class Command(BaseCommand):
+    help = 'Поиск и исправление расхождений денормализованных счетчиков'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не исправлять',
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        total = 0
+        for model in apps.get_models():
+            if not issubclass(model, CounterMixin):
+                continue
+            for field_name, counter in model.counted_relations:
+                related_model = model._meta.get_field(
+                    field_name
+                ).related_model
+                actual = model.actual_counts(field_name)
+                drift = related_model._default_manager.annotate(
+                    actual=actual
+                ).exclude(**{counter: F('actual')}).count()
+                total += drift
+                self.stdout.write(
+                    f'{related_model._meta.label}.{counter}: '
+                    f'расхождений {drift}'
+                )
+                if drift and not options['dry_run']:
+                    # Один UPDATE на счетчик для всей таблицы
+                    related_model._default_manager.update(
+                        **{counter: actual}
+                    )
+        action = 'Найдено' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(f'{action} расхождений: {total}'))
@@ -0,0 +1,16 @@
+from api.cache import get_response_cache_stats
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Статистика кеша ответов API для анонимных пользователей'
+
+    def handle(self, *args, **options):
+        stats = get_response_cache_stats()
+        total = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / total * 100 if total else 0
+        self.stdout.write(
+            f'Hits: {stats["hits"]}\n'
+            f'Misses: {stats["misses"]}\n'
+            f'Hit rate: {hit_rate:.1f}%'
+        )
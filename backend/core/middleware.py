@@ -0,0 +1,82 @@
+"""
+Статистика запросов к базе данных для каждого HTTP-запроса.
+
+QueryStatsMiddleware считает количество запросов, их суммарное время
+и самый медленный запрос, пишет это в лог core.queries (одна JSON-строка
+на запрос с именем view) и, если включен QUERY_STATS_HEADERS,
+в заголовки ответа.
+"""
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('core.queries')
+
+# Самый медленный запрос в заголовке обрезается до этой длины
+SLOWEST_QUERY_HEADER_LENGTH = 200
+
+
+class QueryStats:
+    """Обертка execute_wrapper, собирающая статистику запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.slowest_sql = None
+        self.slowest_duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.count += 1
+            self.duration += duration
+            if self.slowest_sql is None or duration > self.slowest_duration:
+                self.slowest_sql = sql
+                self.slowest_duration = duration
+
+
+class QueryStatsMiddleware:
+    """Собирает статистику запросов к БД за время обработки запроса."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats))
+            response = self.get_response(request)
+
+        # JSON собирается, только если строка действительно попадет в лог
+        if logger.isEnabledFor(logging.INFO):
+            resolver_match = getattr(request, 'resolver_match', None)
+            logger.info(json.dumps({
+                'view': resolver_match.view_name if resolver_match else None,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': stats.count,
+                'db_time_ms': round(stats.duration * 1000, 2),
+                'slowest_ms': round(stats.slowest_duration * 1000, 2),
+                'slowest_sql': stats.slowest_sql,
+            }, ensure_ascii=False))
+
+        if settings.QUERY_STATS_HEADERS:
+            response['X-DB-Queries'] = stats.count
+            response['X-DB-Time'] = f'{stats.duration * 1000:.2f}'
+            if stats.slowest_sql is not None:
+                response['X-DB-Slowest-Time'] = (
+                    f'{stats.slowest_duration * 1000:.2f}'
+                )
+                response['X-DB-Slowest-Query'] = ' '.join(
+                    stats.slowest_sql.split()
+                )[:SLOWEST_QUERY_HEADER_LENGTH]
+        return response
@@ -0,0 +1,72 @@
+from collections import Counter, defaultdict
+
+from django.db import router, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+class CounterMixin:
+    """
+    Поддерживает счетчики связанных объектов (денормализация COUNT).
+
+    counted_relations — пары (внешний ключ, поле-счетчик связанной
+    модели). Счетчик увеличивается атомарным F() в той же транзакции,
+    что и вставка строки, и уменьшается сигналом post_delete
+    (core.signals), который Django отправляет внутри транзакции удаления.
+    bulk_create и update() счетчики не обновляют: расхождения
+    исправляет команда repair_counters.
+    """
+
+    counted_relations = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self
+        )
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            self.update_counters(1)
+
+    def update_counters(self, delta):
+        """Изменяет счетчики всех связанных объектов на delta."""
+        for field_name, counter in self.counted_relations:
+            field = self._meta.get_field(field_name)
+            field.related_model._default_manager.using(
+                self._state.db
+            ).filter(pk=getattr(self, field.attname)).update(
+                **{counter: F(counter) + delta}
+            )
+
+    @classmethod
+    def bulk_update_counters(cls, instances, delta, using=None):
+        """
+        Изменяет счетчики сразу для многих строк.
+
+        Связанные объекты группируются по числу строк, которые на них
+        ссылаются, и на каждую такую группу выполняется один UPDATE.
+        """
+        instances = list(instances)
+        for field_name, counter in cls.counted_relations:
+            field = cls._meta.get_field(field_name)
+            by_count = defaultdict(list)
+            for pk, count in Counter(
+                getattr(instance, field.attname) for instance in instances
+            ).items():
+                by_count[count].append(pk)
+            for count, pks in by_count.items():
+                field.related_model._default_manager.using(using).filter(
+                    pk__in=pks
+                ).update(**{counter: F(counter) + count * delta})
+
+    @classmethod
+    def actual_counts(cls, field_name):
+        """Подзапрос с настоящим значением счетчика для OuterRef('pk')."""
+        return Coalesce(Subquery(
+            cls._default_manager.filter(
+                **{field_name: OuterRef('pk')}
+            ).order_by().values(field_name).annotate(
+                count=Count('pk')
+            ).values('count')
+        ), Value(0))
@@ -0,0 +1,16 @@
+from django.apps import apps
+from django.db.models.signals import post_delete
+
+from .models import CounterMixin
+
+
+def decrement_counters(sender, instance, **kwargs):
+    """Уменьшает счетчики при удалении, в том числе каскадном."""
+    instance.update_counters(-1)
+
+
+# Приемник подключается только к моделям со счетчиками: приемник
+# post_delete без sender отключил бы быстрое удаление для всех моделей
+for model in apps.get_models():
+    if issubclass(model, CounterMixin):
+        post_delete.connect(decrement_counters, sender=model)
@@ -9,6 +9,19 @@ SECRET_KEY = os.getenv('SECRET_KEY', 'SECRET')
 
 DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
 
+# Быстрое чтение рецептов без сериализаторов DRF (api.recipes.fast_read)
+RECIPES_FAST_READ = os.getenv('RECIPES_FAST_READ', 'False').lower() == 'true'
+
+# Заголовки X-DB-* со статистикой запросов к БД (core.middleware)
+QUERY_STATS_HEADERS = os.getenv(
+    'QUERY_STATS_HEADERS', 'False'
+).lower() == 'true'
+
+# Шрифт TrueType с кириллицей для списка покупок в PDF (api.pdf)
+PDF_FONT_PATH = os.getenv(
+    'PDF_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 # Получаем ALLOWED_HOSTS из .env
 allowed_hosts_str = os.getenv('ALLOWED_HOSTS', '')
 if allowed_hosts_str:
@@ -33,6 +46,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
@@ -61,6 +75,7 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'core.middleware.QueryStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -104,6 +119,41 @@ DATABASES = {
 }
 
 
+# Cache
+# Кеш хранит ответы API и версии для их сброса, поэтому в production
+# все процессы должны использовать общий backend (Redis, Memcached и т.п.)
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+
+# Logging
+# Статистика запросов к БД пишется в core.queries на уровне INFO
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core.queries': {
+            'handlers': ['console'],
+            'level': os.getenv('QUERY_STATS_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -1,8 +1,12 @@
+import re
+
 from api.recipes.views import recipe_short_link_redirect
+from api.renditions import image_response
+from core.constants import AVATARS_DIR, RECIEP_IMG_DIR
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -16,6 +20,18 @@ urlpatterns += [
          name='recipe-short-link'),
 ]
 
+# Изображения рецептов и аватарки: nginx передает сюда запросы с ?w=
+# (уменьшенные копии, api.renditions)
+urlpatterns += [
+    re_path(
+        rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}'
+        rf'(?P<name>(?:{re.escape(RECIEP_IMG_DIR)}|{re.escape(AVATARS_DIR)})'
+        r'[^/]+)$',
+        image_response,
+        name='media-image'
+    ),
+]
+
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL,
                           document_root=settings.MEDIA_ROOT)
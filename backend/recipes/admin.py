@@ -1,5 +1,9 @@
+from functools import partial
+
+from api import catalogue
 from django.contrib import admin
 from django.contrib.auth import get_user_model
+from django.db import transaction
 
 from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
                      ShoppingCart, Tag)
@@ -7,10 +11,35 @@ from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
 User = get_user_model()
 
 
+class CatalogueAdmin(admin.ModelAdmin):
+    """Публикует снимок справочника (api.catalogue) после изменений."""
+
+    catalogue_name = None
+
+    def publish_snapshot(self):
+        transaction.on_commit(
+            partial(catalogue.publish, self.catalogue_name)
+        )
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        self.publish_snapshot()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.publish_snapshot()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        self.publish_snapshot()
+
+
 @admin.register(Tag)
-class TagAdmin(admin.ModelAdmin):
+class TagAdmin(CatalogueAdmin):
     """Админка для тегов."""
 
+    catalogue_name = 'tags'
+
     list_display = ('id', 'name', 'slug')
     list_display_links = ('id', 'name',)
     search_fields = ('name', 'slug')
@@ -19,9 +48,11 @@ class TagAdmin(admin.ModelAdmin):
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(CatalogueAdmin):
     """Админка для ингредиентов."""
 
+    catalogue_name = 'ingredients'
+
     list_display = ('name', 'measurement_unit')
     list_display_links = ('name',)
     search_fields = ('name',)
@@ -56,7 +87,7 @@ class RecipeAdmin(admin.ModelAdmin):
     search_fields = ('name', 'author__username', 'text')
     list_filter = ('tags', 'created', 'cooking_time')
     filter_horizontal = ('tags',)
-    readonly_fields = ('created',)
+    readonly_fields = ('created', 'favorites_count')
     inlines = [IngredientInRecipeInline]
     ordering = ('-created',)
 
@@ -69,11 +100,6 @@ class RecipeAdmin(admin.ModelAdmin):
         return obj.ingredient_list.count()
     ingredients_count.short_description = 'Ингредиенты'
 
-    def favorites_count(self, obj):
-        """Отображает количество добавлений рецепта в избранное."""
-        return obj.favorites.count()
-    favorites_count.short_description = 'В избранном'
-
 
 @admin.register(IngredientInRecipe)
 class IngredientInRecipeAdmin(admin.ModelAdmin):
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_modified'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-created', '-id'], name='recipe_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-created'], name='recipe_author_created_idx'),
+        ),
+        # Автоматическая таблица recipes_recipe_tags имеет уникальный индекс
+        # (recipe_id, tag_id); для фильтра по тегам нужен и обратный порядок.
+        migrations.RunSQL(
+            sql='CREATE INDEX recipe_tags_tag_recipe_idx '
+                'ON recipes_recipe_tags (tag_id, recipe_id);',
+            reverse_sql='DROP INDEX recipe_tags_tag_recipe_idx;',
+        ),
+    ]
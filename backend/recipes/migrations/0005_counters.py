@@ -0,0 +1,52 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# (модель со строками, внешний ключ, модель со счетчиком, счетчик)
+COUNTERS = (
+    ('recipes.Recipe', 'author', 'users.CustomUser', 'recipes_count'),
+    ('recipes.Favorite', 'user', 'users.CustomUser', 'favorites_count'),
+    ('recipes.Favorite', 'recipe', 'recipes.Recipe', 'favorites_count'),
+    ('recipes.ShoppingCart', 'user', 'users.CustomUser',
+     'shopping_cart_count'),
+    ('recipes.ShoppingCart', 'recipe', 'recipes.Recipe',
+     'shopping_cart_count'),
+    ('users.Subscription', 'subscriber', 'users.CustomUser',
+     'subscriptions_count'),
+    ('users.Subscription', 'author', 'users.CustomUser',
+     'subscribers_count'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for source, field_name, target, counter in COUNTERS:
+        source_model = apps.get_model(source)
+        apps.get_model(target).objects.update(**{counter: Coalesce(Subquery(
+            source_model.objects.filter(
+                **{field_name: OuterRef('pk')}
+            ).order_by().values(field_name).annotate(
+                count=Count('pk')
+            ).values('count')
+        ), Value(0))})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_timelineentry'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
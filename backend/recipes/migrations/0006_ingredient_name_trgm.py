@@ -0,0 +1,43 @@
+from django.db import migrations
+
+INDEX_NAME = 'ingredient_name_trgm_idx'
+
+
+def create_trigram_index(apps, schema_editor):
+    """
+    GIN-индекс триграмм по UPPER(name) для поиска ингредиентов.
+
+    Выражение совпадает с тем, что Django строит для icontains,
+    поэтому индекс работает и для подстрок, и для оператора %.
+    Если расширения pg_trgm на сервере нет, поиск работает без
+    нечетких совпадений (api.filters.IngredientFilter).
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm;')
+    schema_editor.execute(
+        f'CREATE INDEX {INDEX_NAME} ON recipes_ingredient '
+        f'USING gin (UPPER(name) gin_trgm_ops);'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME};')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
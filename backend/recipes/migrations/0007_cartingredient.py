@@ -0,0 +1,55 @@
+# Generated by Django 5.2.5 on 2026-10-17 08:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+BATCH_SIZE = 1000
+
+
+def fill_cart_totals(apps, schema_editor):
+    """Суммы ингредиентов для уже заполненных корзин."""
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    CartIngredient = apps.get_model('recipes', 'CartIngredient')
+    totals = ShoppingCart.objects.values(
+        'user_id', 'recipe__ingredient_list__ingredient_id'
+    ).exclude(
+        recipe__ingredient_list__ingredient_id=None
+    ).annotate(
+        amount=Sum('recipe__ingredient_list__amount')
+    ).order_by().iterator(chunk_size=BATCH_SIZE)
+    CartIngredient.objects.bulk_create(
+        (CartIngredient(
+            user_id=total['user_id'],
+            ingredient_id=total['recipe__ingredient_list__ingredient_id'],
+            amount=total['amount']
+        ) for total in totals),
+        batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_ingredient_name_trgm'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_ingredients', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в списке покупок',
+                'verbose_name_plural': 'Ингредиенты в списках покупок',
+                'constraints': [models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_cart_ingredient')],
+            },
+        ),
+        migrations.RunPython(fill_cart_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-17 14:05
+
+from django.db import migrations, models
+
+
+def copy_created(apps, schema_editor):
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    TimelineEntry.objects.update(created=models.Subquery(
+        Recipe.objects.filter(
+            pk=models.OuterRef('recipe_id')
+        ).values('created')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_image_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='timelineentry',
+            name='created',
+            field=models.DateTimeField(help_text='Копия Recipe.created: ключ сортировки ленты', null=True, verbose_name='Дата создания рецепта'),
+        ),
+        migrations.RunPython(copy_created, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='timelineentry',
+            name='created',
+            field=models.DateTimeField(help_text='Копия Recipe.created: ключ сортировки ленты', verbose_name='Дата создания рецепта'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-created', '-recipe'], name='timeline_user_created_idx'),
+        ),
+    ]
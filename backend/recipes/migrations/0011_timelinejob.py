@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-17 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_timelineentry_created'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipe_id', models.PositiveBigIntegerField(blank=True, help_text='Новый рецепт для раскладки по лентам подписчиков', null=True, verbose_name='Рецепт')),
+                ('subscriber_id', models.PositiveBigIntegerField(blank=True, help_text='Лента, которую нужно привести в соответствие с подпиской', null=True, verbose_name='Подписчик')),
+                ('author_id', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='Автор')),
+            ],
+            options={
+                'verbose_name': 'Задание ленты',
+                'verbose_name_plural': 'Задания лент',
+            },
+        ),
+    ]
@@ -1,7 +1,11 @@
+from collections import defaultdict
+
 import core.constants as constants
+from core.models import CounterMixin
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models import Exists, OuterRef, Value
 from django.utils.crypto import get_random_string
 from django.utils.text import slugify
 
@@ -23,6 +27,10 @@ class Tag(models.Model):
         null=True,
         blank=True
     )
+    modified = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
 
     class Meta:
         verbose_name = 'Тег'
@@ -57,6 +65,10 @@ class Ingredient(models.Model):
         'Единица измерения',
         max_length=constants.MEASURE_MAX_LENGTH
     )
+    modified = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
@@ -68,9 +80,35 @@ class Ingredient(models.Model):
         return f'{self.name} ({self.measurement_unit})'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    """QuerySet рецептов."""
+
+    def with_user_flags(self, user):
+        """Аннотирует is_favorited и is_in_shopping_cart для пользователя.
+
+        Флаги вычисляются подзапросами EXISTS в том же запросе,
+        что и сами рецепты, без отдельного запроса на каждый рецепт.
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False)
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        )
+
+
+class Recipe(CounterMixin, models.Model):
     """Модель рецепта с короткой ссылкой."""
 
+    counted_relations = (('author', 'recipes_count'),)
+
     name = models.CharField(
         'Название',
         max_length=constants.NAME_MAX_LENGTH,
@@ -89,6 +127,10 @@ class Recipe(models.Model):
         'Изображение',
         upload_to=constants.RECIEP_IMG_DIR
     )
+    # Заполняет api.image_variants, когда уменьшенные копии готовы
+    image_variants = models.JSONField(
+        'Копии изображения', default=dict, blank=True, editable=False
+    )
     cooking_time = models.PositiveSmallIntegerField(
         'Время приготовления (минуты)',
         validators=[MinValueValidator(1)]
@@ -106,8 +148,12 @@ class Recipe(models.Model):
     )
     created = models.DateTimeField(
         'Дата создания',
-        auto_now_add=True,
-        db_index=True  # Добавляем индекс для оптимизации запросов
+        auto_now_add=True
+    )
+    modified = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+        help_text='Обновляется и при изменении ингредиентов и тегов рецепта'
     )
     short_link = models.CharField(
         'Короткая ссылка',
@@ -116,11 +162,32 @@ class Recipe(models.Model):
         blank=True,
         help_text='Уникальная короткая ссылка для рецепта'
     )
+    # Счетчики обновляются CounterMixin моделей Favorite и ShoppingCart
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        'В списках покупок', default=0, editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-created']
+        indexes = [
+            # Сортировка ленты и keyset-пагинация по (-created, -id)
+            models.Index(
+                fields=['-created', '-id'], name='recipe_created_id_idx'
+            ),
+            # Фильтр по автору с той же сортировкой
+            models.Index(
+                fields=['author', '-created'], name='recipe_author_created_idx'
+            ),
+            # Проверка ссылок на файл перед удалением (api.media)
+            models.Index(fields=['image'], name='recipe_image_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -173,9 +240,14 @@ class IngredientInRecipe(models.Model):
         return f'{self.ingredient.name} в {self.recipe.name}'
 
 
-class Favorite(models.Model):
+class Favorite(CounterMixin, models.Model):
     """Модель для избранных рецептов."""
 
+    counted_relations = (
+        ('user', 'favorites_count'),
+        ('recipe', 'favorites_count'),
+    )
+
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -205,8 +277,19 @@ class Favorite(models.Model):
         return f'{self.user.username} - {self.recipe.name}'
 
 
-class ShoppingCart(models.Model):
-    """Модель для списка покупок."""
+class ShoppingCart(CounterMixin, models.Model):
+    """
+    Модель для списка покупок.
+
+    Суммы ингредиентов корзины (CartIngredient) обновляются вместе
+    со счетчиками: при добавлении и удалении строки, в том числе
+    каскадном и пакетном (api.toggles).
+    """
+
+    counted_relations = (
+        ('user', 'shopping_cart_count'),
+        ('recipe', 'shopping_cart_count'),
+    )
 
     user = models.ForeignKey(
         User,
@@ -235,3 +318,239 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user.username} - {self.recipe.name}'
+
+    def update_counters(self, delta):
+        super().update_counters(delta)
+        CartIngredient.objects.db_manager(self._state.db).add_recipes(
+            self.user_id, [self.recipe_id], delta
+        )
+
+    @classmethod
+    def bulk_update_counters(cls, instances, delta, using=None):
+        instances = list(instances)
+        super().bulk_update_counters(instances, delta, using)
+        recipes_by_user = defaultdict(list)
+        for instance in instances:
+            recipes_by_user[instance.user_id].append(instance.recipe_id)
+        for user_id, recipe_ids in recipes_by_user.items():
+            CartIngredient.objects.db_manager(using).add_recipes(
+                user_id, recipe_ids, delta
+            )
+
+
+class CartIngredientManager(models.Manager):
+    """
+    Изменение сумм ингредиентов корзины одним запросом.
+
+    Суммы меняются INSERT ... ON CONFLICT DO UPDATE (есть в PostgreSQL
+    и SQLite), строки с нулевой суммой удаляются.
+    """
+
+    def _tables(self):
+        quote = connections[self.db].ops.quote_name
+        return {
+            'totals': quote(self.model._meta.db_table),
+            'cart': quote(ShoppingCart._meta.db_table),
+            'ingredients': quote(IngredientInRecipe._meta.db_table),
+        }
+
+    def _execute(self, sql, params):
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql.format(**self._tables()), params)
+            return cursor.rowcount
+
+    def _add(self, select, params):
+        """Прибавляет к суммам строки (user_id, ingredient_id, amount)."""
+        return self._execute(
+            f'INSERT INTO {{totals}} (user_id, ingredient_id, amount) {select}'
+            ' ON CONFLICT (user_id, ingredient_id)'
+            ' DO UPDATE SET amount = {totals}.amount + excluded.amount',
+            params
+        )
+
+    def _delete_empty(self, where, params):
+        self._execute(
+            'DELETE FROM {totals} WHERE amount <= 0 AND ' + where, params
+        )
+
+    def add_recipes(self, user_id, recipe_ids, delta):
+        """Добавляет (delta=1) или убирает (-1) рецепты из корзины."""
+        if not recipe_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        changed = self._add(
+            'SELECT %s, ingredient_id, %s * SUM(amount) FROM {ingredients}'
+            f' WHERE recipe_id IN ({placeholders}) GROUP BY ingredient_id',
+            [user_id, delta, *recipe_ids]
+        )
+        if changed and delta < 0:
+            self._delete_empty('user_id = %s', [user_id])
+
+    def add_ingredient(self, recipe_id, ingredient_id, amount):
+        """
+        Изменяет количество ингредиента рецепта на amount у всех,
+        у кого рецепт в корзине.
+        """
+        changed = self._add(
+            'SELECT user_id, %s, %s FROM {cart} WHERE recipe_id = %s',
+            [ingredient_id, amount, recipe_id]
+        )
+        if changed and amount < 0:
+            self._delete_empty(
+                'ingredient_id = %s AND user_id IN'
+                ' (SELECT user_id FROM {cart} WHERE recipe_id = %s)',
+                [ingredient_id, recipe_id]
+            )
+
+    def rebuild(self, user_ids=None):
+        """
+        Пересчитывает суммы из корзин (всех или только user_ids).
+
+        Возвращает количество записанных строк.
+        """
+        where, params = '', []
+        if user_ids is not None:
+            params = list(user_ids)
+            if not params:
+                return 0
+            where = ' WHERE {{}}user_id IN ({})'.format(
+                ', '.join(['%s'] * len(params))
+            )
+        self._execute('DELETE FROM {totals}' + where.format(''), params)
+        return self._execute(
+            'INSERT INTO {totals} (user_id, ingredient_id, amount)'
+            ' SELECT cart.user_id, item.ingredient_id, SUM(item.amount)'
+            ' FROM {cart} cart'
+            ' JOIN {ingredients} item ON item.recipe_id = cart.recipe_id'
+            f'{where.format("cart.")}'
+            ' GROUP BY cart.user_id, item.ingredient_id',
+            params
+        )
+
+
+class CartIngredient(models.Model):
+    """
+    Сумма ингредиента по всем рецептам в корзине пользователя.
+
+    Поддерживается при изменении корзины (ShoppingCart) и ингредиентов
+    рецептов в корзине (api.signals), поэтому список покупок читается
+    без группировки. Расхождения исправляет команда rebuild_cart_totals.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_ingredients',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField('Количество')
+
+    objects = CartIngredientManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_cart_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} - {self.ingredient_id}: {self.amount}'
+
+
+class TimelineEntry(models.Model):
+    """
+    Рецепт в ленте подписок пользователя.
+
+    Строки создаются при публикации рецепта для всех подписчиков автора
+    (fan-out-on-write). Рецепты популярных авторов сюда не попадают
+    и добавляются в ленту при чтении (api.timeline).
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+        help_text='Копия автора рецепта для очистки ленты при отписке'
+    )
+    created = models.DateTimeField(
+        'Дата создания рецепта',
+        help_text='Копия Recipe.created: ключ сортировки ленты'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', 'author']),
+            # Страница ленты — проход по индексу от позиции курсора
+            models.Index(
+                fields=['user', '-created', '-recipe'],
+                name='timeline_user_created_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} - {self.recipe_id}'
+
+
+class TimelineJob(models.Model):
+    """
+    Отложенное обновление лент подписок (api.timeline).
+
+    Строка пишется в транзакции запроса и удаляется после выполнения:
+    работа, которую не успел сделать фоновый поток (перезапуск
+    процесса), остается в таблице и выполняется командой
+    process_timeline_jobs. Ссылки хранятся числами, без внешних
+    ключей: задание на очистку ленты переживает удаление подписчика
+    или автора в той же транзакции.
+    """
+
+    recipe_id = models.PositiveBigIntegerField(
+        'Рецепт', null=True, blank=True,
+        help_text='Новый рецепт для раскладки по лентам подписчиков'
+    )
+    subscriber_id = models.PositiveBigIntegerField(
+        'Подписчик', null=True, blank=True,
+        help_text='Лента, которую нужно привести в соответствие с подпиской'
+    )
+    author_id = models.PositiveBigIntegerField(
+        'Автор', null=True, blank=True
+    )
+
+    class Meta:
+        verbose_name = 'Задание ленты'
+        verbose_name_plural = 'Задания лент'
+
+    def __str__(self):
+        if self.recipe_id is not None:
+            return f'рецепт {self.recipe_id}'
+        return f'{self.subscriber_id} - {self.author_id}'
@@ -1,7 +1,11 @@
 import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from django.urls import reverse
 
+from users.models import Subscription
+
 pytestmark = pytest.mark.django_db
 
 
@@ -263,3 +267,97 @@ class TestSubscriptions:
         assert response.status_code == status.HTTP_400_BAD_REQUEST, (
             'Отписка без подписки должна возвращать ошибку 400'
         )
+
+
+class TestIsSubscribed:
+    """Тесты поля is_subscribed."""
+
+    def test_is_subscribed_in_users_list(self, authenticated_client,
+                                         create_user):
+        client, subscriber = authenticated_client
+        followed = create_user(email='followed@example.com',
+                               username='followed')
+        other = create_user(email='other@example.com', username='other')
+        Subscription.objects.create(subscriber=subscriber, author=followed)
+
+        response = client.get(reverse('users-list'))
+        flags = {
+            user['id']: user['is_subscribed']
+            for user in response.data['results']
+        }
+        assert flags[followed.id] is True, (
+            'is_subscribed должен быть True для автора из подписок'
+        )
+        assert flags[other.id] is False, (
+            'is_subscribed должен быть False для остальных пользователей'
+        )
+
+    def test_subscriptions_loaded_once(self, authenticated_client,
+                                       create_user):
+        """Подписки проверяются одним запросом на всю страницу."""
+        client, subscriber = authenticated_client
+        for index in range(5):
+            author = create_user(email=f'author{index}@example.com',
+                                 username=f'author{index}')
+            Subscription.objects.create(subscriber=subscriber, author=author)
+
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(reverse('subscriptions-list'))
+
+        assert response.status_code == status.HTTP_200_OK
+        subscription_queries = [
+            query for query in context.captured_queries
+            if query['sql'].startswith(
+                'SELECT "users_subscription"."author_id"'
+            )
+        ]
+        assert len(subscription_queries) == 1, (
+            'Подписки должны проверяться одним запросом'
+        )
+        assert all(user['is_subscribed'] for user in response.data['results'])
+
+
+class TestSubscriptionsList:
+    """Тесты списка подписок с рецептами авторов."""
+
+    url = reverse('subscriptions-list')
+
+    def subscribe(self, subscriber, create_user, create_recipe, count):
+        for index in range(count):
+            author = create_user(email=f'author{index}@example.com',
+                                 username=f'author{index}')
+            Subscription.objects.create(subscriber=subscriber, author=author)
+            for number in range(index + 1):
+                create_recipe(author, name=f'Рецепт {number}')
+
+    def test_recipes_and_count(self, authenticated_client, create_user,
+                               create_recipe):
+        client, subscriber = authenticated_client
+        self.subscribe(subscriber, create_user, create_recipe, 3)
+
+        response = client.get(f'{self.url}?recipes_limit=2')
+        assert response.status_code == status.HTTP_200_OK
+        for index, author in enumerate(response.data['results']):
+            assert author['recipes_count'] == index + 1, (
+                'recipes_count должен учитывать все рецепты автора'
+            )
+            assert len(author['recipes']) == min(index + 1, 2), (
+                'Рецептов должно быть не больше recipes_limit'
+            )
+            assert set(author['recipes'][0]) == {
+                'id', 'name', 'image', 'image_variants', 'cooking_time'
+            }
+        newest = response.data['results'][2]['recipes']
+        assert [recipe['name'] for recipe in newest] == [
+            'Рецепт 2', 'Рецепт 1'
+        ], 'Рецепты должны идти от новых к старым'
+
+    def test_constant_queries(self, authenticated_client, create_user,
+                              create_recipe, query_budget):
+        """Число запросов не зависит от числа авторов."""
+        client, subscriber = authenticated_client
+        self.subscribe(subscriber, create_user, create_recipe, 5)
+
+        with query_budget(4):
+            response = client.get(f'{self.url}?recipes_limit=3')
+        assert len(response.data['results']) == 5
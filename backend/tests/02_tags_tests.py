@@ -11,16 +11,18 @@ class TestTagsAPI:
         """Проверка получения списка тегов."""
         url = reverse('tags-list')
         response = client.get(url)
+        # Список отдается готовым снимком справочника (api.catalogue)
+        data = response.json()
 
         assert response.status_code == status.HTTP_200_OK, (
             'Статус код ответа должен быть 200 при получении списка тегов'
         )
-        assert len(response.data) == 3, (
+        assert len(data) == 3, (
             'В ответе должно быть 3 тега, соответствующих количеству фикстур'
         )
 
         # Проверяем, что все теги присутствуют в ответе
-        tag_names = [tag['name'] for tag in response.data]
+        tag_names = [tag['name'] for tag in data]
         assert 'Завтрак' in tag_names, (
             'Тег "Завтрак" должен присутствовать в списке тегов'
         )
@@ -32,7 +34,7 @@ class TestTagsAPI:
         )
 
         # Проверяем структуру ответа
-        for tag in response.data:
+        for tag in data:
             assert 'id' in tag, (
                 'Каждый тег в ответе должен содержать поле "id"'
             )
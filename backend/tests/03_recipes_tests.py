@@ -0,0 +1,442 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+
+from api.pagination import CustomPageNumberPagination
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+
+pytestmark = pytest.mark.django_db
+
+
+class TestRecipeUserFlags:
+    """Тесты флагов is_favorited и is_in_shopping_cart."""
+
+    url = reverse('recipe-list')
+
+    def test_flags_for_authenticated_user(self, authenticated_client,
+                                          create_recipe):
+        client, user = authenticated_client
+        favorite = create_recipe(user, name='Избранный')
+        in_cart = create_recipe(user, name='В корзине')
+        create_recipe(user, name='Обычный')
+        Favorite.objects.create(user=user, recipe=favorite)
+        ShoppingCart.objects.create(user=user, recipe=in_cart)
+
+        response = client.get(self.url)
+        assert response.status_code == status.HTTP_200_OK, (
+            'Список рецептов должен быть доступен'
+        )
+        flags = {
+            recipe['name']: (recipe['is_favorited'],
+                             recipe['is_in_shopping_cart'])
+            for recipe in response.data['results']
+        }
+        assert flags == {
+            'Избранный': (True, False),
+            'В корзине': (False, True),
+            'Обычный': (False, False),
+        }, 'Флаги рецептов вычислены неверно'
+
+    def test_flags_for_anonymous_user(self, api_client, create_user,
+                                      create_recipe):
+        create_recipe(create_user())
+
+        response = api_client.get(self.url)
+        recipe = response.data['results'][0]
+        assert recipe['is_favorited'] is False
+        assert recipe['is_in_shopping_cart'] is False
+
+    def test_flags_do_not_depend_on_page_size(self, authenticated_client,
+                                              create_recipe):
+        """Число запросов не должно расти вместе с числом рецептов."""
+        client, user = authenticated_client
+        for _ in range(2):
+            Favorite.objects.create(user=user, recipe=create_recipe(user))
+
+        with CaptureQueriesContext(connection) as small_page:
+            client.get(self.url)
+
+        for _ in range(4):
+            Favorite.objects.create(user=user, recipe=create_recipe(user))
+
+        with CaptureQueriesContext(connection) as full_page:
+            client.get(self.url)
+
+        def flag_queries(context):
+            return [
+                query for query in context.captured_queries
+                if 'recipes_favorite' in query['sql']
+                or 'recipes_shoppingcart' in query['sql']
+            ]
+
+        assert len(flag_queries(full_page)) == len(flag_queries(small_page)), (
+            'Флаги рецептов не должны запрашиваться для каждого рецепта'
+        )
+
+
+class TestRecipeCursorPagination:
+    """Тесты курсорной пагинации рецептов."""
+
+    url = reverse('recipe-list')
+
+    def collect(self, client, url):
+        """Проходит по всем страницам и возвращает id рецептов."""
+        ids = []
+        while url:
+            response = client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            assert 'count' not in response.data, (
+                'Курсорная пагинация не должна считать COUNT(*)'
+            )
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_cursor_walks_all_recipes(self, api_client, create_user,
+                                      create_recipe):
+        author = create_user()
+        recipes = [create_recipe(author) for _ in range(5)]
+
+        ids = self.collect(api_client, f'{self.url}?pagination=cursor&limit=2')
+        assert ids == [recipe.id for recipe in reversed(recipes)], (
+            'Курсор должен выдать все рецепты от новых к старым без повторов'
+        )
+
+    def test_cursor_with_filters(self, authenticated_client, create_recipe,
+                                 tag_lunch):
+        client, user = authenticated_client
+        expected = []
+        for index in range(6):
+            recipe = create_recipe(user)
+            if index % 2:
+                recipe.tags.add(tag_lunch)
+                Favorite.objects.create(user=user, recipe=recipe)
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+                expected.append(recipe.id)
+        expected.reverse()
+
+        ids = self.collect(
+            client,
+            f'{self.url}?pagination=cursor&limit=2&author={user.id}'
+            '&tags=lunch&tags=breakfast&is_favorited=1&is_in_shopping_cart=1'
+        )
+        assert ids == expected, (
+            'Курсорная пагинация должна учитывать все фильтры'
+        )
+
+    def test_previous_link(self, api_client, create_user, create_recipe):
+        author = create_user()
+        for _ in range(3):
+            create_recipe(author)
+
+        first = api_client.get(f'{self.url}?pagination=cursor&limit=2')
+        second = api_client.get(first.data['next'])
+        back = api_client.get(second.data['previous'])
+
+        assert back.data['results'] == first.data['results'], (
+            'Ссылка previous должна возвращать на предыдущую страницу'
+        )
+
+
+class TestRecipeCount:
+    """Тесты кеширования количества рецептов."""
+
+    url = reverse('recipe-list')
+
+    @staticmethod
+    def count_queries(context):
+        return [
+            query for query in context.captured_queries
+            if 'COUNT(' in query['sql']
+        ]
+
+    def test_count_is_cached(self, api_client, create_user, create_recipe):
+        create_recipe(create_user())
+        api_client.get(self.url)
+
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get(self.url)
+
+        assert response.data['count'] == 1
+        assert response['X-Count-Exact'] == 'true'
+        assert not self.count_queries(context), (
+            'Повторный запрос не должен пересчитывать количество рецептов'
+        )
+
+    def test_count_invalidated_on_changes(self, authenticated_client,
+                                          create_recipe, tag_lunch):
+        client, user = authenticated_client
+        recipe = create_recipe(user)
+        assert client.get(self.url).data['count'] == 1
+
+        create_recipe(user)
+        assert client.get(self.url).data['count'] == 2, (
+            'Новый рецепт должен сбрасывать кеш количества'
+        )
+
+        favorites_url = f'{self.url}?is_favorited=1'
+        assert client.get(favorites_url).data['count'] == 0
+        Favorite.objects.create(user=user, recipe=recipe)
+        assert client.get(favorites_url).data['count'] == 1, (
+            'Изменение избранного должно сбрасывать кеш количества'
+        )
+
+        cart_url = f'{self.url}?is_in_shopping_cart=1'
+        assert client.get(cart_url).data['count'] == 0
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+        assert client.get(cart_url).data['count'] == 1, (
+            'Изменение корзины должно сбрасывать кеш количества'
+        )
+
+        tags_url = f'{self.url}?tags=lunch'
+        assert client.get(tags_url).data['count'] == 0
+        recipe.tags.add(tag_lunch)
+        assert client.get(tags_url).data['count'] == 1, (
+            'Изменение тегов должно сбрасывать кеш количества'
+        )
+
+        recipe.delete()
+        assert client.get(self.url).data['count'] == 1, (
+            'Удаление рецепта должно сбрасывать кеш количества'
+        )
+
+    def test_count_invalidated_on_tag_delete(self, api_client, create_user,
+                                             create_recipe, tag_lunch):
+        create_recipe(create_user()).tags.add(tag_lunch)
+        url = f'{self.url}?tags=lunch'
+        assert api_client.get(url).data['count'] == 1
+
+        tag_lunch.delete()
+        assert api_client.get(url).data['count'] == 0, (
+            'Удаление тега должно сбрасывать кеш количества'
+        )
+
+    def test_count_depends_on_viewer(self, api_client, create_user,
+                                     create_recipe):
+        first = create_user()
+        second = create_user(email='second@example.com', username='second')
+        Favorite.objects.create(user=first, recipe=create_recipe(first))
+        url = f'{self.url}?is_favorited=1'
+
+        api_client.force_authenticate(user=first)
+        assert api_client.get(url).data['count'] == 1
+        api_client.force_authenticate(user=second)
+        assert api_client.get(url).data['count'] == 0, (
+            'Кеш количества избранного не должен делиться между пользователями'
+        )
+
+    @pytest.mark.skipif(connection.vendor != 'postgresql',
+                        reason='Оценка reltuples есть только в PostgreSQL')
+    def test_approximate_count(self, api_client, create_user, create_recipe,
+                               monkeypatch):
+        author = create_user()
+        for _ in range(3):
+            create_recipe(author)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE recipes_recipe')
+        monkeypatch.setattr(CustomPageNumberPagination,
+                            'approximate_count_threshold', 1)
+
+        response = api_client.get(self.url)
+        assert response['X-Count-Exact'] == 'false', (
+            'Для большой таблицы без фильтров количество должно быть оценкой'
+        )
+        assert response.data['count'] == 3
+
+        response = api_client.get(f'{self.url}?author={author.id}')
+        assert response['X-Count-Exact'] == 'true', (
+            'С фильтрами количество должно оставаться точным'
+        )
+
+
+class TestRecipeFilters:
+    """Тесты фильтров списка рецептов."""
+
+    url = reverse('recipe-list')
+
+    def test_tags_filter_has_no_duplicates(self, api_client, create_user,
+                                           create_recipe, tag_lunch,
+                                           tag_dinner):
+        recipe = create_recipe(create_user())
+        recipe.tags.add(tag_lunch, tag_dinner)
+        create_recipe(create_user(email='other@example.com',
+                                  username='other'))
+
+        response = api_client.get(
+            f'{self.url}?tags=lunch&tags=dinner&tags=breakfast'
+        )
+        ids = [item['id'] for item in response.data['results']]
+        assert len(ids) == len(set(ids)) == response.data['count'], (
+            'Рецепт с несколькими тегами не должен повторяться'
+        )
+
+        response = api_client.get(f'{self.url}?tags=dinner')
+        assert [item['id'] for item in response.data['results']] == [
+            recipe.id
+        ], 'Фильтр по тегу вернул неверные рецепты'
+
+    def test_combined_filters(self, authenticated_client, create_recipe,
+                              tag_lunch):
+        client, user = authenticated_client
+        both = create_recipe(user)
+        both.tags.add(tag_lunch)
+        Favorite.objects.create(user=user, recipe=both)
+        ShoppingCart.objects.create(user=user, recipe=both)
+        only_favorite = create_recipe(user)
+        only_favorite.tags.add(tag_lunch)
+        Favorite.objects.create(user=user, recipe=only_favorite)
+
+        response = client.get(
+            f'{self.url}?tags=lunch&is_favorited=1&is_in_shopping_cart=1'
+        )
+        assert [item['id'] for item in response.data['results']] == [
+            both.id
+        ], 'Фильтры должны применяться одновременно'
+
+    @pytest.mark.parametrize('model, columns', [
+        (Recipe, ['author_id', 'created']),
+        (Recipe, ['created', 'id']),
+        (Favorite, ['user_id', 'recipe_id']),
+        (ShoppingCart, ['user_id', 'recipe_id']),
+        (Recipe.tags.through, ['recipe_id', 'tag_id']),
+        (Tag, ['slug']),
+    ])
+    def test_filter_indexes(self, model, columns):
+        """Для каждого фильтра списка в схеме есть индекс."""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, model._meta.db_table
+            )
+        assert any(
+            (constraint['index'] or constraint['unique'])
+            and constraint['columns'][:len(columns)] == columns
+            for constraint in constraints.values()
+        ), f'Нет индекса {model._meta.db_table} {columns}'
+
+    @pytest.mark.skipif(connection.vendor != 'postgresql',
+                        reason='План запроса проверяется в PostgreSQL')
+    @pytest.mark.parametrize('query', [
+        'tags=breakfast&tags=lunch',
+        'is_favorited=1',
+        'is_in_shopping_cart=1',
+        'author={author}',
+        'tags=breakfast&tags=lunch&is_favorited=1&is_in_shopping_cart=1'
+        '&author={author}',
+    ])
+    def test_filters_use_indexes(self, authenticated_client, create_recipe,
+                                 tag_lunch, query):
+        """
+        Фильтры списка должны обслуживаться индексами.
+
+        Последовательное сканирование запрещается настройкой планировщика:
+        если подходящего индекса нет, PostgreSQL всё равно выберет Seq Scan,
+        и он окажется в плане. Так план не зависит от числа строк
+        в тестовой базе.
+        """
+        client, user = authenticated_client
+        recipe = create_recipe(user)
+        recipe.tags.add(tag_lunch)
+        Favorite.objects.create(user=user, recipe=recipe)
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(
+                f'{self.url}?{query.format(author=user.id)}'
+            )
+        assert [item['id'] for item in response.data['results']] == [
+            recipe.id
+        ]
+        list_sql = next(
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT "recipes_recipe"."id"')
+            and 'LIMIT' in query['sql']
+        )
+        assert 'DISTINCT' not in list_sql, (
+            'Фильтр по тегам не должен требовать DISTINCT'
+        )
+
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+            try:
+                cursor.execute(f'EXPLAIN {list_sql}')
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            finally:
+                cursor.execute('RESET enable_seqscan')
+        assert 'Seq Scan' not in plan, (
+            f'Фильтры рецептов не должны сканировать таблицы целиком:\n{plan}'
+        )
+
+
+class TestRecipeFieldsets:
+    """Тесты выборочных полей ?fields= и ?expand=."""
+
+    url = reverse('recipe-list')
+
+    def test_slim_list(self, api_client, create_user, create_recipe):
+        author = create_user()
+        recipe = create_recipe(author)
+
+        full = api_client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            slim = api_client.get(
+                f'{self.url}?fields=id,name,image,cooking_time,author'
+            )
+        assert slim.status_code == status.HTTP_200_OK
+        item = slim.data['results'][0]
+        assert set(item) == {'id', 'name', 'image', 'cooking_time',
+                             'author'}, 'Лишние поля в ответе'
+        assert item['author'] == author.id, (
+            'Без expand автор должен отдаваться как id'
+        )
+        assert item['id'] == recipe.id
+        assert len(slim.content) < len(full.content) / 2, (
+            'Ответ с выборочными полями должен быть заметно меньше'
+        )
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        for table in ('recipes_ingredientinrecipe', 'recipes_tag',
+                      'recipes_favorite', '"text"'):
+            assert table not in sql, (
+                f'Для выборочных полей не нужен {table}'
+            )
+
+    def test_expand(self, api_client, create_user, create_recipe,
+                    ingredient_flour):
+        author = create_user()
+        create_recipe(author)
+
+        response = api_client.get(
+            f'{self.url}?fields=name,author,tags,ingredients'
+            '&expand=author,tags'
+        )
+        item = response.data['results'][0]
+        assert item['author']['username'] == author.username, (
+            'Раскрытый автор должен быть объектом'
+        )
+        assert item['author']['is_subscribed'] is False
+        assert item['tags'][0]['slug'] == 'breakfast', (
+            'Раскрытые теги должны быть объектами'
+        )
+        assert item['ingredients'] == [ingredient_flour.id], (
+            'Нераскрытые ингредиенты должны отдаваться списком id'
+        )
+
+    def test_retrieve(self, authenticated_client, create_recipe):
+        client, user = authenticated_client
+        recipe = create_recipe(user)
+        Favorite.objects.create(user=user, recipe=recipe)
+
+        response = client.get(
+            reverse('recipe-detail', args=[recipe.id])
+            + '?fields=id,is_favorited'
+        )
+        assert response.data == {'id': recipe.id, 'is_favorited': True}
+
+    def test_unknown_fields(self, api_client):
+        response = api_client.get(f'{self.url}?fields=id,secret')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST, (
+            'Неизвестные поля должны отклоняться'
+        )
+        response = api_client.get(f'{self.url}?fields=id&expand=name')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
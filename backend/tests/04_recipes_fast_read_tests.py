@@ -0,0 +1,89 @@
+import pytest
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe,
+                            ShoppingCart)
+from users.models import Subscription
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def recipes_data(authenticated_client, create_user, create_recipe,
+                 tag_lunch, tag_dinner):
+    """Рецепты разных авторов с тегами, избранным, корзиной и подпиской."""
+    client, user = authenticated_client
+    author = create_user(email='author@example.com', username='author',
+                         avatar='avatars/author.png')
+    Subscription.objects.create(subscriber=user, author=author)
+
+    first = create_recipe(author, name='Суп')
+    first.tags.add(tag_lunch, tag_dinner)
+    second = create_recipe(user, name='Каша', image='')
+    IngredientInRecipe.objects.create(
+        recipe=second,
+        ingredient=Ingredient.objects.create(name='соль',
+                                             measurement_unit='г'),
+        amount=5
+    )
+    create_recipe(author, name='Омлет')
+    Favorite.objects.create(user=user, recipe=first)
+    ShoppingCart.objects.create(user=user, recipe=second)
+    return client, first
+
+
+class TestRecipeFastRead:
+    """Быстрое чтение рецептов должно совпадать с сериализаторами."""
+
+    def get_both(self, client, url):
+        with override_settings(RECIPES_FAST_READ=False):
+            reference = client.get(url)
+        with override_settings(RECIPES_FAST_READ=True):
+            fast = client.get(url)
+        return reference, fast
+
+    @pytest.mark.parametrize('query', [
+        '', '?limit=2', '?page=2&limit=2', '?tags=lunch&tags=breakfast',
+        '?is_favorited=1', '?is_in_shopping_cart=1',
+        '?pagination=cursor&limit=2',
+    ])
+    def test_list_is_byte_identical(self, recipes_data, query):
+        client, _ = recipes_data
+        reference, fast = self.get_both(client, reverse('recipe-list') + query)
+
+        assert reference.status_code == status.HTTP_200_OK
+        assert fast.content == reference.content, (
+            'Быстрое чтение списка рецептов должно давать тот же JSON'
+        )
+
+    def test_list_anonymous_is_byte_identical(self, recipes_data,
+                                              api_client):
+        api_client.force_authenticate(user=None)
+        reference, fast = self.get_both(api_client, reverse('recipe-list'))
+
+        assert fast.content == reference.content, (
+            'Быстрое чтение для анонимов должно давать тот же JSON'
+        )
+
+    def test_retrieve_is_byte_identical(self, recipes_data):
+        client, recipe = recipes_data
+        reference, fast = self.get_both(
+            client, reverse('recipe-detail', kwargs={'pk': recipe.id})
+        )
+
+        assert reference.status_code == status.HTTP_200_OK
+        assert fast.content == reference.content, (
+            'Быстрое чтение рецепта должно давать тот же JSON'
+        )
+
+    def test_retrieve_missing_recipe(self, recipes_data):
+        client, _ = recipes_data
+        reference, fast = self.get_both(
+            client, reverse('recipe-detail', kwargs={'pk': 10 ** 6})
+        )
+
+        assert fast.status_code == reference.status_code == (
+            status.HTTP_404_NOT_FOUND
+        )
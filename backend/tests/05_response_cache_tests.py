@@ -0,0 +1,142 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+
+from api.cache import get_response_cache_stats
+from recipes.models import Ingredient, IngredientInRecipe
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def recipe(create_user, create_recipe):
+    author = create_user(email='author@example.com', username='author')
+    return create_recipe(author, name='Блины')
+
+
+class TestAnonymousResponseCache:
+    """Тесты кеша ответов для анонимных пользователей."""
+
+    list_url = reverse('recipe-list')
+
+    def detail_url(self, recipe):
+        return reverse('recipe-detail', kwargs={'pk': recipe.id})
+
+    def test_hit_and_miss(self, api_client, recipe):
+        first = api_client.get(self.list_url)
+        second = api_client.get(self.list_url)
+
+        assert first['X-Cache'] == 'MISS'
+        assert second['X-Cache'] == 'HIT', (
+            'Повторный анонимный запрос должен отдаваться из кеша'
+        )
+        assert second.content == first.content, (
+            'Ответ из кеша должен совпадать с исходным'
+        )
+        assert second['X-Count-Exact'] == first['X-Count-Exact'], (
+            'Заголовки ответа должны сохраняться в кеше'
+        )
+        assert get_response_cache_stats() == {'hits': 1, 'misses': 1}
+
+    def test_hit_without_queries(self, api_client, recipe, query_budget):
+        api_client.get(self.list_url)
+        with query_budget(0):
+            response = api_client.get(self.list_url)
+        assert response['X-Cache'] == 'HIT', (
+            'Ответ из кеша и его ETag не должны обращаться к БД'
+        )
+
+    def test_query_params_are_normalized(self, api_client, recipe):
+        api_client.get(f'{self.list_url}?tags=a&tags=b&limit=2')
+        response = api_client.get(f'{self.list_url}?limit=2&tags=b&tags=a')
+
+        assert response['X-Cache'] == 'HIT', (
+            'Порядок параметров запроса не должен влиять на ключ кеша'
+        )
+
+    def test_authenticated_users_bypass_cache(self, authenticated_client,
+                                              recipe):
+        client, _ = authenticated_client
+        client.get(self.list_url)
+        response = client.get(self.list_url)
+
+        assert 'X-Cache' not in response, (
+            'Ответы авторизованным пользователям не должны кешироваться'
+        )
+
+    def test_not_found_is_not_cached(self, api_client):
+        url = reverse('recipe-detail', kwargs={'pk': 10 ** 6})
+        api_client.get(url)
+        response = api_client.get(url)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert get_response_cache_stats() == {'hits': 0, 'misses': 2}, (
+            'Ответ 404 не должен сохраняться в кеше'
+        )
+
+    def test_recipe_change_invalidates(self, api_client, recipe):
+        api_client.get(self.list_url)
+        api_client.get(self.detail_url(recipe))
+
+        recipe.name = 'Оладьи'
+        recipe.save()
+
+        for url in (self.list_url, self.detail_url(recipe)):
+            response = api_client.get(url)
+            assert response['X-Cache'] == 'MISS', (
+                'Изменение рецепта должно сбрасывать кеш'
+            )
+            assert 'Оладьи' in response.content.decode()
+
+    def test_other_recipe_detail_stays_cached(self, api_client, recipe,
+                                              create_recipe):
+        other = create_recipe(recipe.author, name='Другой')
+        api_client.get(self.detail_url(recipe))
+
+        other.name = 'Изменённый'
+        other.save()
+
+        response = api_client.get(self.detail_url(recipe))
+        assert response['X-Cache'] == 'HIT', (
+            'Изменение одного рецепта не должно сбрасывать кеш других'
+        )
+
+    def test_related_changes_invalidate(self, api_client, recipe,
+                                        tag_breakfast, ingredient_flour,
+                                        tag_lunch):
+        url = self.detail_url(recipe)
+
+        def assert_invalidated(message):
+            assert api_client.get(url)['X-Cache'] == 'MISS', message
+            assert api_client.get(url)['X-Cache'] == 'HIT'
+
+        api_client.get(url)
+        tag_breakfast.name = 'Ранний завтрак'
+        tag_breakfast.save()
+        assert_invalidated('Изменение тега должно сбрасывать кеш')
+
+        ingredient_flour.name = 'мука пшеничная'
+        ingredient_flour.save()
+        assert_invalidated('Изменение ингредиента должно сбрасывать кеш')
+
+        recipe.tags.add(tag_lunch)
+        assert_invalidated('Новый тег рецепта должен сбрасывать кеш')
+
+        tag_lunch.recipes.clear()
+        assert_invalidated('Очистка рецептов тега должна сбрасывать кеш')
+
+        IngredientInRecipe.objects.create(
+            recipe=recipe,
+            ingredient=Ingredient.objects.create(name='соль',
+                                                 measurement_unit='г'),
+            amount=1
+        )
+        assert_invalidated('Новый ингредиент рецепта должен сбрасывать кеш')
+
+        author = recipe.author
+        author.first_name = 'Иван'
+        author.save()
+        assert_invalidated('Изменение профиля автора должно сбрасывать кеш')
+
+        tag_breakfast.delete()
+        assert_invalidated('Удаление тега должно сбрасывать кеш')
@@ -0,0 +1,172 @@
+import pytest
+from django.urls import reverse
+from rest_framework import status
+
+from recipes.models import Favorite, Ingredient, IngredientInRecipe
+from users.models import Subscription
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def recipe(create_user, create_recipe):
+    author = create_user(email='author@example.com', username='author')
+    return create_recipe(author)
+
+
+def revalidate(client, url, response):
+    """Повторный запрос с валидаторами из предыдущего ответа."""
+    headers = {'HTTP_IF_NONE_MATCH': response['ETag']}
+    if 'Last-Modified' in response:
+        headers['HTTP_IF_MODIFIED_SINCE'] = response['Last-Modified']
+    return client.get(url, **headers)
+
+
+class TestRecipeConditionalGet:
+    """Тесты ETag и 304 для рецептов."""
+
+    list_url = reverse('recipe-list')
+
+    def detail_url(self, recipe):
+        return reverse('recipe-detail', kwargs={'pk': recipe.id})
+
+    def test_not_modified(self, api_client, recipe):
+        for url in (self.list_url, self.detail_url(recipe)):
+            response = api_client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            assert response['ETag'].startswith('W/'), (
+                'Ответ должен содержать слабый ETag'
+            )
+
+            response = revalidate(api_client, url, response)
+            assert response.status_code == status.HTTP_304_NOT_MODIFIED, (
+                'Неизменившийся ответ должен возвращать 304'
+            )
+
+    def test_if_modified_since_for_detail(self, api_client, recipe):
+        url = self.detail_url(recipe)
+        response = api_client.get(url)
+
+        response = api_client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_recipe_changes_modify_etag(self, api_client, recipe,
+                                        tag_lunch):
+        url = self.detail_url(recipe)
+        changes = (
+            lambda: recipe.tags.add(tag_lunch),
+            lambda: IngredientInRecipe.objects.create(
+                recipe=recipe,
+                ingredient=Ingredient.objects.create(
+                    name='соль', measurement_unit='г'
+                ),
+                amount=1
+            ),
+            lambda: recipe.ingredient_list.first().delete(),
+            lambda: recipe.author.save(),
+        )
+        for change in changes:
+            response = api_client.get(url)
+            change()
+            for check_url in (url, self.list_url):
+                assert revalidate(
+                    api_client, check_url, api_client.get(check_url)
+                ).status_code == status.HTTP_304_NOT_MODIFIED
+            response = revalidate(api_client, url, response)
+            assert response.status_code == status.HTTP_200_OK, (
+                'Изменение ингредиентов, тегов или автора должно менять ETag'
+            )
+
+    def test_unrelated_user_fields_keep_etag(self, api_client, recipe):
+        urls = (self.detail_url(recipe), self.list_url)
+        responses = [api_client.get(url) for url in urls]
+        recipe.author.set_password('new-password-123')
+        recipe.author.save(update_fields=['password'])
+        recipe.author.save(update_fields=['last_login'])
+        for url, response in zip(urls, responses):
+            response = revalidate(api_client, url, response)
+            assert response.status_code == status.HTTP_304_NOT_MODIFIED, (
+                'Вход и смена пароля автора не должны менять ETag рецептов'
+            )
+
+    def test_list_changes_on_delete(self, api_client, recipe,
+                                    create_recipe):
+        create_recipe(recipe.author)
+        response = api_client.get(self.list_url)
+
+        recipe.delete()
+        response = revalidate(api_client, self.list_url, response)
+        assert response.status_code == status.HTTP_200_OK, (
+            'Удаление рецепта должно менять ETag списка'
+        )
+
+    def test_viewer_state_changes_etag(self, authenticated_client, recipe):
+        client, user = authenticated_client
+        url = self.detail_url(recipe)
+        changes = (
+            lambda: Favorite.objects.create(user=user, recipe=recipe),
+            lambda: Favorite.objects.filter(user=user).delete(),
+            lambda: Subscription.objects.create(subscriber=user,
+                                                author=recipe.author),
+        )
+        for change in changes:
+            response = client.get(url)
+            assert 'Last-Modified' not in response, (
+                'Для пользователя Last-Modified не отдается'
+            )
+            change()
+            response = revalidate(client, url, response)
+            assert response.status_code == status.HTTP_200_OK, (
+                'Изменение избранного или подписок должно менять ETag'
+            )
+
+    def test_missing_recipe(self, api_client):
+        url = reverse('recipe-detail', kwargs={'pk': 10 ** 6})
+        response = api_client.get(url, HTTP_IF_NONE_MATCH='*')
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+class TestCatalogueConditionalGet:
+    """Тесты ETag и 304 для тегов и ингредиентов."""
+
+    def test_tags(self, api_client, tag_breakfast, tag_lunch):
+        url = reverse('tags-list')
+        response = api_client.get(url)
+        assert revalidate(api_client, url, response).status_code == (
+            status.HTTP_304_NOT_MODIFIED
+        )
+
+        tag_lunch.delete()
+        assert revalidate(api_client, url, response).status_code == (
+            status.HTTP_200_OK
+        ), 'Удаление тега должно менять ETag списка'
+
+        detail_url = reverse('tags-detail', kwargs={'pk': tag_breakfast.id})
+        response = api_client.get(detail_url)
+        assert 'Last-Modified' in response
+        assert revalidate(api_client, detail_url, response).status_code == (
+            status.HTTP_304_NOT_MODIFIED
+        )
+
+    def test_ingredients(self, api_client, ingredient_flour):
+        url = reverse('ingredient-list') + '?name=му'
+        response = api_client.get(url)
+        assert revalidate(api_client, url, response).status_code == (
+            status.HTTP_304_NOT_MODIFIED
+        )
+
+        Ingredient.objects.create(name='мусс', measurement_unit='г')
+        assert revalidate(api_client, url, response).status_code == (
+            status.HTTP_200_OK
+        ), 'Новый ингредиент должен менять ETag списка'
+
+        response = api_client.get(url)
+        other = api_client.get(
+            reverse('ingredient-list') + '?name=с',
+            HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        assert other.status_code == status.HTTP_200_OK, (
+            'ETag должен зависеть от параметров запроса'
+        )
@@ -0,0 +1,267 @@
+import json
+import logging
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from api import timeline
+from core import middleware
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+pytestmark = pytest.mark.django_db
+
+# Количество авторов и рецептов каждого автора в тестовых данных.
+# Бюджеты не должны зависеть от этих чисел.
+AUTHORS_COUNT = 3
+RECIPES_PER_AUTHOR = 2
+
+
+@pytest.fixture
+def world(settings, api_client, create_user, create_recipe, tag_lunch,
+          ingredient_flour, test_image):
+    """
+    Данные, на которых N+1 сразу заметен.
+
+    Пользователь подписан на нескольких авторов, у каждого автора
+    несколько рецептов, все они в избранном и в корзине пользователя.
+    """
+    # Быстрый хешер: пользователей в каждом тесте много
+    settings.PASSWORD_HASHERS = [
+        'django.contrib.auth.hashers.MD5PasswordHasher'
+    ]
+    viewer = create_user(email='viewer@example.com', username='viewer')
+    api_client.force_authenticate(user=viewer)
+    recipes = []
+    for number in range(AUTHORS_COUNT):
+        author = create_user(email=f'author{number}@example.com',
+                             username=f'author{number}')
+        Subscription.objects.create(subscriber=viewer, author=author)
+        for _ in range(RECIPES_PER_AUTHOR):
+            recipe = create_recipe(author)
+            recipe.tags.add(tag_lunch)
+            Favorite.objects.create(user=viewer, recipe=recipe)
+            ShoppingCart.objects.create(user=viewer, recipe=recipe)
+            recipes.append(recipe)
+    stranger = create_user(email='stranger@example.com',
+                           username='stranger')
+    free_recipe = create_recipe(stranger)
+    own_recipe = create_recipe(viewer)
+    # Отложенная раскладка по лентам в тестах не выполняется
+    timeline.rebuild([viewer.id])
+    return {
+        'client': api_client,
+        'viewer': viewer,
+        'ids': {
+            'author': recipes[0].author_id,
+            'recipe': recipes[0].id,
+            'stranger': stranger.id,
+            'free_recipe': free_recipe.id,
+            'own_recipe': own_recipe.id,
+            'tag': tag_lunch.id,
+            'ingredient': ingredient_flour.id,
+        },
+        'recipe_data': {
+            'ingredients': [{'id': ingredient_flour.id, 'amount': 10}],
+            'tags': [tag_lunch.id],
+            'image': test_image,
+            'name': 'Оладьи',
+            'text': 'Смешать и пожарить',
+            'cooking_time': 20,
+        },
+        'avatar_data': {'avatar': test_image},
+    }
+
+
+# (маршрут, метод, адрес, тело запроса, ожидаемый статус, бюджет).
+# Каждый маршрут из api/urls.py должен быть здесь. Бюджет — максимум
+# для PostgreSQL и SQLite (в SQLite переключатели api.toggles работают
+# через ORM и делают больше запросов).
+ROUTES = [
+    ('api-root', 'get', '/api/', None, 200, 0),
+    ('token-login', 'post', '/api/auth/token/login/',
+     lambda world: {'email': 'viewer@example.com',
+                    'password': 'testpass123'}, 200, 8),
+    ('token-logout', 'post', '/api/auth/token/logout/', None, 204, 1),
+    ('users-list', 'get', '/api/users/', None, 200, 3),
+    ('users-create', 'post', '/api/users/',
+     lambda world: {'email': 'new@example.com', 'username': 'new',
+                    'first_name': 'New', 'last_name': 'User',
+                    'password': 'Strong-pass-123'}, 201, 5),
+    ('users-detail', 'get', '/api/users/{author}/', None, 200, 2),
+    ('users-me', 'get', '/api/users/me/', None, 200, 1),
+    ('users-set-password', 'post', '/api/users/set_password/',
+     lambda world: {'current_password': 'testpass123',
+                    'new_password': 'Strong-pass-123'}, 204, 3),
+    # Файл сохраняется в транзакции (SAVEPOINT, RELEASE) под блокировкой
+    # имени (в PostgreSQL), api.media
+    ('user-avatar-put', 'put', '/api/users/me/avatar/',
+     lambda world: world['avatar_data'], 200, 6),
+    ('user-avatar-delete', 'delete', '/api/users/me/avatar/',
+     None, 204, 5),
+    ('subscriptions-list', 'get', '/api/users/subscriptions/',
+     None, 200, 4),
+    # Обновление ленты — одна вставка задания (api.timeline)
+    ('user-subscribe', 'post', '/api/users/{stranger}/subscribe/',
+     None, 201, 14),
+    ('user-unsubscribe', 'delete', '/api/users/{author}/subscribe/',
+     None, 204, 6),
+    ('tags-list', 'get', '/api/tags/', None, 200, 1),
+    ('tags-detail', 'get', '/api/tags/{tag}/', None, 200, 2),
+    ('ingredient-list', 'get', '/api/ingredients/', None, 200, 1),
+    # Построение индекса, подстроки и, при наличии pg_trgm, похожие
+    ('ingredient-search', 'get', '/api/ingredients/?search=ука',
+     None, 200, 3),
+    ('ingredient-detail', 'get', '/api/ingredients/{ingredient}/',
+     None, 200, 2),
+    ('recipe-list', 'get', '/api/recipes/', None, 200, 8),
+    ('recipe-list-filtered', 'get',
+     '/api/recipes/?tags=lunch&is_favorited=1&is_in_shopping_cart=1',
+     None, 200, 7),
+    ('recipe-detail', 'get', '/api/recipes/{recipe}/', None, 200, 7),
+    ('recipe-create', 'post', '/api/recipes/',
+     lambda world: world['recipe_data'], 201, 24),
+    ('recipe-update', 'patch', '/api/recipes/{own_recipe}/',
+     lambda world: world['recipe_data'], 200, 28),
+    ('recipe-delete', 'delete', '/api/recipes/{own_recipe}/',
+     None, 204, 14),
+    ('recipe-favorite', 'post', '/api/recipes/{free_recipe}/favorite/',
+     None, 201, 8),
+    ('recipe-favorite-delete', 'delete',
+     '/api/recipes/{recipe}/favorite/', None, 204, 5),
+    ('recipe-shopping-cart', 'post',
+     '/api/recipes/{free_recipe}/shopping_cart/', None, 201, 9),
+    ('recipe-shopping-cart-delete', 'delete',
+     '/api/recipes/{recipe}/shopping_cart/', None, 204, 7),
+    ('recipe-favorite-bulk', 'post', '/api/recipes/favorite/bulk/',
+     lambda world: {'recipes': [world['ids']['free_recipe'],
+                                world['ids']['own_recipe']]}, 200, 7),
+    ('recipe-favorite-bulk-delete', 'delete',
+     '/api/recipes/favorite/bulk/',
+     lambda world: {'recipes': [world['ids']['recipe']]}, 200, 6),
+    ('recipe-shopping-cart-bulk', 'post',
+     '/api/recipes/shopping_cart/bulk/',
+     lambda world: {'recipes': [world['ids']['free_recipe'],
+                                world['ids']['own_recipe']]}, 200, 8),
+    ('recipe-shopping-cart-bulk-delete', 'delete',
+     '/api/recipes/shopping_cart/bulk/',
+     lambda world: {'recipes': [world['ids']['recipe']]}, 200, 8),
+    # Ключи страницы по индексу ленты, затем рецепты этой страницы
+    ('recipe-feed', 'get', '/api/recipes/feed/', None, 200, 6),
+    # Проверка состояния корзины и агрегация при промахе кеша
+    ('recipe-download-shopping-cart', 'get',
+     '/api/recipes/download_shopping_cart/', None, 200, 2),
+    ('recipe-get-link', 'get', '/api/recipes/{recipe}/get-link/',
+     None, 200, 4),
+]
+
+
+class TestQueryBudgets:
+    """Бюджеты запросов к БД для всех маршрутов API."""
+
+    @pytest.mark.parametrize(
+        'method, url, data, expected_status, budget',
+        [route[1:] for route in ROUTES],
+        ids=[route[0] for route in ROUTES]
+    )
+    def test_route_budget(self, world, query_budget, method, url, data,
+                          expected_status, budget):
+        client = world['client']
+        url = url.format(**world['ids'])
+        if url.startswith('/api/auth/token/logout/'):
+            token = Token.objects.create(user=world['viewer'])
+            client.force_authenticate(user=world['viewer'], token=token)
+        elif url.startswith('/api/auth/token/login/'):
+            client.force_authenticate(user=None)
+
+        with query_budget(budget):
+            response = getattr(client, method)(
+                url, data(world) if data else None, format='json'
+            )
+            # Потоковые ответы читают БД при отдаче содержимого
+            if response.streaming:
+                b''.join(response.streaming_content)
+        assert response.status_code == expected_status, (
+            f'{method.upper()} {url} вернул {response.status_code}: '
+            f'{response.content[:200]}'
+        )
+
+    def test_every_route_has_budget(self):
+        """Новые маршруты из api/urls.py не должны остаться без бюджета."""
+        budget_paths = {
+            route[2].split('?')[0].format(
+                author=1, recipe=1, stranger=1, free_recipe=1,
+                own_recipe=1, tag=1, ingredient=1
+            )
+            for route in ROUTES
+        }
+        for name, kwargs in (
+            ('users-list', {}), ('users-detail', {'pk': 1}),
+            ('users-me', {}), ('users-set-password', {}),
+            ('user-avatar', {}), ('subscriptions-list', {}),
+            ('user-subscribe', {'pk': 1}), ('tags-list', {}),
+            ('tags-detail', {'pk': 1}), ('ingredient-list', {}),
+            ('ingredient-detail', {'pk': 1}), ('recipe-list', {}),
+            ('recipe-detail', {'pk': 1}), ('recipe-favorite', {'pk': 1}),
+            ('recipe-shopping-cart', {'pk': 1}),
+            ('recipe-favorite-bulk', {}), ('recipe-shopping-cart-bulk', {}),
+            ('recipe-feed', {}), ('recipe-download-shopping-cart', {}),
+            ('recipe-get-link', {'pk': 1}), ('login', {}), ('logout', {}),
+        ):
+            path = reverse(name, kwargs=kwargs).rstrip('/') + '/'
+            assert path in budget_paths, (
+                f'Для маршрута {name} не задан бюджет запросов'
+            )
+
+
+class TestQueryStatsMiddleware:
+    """Тесты статистики запросов к БД."""
+
+    url = reverse('recipe-list')
+
+    def test_headers_disabled_by_default(self, api_client, settings):
+        settings.QUERY_STATS_HEADERS = False
+        response = api_client.get(self.url)
+        assert 'X-DB-Queries' not in response, (
+            'Без QUERY_STATS_HEADERS заголовки не должны отдаваться'
+        )
+
+    def test_headers(self, api_client, create_user, create_recipe,
+                     settings):
+        settings.QUERY_STATS_HEADERS = True
+        create_recipe(create_user())
+
+        response = api_client.get(self.url)
+        assert int(response['X-DB-Queries']) > 0, (
+            'Количество запросов должно быть в заголовке'
+        )
+        assert float(response['X-DB-Time']) >= 0
+        assert response['X-DB-Slowest-Query'].startswith('SELECT'), (
+            'Самый медленный запрос должен быть в заголовке'
+        )
+
+    def test_log_record(self, api_client, caplog, monkeypatch):
+        # Логгер не передает записи корневому, где их ловит caplog
+        monkeypatch.setattr(logging.getLogger('core.queries'),
+                            'propagate', True)
+        with caplog.at_level(logging.INFO, logger='core.queries'):
+            response = api_client.get(self.url)
+        assert response.status_code == status.HTTP_200_OK
+        record = json.loads(caplog.records[-1].getMessage())
+        assert record['view'] == 'recipe-list', (
+            'В логе должно быть имя view'
+        )
+        assert record['status'] == status.HTTP_200_OK
+        assert record['queries'] > 0
+        assert {'db_time_ms', 'slowest_ms', 'slowest_sql'} <= set(record)
+
+    def test_no_log_record_below_info(self, api_client, monkeypatch):
+        monkeypatch.setattr(logging.getLogger('core.queries'), 'level',
+                            logging.WARNING)
+        monkeypatch.setattr(middleware, 'json', None)
+        response = api_client.get(self.url)
+        assert response.status_code == status.HTTP_200_OK, (
+            'Без уровня INFO статистика не должна сериализоваться'
+        )
@@ -0,0 +1,272 @@
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+
+from api import timeline
+from recipes.models import TimelineEntry, TimelineJob
+from users.models import Subscription
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def synchronous_timeline(monkeypatch):
+    """Задания лент выполняются сразу после коммита, без потока."""
+    monkeypatch.setattr(timeline, '_submit', timeline.run_jobs)
+
+
+@pytest.fixture
+def authors(create_user):
+    """Автор, на которого подписываются, и посторонний автор."""
+    return (
+        create_user(email='author@example.com', username='author'),
+        create_user(email='stranger@example.com', username='stranger'),
+    )
+
+
+class TestFeed:
+    """Тесты ленты рецептов подписок."""
+
+    url = reverse('recipe-feed')
+
+    def subscribe(self, client, author, callbacks):
+        with callbacks(execute=True):
+            response = client.post(
+                reverse('user-subscribe', kwargs={'pk': author.id})
+            )
+        assert response.status_code == status.HTTP_201_CREATED
+
+    def test_anonymous(self, api_client):
+        response = api_client.get(self.url)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED, (
+            'Лента доступна только авторизованным пользователям'
+        )
+
+    def test_backfill_and_fan_out(self, authenticated_client, authors,
+                                  create_recipe,
+                                  django_capture_on_commit_callbacks):
+        client, user = authenticated_client
+        author, stranger = authors
+        old_recipe = create_recipe(author, name='Старый')
+        create_recipe(stranger, name='Чужой')
+
+        self.subscribe(client, author, django_capture_on_commit_callbacks)
+        with django_capture_on_commit_callbacks(execute=True):
+            new_recipe = create_recipe(author, name='Новый')
+
+        assert set(TimelineEntry.objects.filter(user=user).values_list(
+            'recipe_id', 'created'
+        )) == {(old_recipe.id, old_recipe.created),
+               (new_recipe.id, new_recipe.created)}, (
+            'Лента должна содержать старые и новые рецепты автора '
+            'с датами их создания'
+        )
+        response = client.get(self.url)
+        assert response.status_code == status.HTTP_200_OK
+        assert [item['name'] for item in response.data['results']] == [
+            'Новый', 'Старый'
+        ], 'В ленте только рецепты подписок, от новых к старым'
+
+    def test_unsubscribe_prunes(self, authenticated_client, authors,
+                                create_recipe,
+                                django_capture_on_commit_callbacks):
+        client, user = authenticated_client
+        author, _ = authors
+        create_recipe(author)
+        self.subscribe(client, author, django_capture_on_commit_callbacks)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            client.delete(reverse('user-subscribe', kwargs={'pk': author.id}))
+
+        assert not TimelineEntry.objects.filter(user=user).exists(), (
+            'После отписки лента должна очищаться'
+        )
+        assert client.get(self.url).data['results'] == []
+
+    def test_popular_author_read_on_request(
+        self, authenticated_client, authors, create_recipe, monkeypatch,
+        django_capture_on_commit_callbacks
+    ):
+        client, user = authenticated_client
+        author, _ = authors
+        monkeypatch.setattr(timeline, 'FEED_FANOUT_MAX_SUBSCRIBERS', 0)
+        create_recipe(author, name='Старый')
+        self.subscribe(client, author, django_capture_on_commit_callbacks)
+        with django_capture_on_commit_callbacks(execute=True):
+            create_recipe(author, name='Новый')
+
+        assert not TimelineEntry.objects.exists(), (
+            'Рецепты популярных авторов не раскладываются по лентам'
+        )
+        response = client.get(self.url)
+        assert [item['name'] for item in response.data['results']] == [
+            'Новый', 'Старый'
+        ], 'Рецепты популярных авторов должны добавляться при чтении'
+
+    def test_keyset_pagination(self, authenticated_client, authors,
+                               create_recipe,
+                               django_capture_on_commit_callbacks):
+        client, user = authenticated_client
+        author, _ = authors
+        recipes = [create_recipe(author) for _ in range(5)]
+        self.subscribe(client, author, django_capture_on_commit_callbacks)
+
+        seen = []
+        url = f'{self.url}?limit=2'
+        while url:
+            response = client.get(url)
+            assert 'count' not in response.data, (
+                'Лента пагинируется курсором, без подсчета количества'
+            )
+            seen += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+        assert seen == [recipe.id for recipe in reversed(recipes)]
+
+        previous = client.get(response.data['previous']).data
+        assert [item['id'] for item in previous['results']] == seen[2:4], (
+            'Ссылка previous ведет на предыдущую страницу'
+        )
+
+    def test_popular_and_regular_authors_merged(
+        self, authenticated_client, authors, create_recipe, monkeypatch,
+        django_capture_on_commit_callbacks
+    ):
+        client, _ = authenticated_client
+        author, stranger = authors
+        names = []
+        for number in range(4):
+            for owner in (author, stranger):
+                names.append(f'{owner.username}-{number}')
+                create_recipe(owner, name=names[-1])
+        self.subscribe(client, author, django_capture_on_commit_callbacks)
+        monkeypatch.setattr(timeline, 'FEED_FANOUT_MAX_SUBSCRIBERS', 0)
+        self.subscribe(client, stranger, django_capture_on_commit_callbacks)
+
+        seen, url = [], f'{self.url}?limit=3'
+        while url:
+            response = client.get(url).data
+            seen += [item['name'] for item in response['results']]
+            url = response['next']
+        assert seen == names[::-1], (
+            'Строки ленты и рецепты популярных авторов идут по дате'
+        )
+
+    def test_filters(self, authenticated_client, authors, create_recipe,
+                     tag_lunch, django_capture_on_commit_callbacks):
+        client, _ = authenticated_client
+        author, _ = authors
+        create_recipe(author, name='Без тега')
+        create_recipe(author, name='Обед').tags.add(tag_lunch)
+        self.subscribe(client, author, django_capture_on_commit_callbacks)
+
+        response = client.get(self.url, {'tags': tag_lunch.slug})
+        assert [item['name'] for item in response.data['results']] == [
+            'Обед'
+        ], 'Фильтры списка рецептов действуют и в ленте'
+
+    def test_invalid_cursor(self, authenticated_client):
+        client, _ = authenticated_client
+        response = client.get(self.url, {'cursor': 'cD1hYmM='})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_work_after_commit_in_background(
+        self, authenticated_client, authors, create_recipe, monkeypatch,
+        django_capture_on_commit_callbacks
+    ):
+        client, user = authenticated_client
+        author, _ = authors
+        submitted = []
+        monkeypatch.setattr(timeline, '_submit',
+                            lambda: submitted.append(True))
+        create_recipe(author)
+        self.subscribe(client, author, django_capture_on_commit_callbacks)
+        assert submitted, 'Задания передаются в поток после коммита'
+        assert not TimelineEntry.objects.exists(), (
+            'Лента дополняется не в запросе, а в фоновом потоке'
+        )
+        assert TimelineJob.objects.count() == 2, (
+            'Раскладка рецепта и подписка записываются как задания'
+        )
+
+    def test_lost_jobs_repaired_by_command(
+        self, authenticated_client, authors, create_recipe, monkeypatch,
+        django_capture_on_commit_callbacks
+    ):
+        client, user = authenticated_client
+        author, _ = authors
+        old_recipe = create_recipe(author)
+        # Процесс перезапущен: поток не выполнил переданные задания
+        monkeypatch.setattr(timeline, '_submit', lambda: None)
+        self.subscribe(client, author, django_capture_on_commit_callbacks)
+        with django_capture_on_commit_callbacks(execute=True):
+            new_recipe = create_recipe(author)
+        assert not TimelineEntry.objects.exists()
+
+        call_command('process_timeline_jobs')
+
+        assert set(TimelineEntry.objects.filter(user=user).values_list(
+            'recipe_id', flat=True
+        )) == {old_recipe.id, new_recipe.id}, (
+            'Команда должна выполнить задания, потерянные потоком'
+        )
+        assert not TimelineJob.objects.exists(), (
+            'Выполненные задания удаляются'
+        )
+
+    def test_failed_job_kept(self, authors, create_recipe, monkeypatch):
+        author, _ = authors
+        TimelineJob.objects.create(recipe_id=create_recipe(author).id)
+
+        def broken(recipe_id):
+            raise RuntimeError
+
+        monkeypatch.setattr(timeline, 'fan_out_recipe', broken)
+        with pytest.raises(RuntimeError):
+            timeline.run_jobs()
+        assert TimelineJob.objects.exists(), (
+            'Задание, которое не выполнилось, остается в таблице'
+        )
+
+    def test_stale_job_follows_subscription(self, authenticated_client,
+                                            authors, create_recipe):
+        _, user = authenticated_client
+        author, _ = authors
+        create_recipe(author)
+        # Отписка уже выполнена, когда поток дошел до подписки
+        timeline.sync_subscription(user.id, author.id)
+        assert not TimelineEntry.objects.exists()
+
+        Subscription.objects.create(subscriber=user, author=author)
+        timeline.sync_subscription(user.id, author.id)
+        assert TimelineEntry.objects.filter(user=user).exists()
+
+    def test_prune_in_batches(self, authenticated_client, authors,
+                              create_recipe, monkeypatch,
+                              django_capture_on_commit_callbacks):
+        client, user = authenticated_client
+        author, _ = authors
+        for _ in range(5):
+            create_recipe(author)
+        self.subscribe(client, author, django_capture_on_commit_callbacks)
+        monkeypatch.setattr(timeline, 'TIMELINE_BATCH_SIZE', 2)
+        with django_capture_on_commit_callbacks(execute=True):
+            client.delete(reverse('user-subscribe', kwargs={'pk': author.id}))
+        assert not TimelineEntry.objects.filter(user=user).exists()
+
+    def test_rebuild_command(self, authenticated_client, authors,
+                             create_recipe):
+        client, user = authenticated_client
+        author, stranger = authors
+        recipe = create_recipe(author)
+        create_recipe(stranger)
+        # Подписка без выполнения отложенной работы: лента пуста
+        Subscription.objects.create(subscriber=user, author=author)
+
+        call_command('rebuild_timelines', user_ids=[user.id])
+
+        assert list(TimelineEntry.objects.values_list(
+            'user_id', 'recipe_id', 'author_id'
+        )) == [(user.id, recipe.id, author.id)], (
+            'Команда должна пересобрать ленту из подписок'
+        )
@@ -0,0 +1,100 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription
+
+pytestmark = pytest.mark.django_db
+
+User = get_user_model()
+
+
+def counters(user):
+    user.refresh_from_db()
+    return (user.recipes_count, user.favorites_count,
+            user.shopping_cart_count, user.subscriptions_count,
+            user.subscribers_count)
+
+
+class TestCounters:
+    """Тесты денормализованных счетчиков."""
+
+    def test_api_updates_counters(self, authenticated_client, create_user,
+                                  create_recipe):
+        client, user = authenticated_client
+        author = create_user(email='author@example.com', username='author')
+        recipe = create_recipe(author)
+        assert counters(author) == (1, 0, 0, 0, 0)
+
+        client.post(reverse('recipe-favorite', args=[recipe.id]))
+        client.post(reverse('recipe-shopping-cart', args=[recipe.id]))
+        client.post(reverse('user-subscribe', kwargs={'pk': author.id}))
+        assert counters(user) == (0, 1, 1, 1, 0), (
+            'Счетчики пользователя должны расти при добавлении'
+        )
+        assert counters(author) == (1, 0, 0, 0, 1)
+        recipe.refresh_from_db()
+        assert (recipe.favorites_count, recipe.shopping_cart_count) == (1, 1)
+
+        client.delete(reverse('recipe-favorite', args=[recipe.id]))
+        client.delete(reverse('user-subscribe', kwargs={'pk': author.id}))
+        assert counters(user) == (0, 0, 1, 0, 0), (
+            'Счетчики пользователя должны уменьшаться при удалении'
+        )
+        recipe.refresh_from_db()
+        assert recipe.favorites_count == 0
+
+    def test_cascade_delete(self, authenticated_client, create_user,
+                            create_recipe):
+        client, user = authenticated_client
+        author = create_user(email='author@example.com', username='author')
+        recipe = create_recipe(author)
+        Favorite.objects.create(user=user, recipe=recipe)
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+
+        author.delete()
+        assert counters(user) == (0, 0, 0, 0, 0), (
+            'Каскадное удаление должно уменьшать счетчики'
+        )
+
+    def test_subscriptions_use_counter(self, authenticated_client,
+                                       create_user, create_recipe):
+        client, user = authenticated_client
+        author = create_user(email='author@example.com', username='author')
+        create_recipe(author)
+        Subscription.objects.create(subscriber=user, author=author)
+
+        response = client.get(reverse('subscriptions-list'))
+        assert response.data['results'][0]['recipes_count'] == 1
+
+    def test_repair_command(self, create_user, create_recipe):
+        author = create_user(email='author@example.com', username='author')
+        recipe = create_recipe(author)
+        Favorite.objects.create(user=author, recipe=recipe)
+        User.objects.filter(pk=author.pk).update(recipes_count=5)
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=0)
+
+        call_command('repair_counters', dry_run=True)
+        assert counters(author)[0] == 5, (
+            'С --dry-run счетчики не должны меняться'
+        )
+
+        call_command('repair_counters')
+        assert counters(author) == (1, 1, 0, 0, 0), (
+            'Команда должна исправлять расхождения'
+        )
+        recipe.refresh_from_db()
+        assert recipe.favorites_count == 1
+
+    def test_admin_list(self, client, create_user, create_recipe):
+        admin = create_user(email='admin@example.com', username='admin',
+                            is_staff=True, is_superuser=True)
+        create_recipe(admin)
+        client.force_login(admin)
+        for name in ('admin:users_customuser_changelist',
+                     'admin:recipes_recipe_changelist'):
+            response = client.get(reverse(name))
+            assert response.status_code == status.HTTP_200_OK
@@ -0,0 +1,251 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+
+import pytest
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api.toggles import add_link, remove_link
+from core.constants import BULK_RECIPES_MAX
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription
+
+pytestmark = pytest.mark.django_db
+
+THREADS = 8
+
+
+class TestToggles:
+    """Тесты добавления и удаления избранного, покупок и подписок."""
+
+    @pytest.mark.parametrize('name, model', [
+        ('recipe-favorite', Favorite),
+        ('recipe-shopping-cart', ShoppingCart),
+    ])
+    def test_recipe_toggle(self, authenticated_client, create_recipe, name,
+                           model):
+        client, user = authenticated_client
+        recipe = create_recipe(user)
+        url = reverse(name, args=[recipe.id])
+
+        response = client.post(url)
+        assert response.status_code == status.HTTP_201_CREATED
+        image = recipe.image.url
+        assert response.data == {
+            'id': recipe.id, 'name': recipe.name, 'image': image,
+            'image_variants': {
+                'webp': {'320': image, '640': image},
+                'jpeg': {'320': image, '640': image},
+            },
+            'cooking_time': recipe.cooking_time
+        }, 'Ответ должен содержать краткое описание рецепта'
+        assert client.post(url).status_code == (
+            status.HTTP_400_BAD_REQUEST
+        ), 'Повторное добавление должно возвращать 400'
+        assert model.objects.filter(user=user, recipe=recipe).count() == 1
+
+        assert client.delete(url).status_code == (
+            status.HTTP_204_NO_CONTENT
+        )
+        response = client.delete(url)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST, (
+            'Удаление отсутствующей связи должно возвращать 400'
+        )
+        assert 'errors' in response.data
+
+    @pytest.mark.parametrize('method', ['post', 'delete'])
+    @pytest.mark.parametrize('name', ['recipe-favorite',
+                                      'recipe-shopping-cart'])
+    def test_missing_recipe(self, authenticated_client, method, name):
+        client, _ = authenticated_client
+        response = getattr(client, method)(reverse(name, args=[999]))
+        assert response.status_code == status.HTTP_404_NOT_FOUND, (
+            'Для несуществующего рецепта должен возвращаться 404'
+        )
+
+    @pytest.mark.parametrize('method', ['post', 'delete'])
+    def test_missing_author(self, authenticated_client, method):
+        client, _ = authenticated_client
+        response = getattr(client, method)(
+            reverse('user-subscribe', kwargs={'pk': 999})
+        )
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_counters_follow_toggles(self, authenticated_client,
+                                     create_recipe):
+        client, user = authenticated_client
+        recipe = create_recipe(user)
+        url = reverse('recipe-favorite', args=[recipe.id])
+        client.post(url)
+        client.post(url)
+        recipe.refresh_from_db()
+        user.refresh_from_db()
+        assert (recipe.favorites_count, user.favorites_count) == (1, 1), (
+            'Повторное добавление не должно менять счетчики'
+        )
+        client.delete(url)
+        client.delete(url)
+        recipe.refresh_from_db()
+        user.refresh_from_db()
+        assert (recipe.favorites_count, user.favorites_count) == (0, 0)
+
+
+    def test_signal_instances(self, create_user, create_recipe):
+        user = create_user()
+        recipe = create_recipe(user)
+        sent = []
+
+        def receiver(sender, instance, **kwargs):
+            sent.append((instance.pk, instance.recipe_id, instance.added,
+                         instance._state.db, instance._state.adding))
+
+        post_save.connect(receiver, sender=Favorite)
+        post_delete.connect(receiver, sender=Favorite)
+        try:
+            # Среди полей рецепта нет первичного ключа
+            target, created = add_link(Favorite, 'user', user, 'recipe',
+                                       recipe.id, ('name',))
+            favorite = Favorite.objects.get()
+            assert remove_link(Favorite, 'user', user, 'recipe', recipe.id)
+        finally:
+            post_save.disconnect(receiver, sender=Favorite)
+            post_delete.disconnect(receiver, sender=Favorite)
+        assert (target, created) == ({'name': recipe.name}, True)
+        expected = (favorite.pk, recipe.id, favorite.added, 'default', False)
+        assert sent == [expected, expected], (
+            'Сигналы должны получать сохраненную и удаленную строку'
+        )
+
+
+class TestBulkToggles:
+    """Тесты пакетного избранного и списка покупок."""
+
+    @pytest.mark.parametrize('name, model', [
+        ('recipe-favorite-bulk', Favorite),
+        ('recipe-shopping-cart-bulk', ShoppingCart),
+    ])
+    def test_bulk_toggle(self, authenticated_client, create_recipe, name,
+                         model):
+        client, user = authenticated_client
+        first, second = create_recipe(user), create_recipe(user)
+        model.objects.create(user=user, recipe=first)
+        url = reverse(name)
+
+        response = client.post(
+            url, {'recipes': [first.id, second.id, 999, second.id]},
+            format='json'
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {
+            str(first.id): 'exists', str(second.id): 'added',
+            '999': 'not_found'
+        }, 'Ответ должен содержать статус каждого id'
+        assert set(model.objects.filter(user=user).values_list(
+            'recipe_id', flat=True
+        )) == {first.id, second.id}
+
+        response = client.delete(url, {'recipes': [second.id, 999]},
+                                 format='json')
+        assert response.json() == {
+            str(second.id): 'removed', '999': 'not_found'
+        }
+        response = client.delete(url, {'recipes': [second.id]},
+                                 format='json')
+        assert response.json() == {str(second.id): 'missing'}
+        assert list(model.objects.filter(user=user).values_list(
+            'recipe_id', flat=True
+        )) == [first.id]
+
+    def test_bulk_counters(self, authenticated_client, create_user,
+                           create_recipe):
+        client, user = authenticated_client
+        author = create_user(email='author@example.com', username='author')
+        recipes = [create_recipe(author) for _ in range(3)]
+        url = reverse('recipe-favorite-bulk')
+
+        client.post(url, {'recipes': [recipe.id for recipe in recipes]},
+                    format='json')
+        user.refresh_from_db()
+        assert user.favorites_count == 3, (
+            'Пакетное добавление должно обновлять счетчики'
+        )
+        assert [recipe.favorites_count for recipe in Recipe.objects.filter(
+            author=author
+        )] == [1, 1, 1]
+
+        client.delete(url, {'recipes': [recipes[0].id]}, format='json')
+        user.refresh_from_db()
+        recipes[0].refresh_from_db()
+        assert (user.favorites_count, recipes[0].favorites_count) == (2, 0)
+
+    @pytest.mark.parametrize('data', [
+        {}, {'recipes': []}, {'recipes': ['abc']}, {'recipes': [0]},
+        {'recipes': list(range(1, BULK_RECIPES_MAX + 2))},
+    ])
+    def test_invalid_data(self, authenticated_client, data):
+        client, _ = authenticated_client
+        response = client.post(reverse('recipe-favorite-bulk'), data,
+                               format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_anonymous(self, api_client):
+        response = api_client.post(reverse('recipe-shopping-cart-bulk'),
+                                   {'recipes': [1]}, format='json')
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.skipif(connection.vendor != 'postgresql',
+                    reason='Параллельные соединения проверяются в PostgreSQL')
+@pytest.mark.django_db(transaction=True)
+class TestConcurrentToggles:
+    """Одновременные запросы не должны приводить к ошибкам 500."""
+
+    def hammer(self, user, method, url):
+        barrier = Barrier(THREADS)
+
+        def request(_):
+            client = APIClient()
+            client.force_authenticate(user=user)
+            try:
+                barrier.wait()
+                return getattr(client, method)(url).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(THREADS) as executor:
+            return sorted(executor.map(request, range(THREADS)))
+
+    def test_concurrent_favorite(self, create_user, create_recipe):
+        user = create_user()
+        recipe = create_recipe(user)
+        url = reverse('recipe-favorite', args=[recipe.id])
+
+        codes = self.hammer(user, 'post', url)
+        assert codes == [status.HTTP_201_CREATED] + [
+            status.HTTP_400_BAD_REQUEST
+        ] * (THREADS - 1), f'Неожиданные ответы: {codes}'
+        recipe.refresh_from_db()
+        assert recipe.favorites_count == 1
+
+        codes = self.hammer(user, 'delete', url)
+        assert codes == [status.HTTP_204_NO_CONTENT] + [
+            status.HTTP_400_BAD_REQUEST
+        ] * (THREADS - 1), f'Неожиданные ответы: {codes}'
+        recipe.refresh_from_db()
+        assert recipe.favorites_count == 0
+
+    def test_concurrent_subscribe(self, create_user):
+        user = create_user()
+        author = create_user(email='author@example.com', username='author')
+        url = reverse('user-subscribe', kwargs={'pk': author.id})
+
+        codes = self.hammer(user, 'post', url)
+        assert codes == [status.HTTP_201_CREATED] + [
+            status.HTTP_400_BAD_REQUEST
+        ] * (THREADS - 1), f'Неожиданные ответы: {codes}'
+        assert Subscription.objects.count() == 1
+        author.refresh_from_db()
+        assert author.subscribers_count == 1
@@ -0,0 +1,138 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.urls import reverse
+from rest_framework import status
+
+from api.filters import trigram_available
+from api.recipes import ingredient_index
+from recipes.models import Ingredient
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def ingredients():
+    return [
+        Ingredient.objects.create(name=name, measurement_unit='г')
+        for name in ('Мука', 'мускатный орех', 'Молоко', 'соль',
+                     'пшеничная мука')
+    ]
+
+
+def search(client, name=None, **params):
+    if name is not None:
+        params['name'] = name
+    response = client.get(reverse('ingredient-list'), params)
+    assert response.status_code == status.HTTP_200_OK
+    return [item['name'] for item in response.json()]
+
+
+class TestIngredientIndex:
+    """Тесты поиска ингредиентов по началу названия."""
+
+    def test_prefix_search(self, api_client, ingredients):
+        assert search(api_client, 'му') == ['Мука', 'мускатный орех'], (
+            'Поиск должен быть по началу названия без учета регистра'
+        )
+        assert search(api_client, 'МУС') == ['мускатный орех']
+        assert search(api_client, 'x') == []
+        assert search(api_client) == [
+            'Молоко', 'Мука', 'мускатный орех', 'пшеничная мука', 'соль'
+        ], 'Без параметра name отдается весь справочник'
+
+    @pytest.mark.parametrize('prefix', ['', 'е', 'Ё', 'ЯБ'])
+    def test_order_matches_queryset(self, api_client, prefix):
+        for name in ('ёлочка', 'Ель', 'ежевика', 'Ёрш', 'яблоко',
+                     'Яблоко зелёное', 'ЯБЛОЧНЫЙ уксус', 'Apple', 'apricot'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+        queryset = Ingredient.objects.order_by('name')
+        if prefix:
+            if connection.vendor != 'postgresql':
+                pytest.skip('В SQLite istartswith учитывает регистр '
+                            'кириллицы')
+            queryset = queryset.filter(name__istartswith=prefix)
+        assert search(api_client, prefix) == list(
+            queryset.values_list('name', flat=True)
+        ), 'Индекс отдает ингредиенты в том же порядке и составе, что БД'
+
+    def test_response_matches_serializer(self, api_client, ingredients):
+        response = api_client.get(reverse('ingredient-list'),
+                                  {'name': 'соль'})
+        assert response['Content-Type'] == 'application/json'
+        assert response.json() == [{
+            'id': ingredients[3].id, 'name': 'соль',
+            'measurement_unit': 'г'
+        }]
+
+    def test_no_queries_after_build(self, api_client, ingredients,
+                                    django_assert_num_queries):
+        search(api_client, 'м')
+        with django_assert_num_queries(0):
+            assert search(api_client, 'мо') == ['Молоко'], (
+                'Повторный поиск не должен обращаться к БД'
+            )
+
+    def test_invalidation(self, api_client, ingredients):
+        search(api_client, 'м')
+        index = ingredient_index.get_index()
+
+        Ingredient.objects.create(name='Мёд', measurement_unit='г')
+        assert 'Мёд' in search(api_client, 'мё'), (
+            'Новый ингредиент должен попадать в индекс'
+        )
+        assert ingredient_index.get_index() is not index
+
+        ingredients[0].delete()
+        assert search(api_client, 'мук') == [], (
+            'Удаленный ингредиент должен пропадать из индекса'
+        )
+
+
+class TestIngredientSearch:
+    """Тесты ранжированного поиска ингредиентов (?search=)."""
+
+    def test_ranking(self, api_client, ingredients):
+        # В SQLite LIKE не учитывает регистр только для латиницы,
+        # поэтому подстрока написана в том же регистре, что и в названии
+        assert search(api_client, search='мука') == [
+            'Мука', 'пшеничная мука'
+        ], 'Совпадения по началу названия идут раньше подстрок'
+        assert search(api_client, search='ука') == [
+            'Мука', 'пшеничная мука'
+        ]
+        assert search(api_client, search='абв') == []
+
+    def test_limit(self, api_client, ingredients,
+                   django_assert_num_queries):
+        assert search(api_client, search='', limit=2) == [
+            'Молоко', 'Мука'
+        ], 'Пустой запрос отдает первые limit ингредиентов'
+        with django_assert_num_queries(0):
+            assert search(api_client, search='м', limit=2) == [
+                'Молоко', 'Мука'
+            ], 'Совпадения по началу названия берутся из индекса'
+
+    @pytest.mark.parametrize('limit', ['0', '101', 'abc'])
+    def test_invalid_limit(self, api_client, limit):
+        response = api_client.get(reverse('ingredient-list'),
+                                  {'search': 'м', 'limit': limit})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_typo(self, api_client, ingredients):
+        if not trigram_available():
+            pytest.skip('Нужно расширение pg_trgm')
+        assert search(api_client, search='пшенчная') == [
+            'пшеничная мука'
+        ], 'Похожие названия находятся по триграммам'
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_ingredient_search', count=50, queries=5,
+                     stdout=out)
+        assert 'p99' in out.getvalue()
+        assert not Ingredient.objects.exists(), (
+            'Данные замера должны откатываться'
+        )
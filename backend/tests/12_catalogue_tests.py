@@ -0,0 +1,186 @@
+import gzip
+import json
+
+import pytest
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+
+from api import catalogue
+from api.cache import TAGS_VERSION, get_version
+from recipes.models import Tag
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    """Снимки пишутся во временный каталог."""
+    settings.MEDIA_ROOT = tmp_path
+    return tmp_path
+
+
+class TestCatalogueSnapshots:
+    """Тесты снимков справочников тегов и ингредиентов."""
+
+    def test_tags_snapshot(self, api_client, tag_breakfast, tag_lunch):
+        response = api_client.get(reverse('tags-list'))
+        assert response.status_code == status.HTTP_200_OK
+        digest = response['X-Catalogue-Version']
+        assert response['ETag'] == f'W/"{digest}"'
+        assert [tag['slug'] for tag in response.json()] == [
+            'breakfast', 'lunch'
+        ]
+        path = catalogue.snapshot_path('tags', digest)
+        assert default_storage.exists(path), (
+            'Снимок должен сохраняться в хранилище'
+        )
+        assert default_storage.url(path) in response['Link']
+
+    def test_revalidation_without_queries(self, api_client, tag_breakfast,
+                                          django_assert_num_queries):
+        url = reverse('tags-list')
+        etag = api_client.get(url)['ETag']
+        with django_assert_num_queries(0):
+            response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED, (
+            'Актуальный снимок перепроверяется без обращения к БД'
+        )
+        with django_assert_num_queries(0):
+            assert api_client.get(url).status_code == status.HTTP_200_OK
+
+    def test_gzip(self, api_client, ingredient_flour):
+        url = reverse('ingredient-list')
+        plain = api_client.get(url)
+        response = api_client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        assert response['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response['Vary']
+        assert json.loads(gzip.decompress(response.content)) == (
+            plain.json()
+        ) == [{'id': ingredient_flour.id, 'name': 'мука',
+               'measurement_unit': 'г'}]
+
+    def test_brotli(self, api_client, tag_breakfast):
+        brotli = pytest.importorskip('brotli')
+        response = api_client.get(reverse('tags-list'),
+                                  HTTP_ACCEPT_ENCODING='gzip, br')
+        assert response['Content-Encoding'] == 'br'
+        assert json.loads(brotli.decompress(response.content))
+
+    @pytest.mark.parametrize('header, encoding', [
+        ('', None),
+        ('gzip, deflate', 'gzip'),
+        ('GZIP;Q=0.8', 'gzip'),
+        ('xgzip', None),
+        ('gzip;q=0', None),
+        ('gzip;q=abc', None),
+        ('gzip;q=0.5, identity', None),
+        ('*', 'gzip'),
+        ('*, gzip;q=0', None),
+    ])
+    def test_accept_encoding(self, monkeypatch, header, encoding):
+        monkeypatch.setattr(catalogue, 'brotli', None)
+        assert catalogue.choose_encoding(header)[0] == encoding, (
+            'Кодировка выбирается по токенам и весам Accept-Encoding'
+        )
+
+    def test_brotli_token_not_substring(self, api_client, tag_breakfast):
+        response = api_client.get(reverse('tags-list'),
+                                  HTTP_ACCEPT_ENCODING='xbr')
+        assert 'Content-Encoding' not in response
+
+    def test_contents_replaced_not_mutated(self, api_client,
+                                           tag_breakfast):
+        contents = catalogue._contents
+        snapshot = dict(contents)
+        api_client.get(reverse('tags-list'))
+        assert contents == snapshot, (
+            'Прочитанный другими потоками словарь снимков не меняется'
+        )
+
+    def test_change_publishes_new_version(self, api_client, tag_breakfast):
+        url = reverse('tags-list')
+        old = api_client.get(url)['X-Catalogue-Version']
+
+        tag_breakfast.name = 'Поздний завтрак'
+        tag_breakfast.save()
+        response = api_client.get(url)
+        assert response['X-Catalogue-Version'] != old, (
+            'Изменение справочника должно давать новый снимок'
+        )
+        assert response.json()[0]['name'] == 'Поздний завтрак'
+        assert default_storage.exists(catalogue.snapshot_path('tags', old)), (
+            'Старый снимок остается доступным по своему адресу'
+        )
+
+    def test_old_generations_deleted(self, api_client, tag_breakfast,
+                                     media_root):
+        url = reverse('tags-list')
+        digests = [api_client.get(url)['X-Catalogue-Version']]
+        for name in ('Второй завтрак', 'Поздний завтрак'):
+            tag_breakfast.name = name
+            tag_breakfast.save()
+            digests.append(api_client.get(url)['X-Catalogue-Version'])
+
+        files = {path.name for path in (media_root / 'catalogue').iterdir()}
+        assert not any(digests[0] in name for name in files), (
+            'Снимки старше предыдущего удаляются'
+        )
+        for digest in digests[1:]:
+            assert f'tags.{digest}.json' in files, (
+                'Текущий и предыдущий снимки остаются'
+            )
+
+    def test_missing_file_republished(self, api_client, tag_breakfast,
+                                      monkeypatch):
+        url = reverse('tags-list')
+        digest = api_client.get(url)['X-Catalogue-Version']
+        monkeypatch.setattr(catalogue, '_contents', {})
+        default_storage.delete(catalogue.snapshot_path('tags', digest))
+
+        response = api_client.get(url)
+        assert response.status_code == status.HTTP_200_OK, (
+            'Удаленный файл снимка должен публиковаться заново'
+        )
+        assert response.json()[0]['slug'] == 'breakfast'
+        assert default_storage.exists(catalogue.snapshot_path('tags', digest))
+
+    def test_same_content_same_digest(self, tag_breakfast):
+        digest = catalogue.publish('tags')
+        cache.clear()
+        assert catalogue.publish('tags') == digest
+
+    def test_load_data_publishes(self, tmp_path,
+                                 django_capture_on_commit_callbacks):
+        (tmp_path / 'ingredients.csv').write_text('мука,г\nсоль,г\n',
+                                                  encoding='utf-8')
+        (tmp_path / 'tags.csv').write_text('Завтрак,breakfast\n',
+                                           encoding='utf-8')
+        with django_capture_on_commit_callbacks(execute=True):
+            call_command('load_data', path=str(tmp_path))
+
+        for name in catalogue.CATALOGUES:
+            version = get_version(catalogue.CATALOGUES[name][0])
+            assert cache.get(catalogue.SNAPSHOT_KEY.format(name, version)), (
+                f'Команда должна публиковать снимок {name}'
+            )
+
+    def test_admin_save_publishes(self, client, create_user,
+                                  django_capture_on_commit_callbacks):
+        admin = create_user(email='admin@example.com', username='admin',
+                            is_staff=True, is_superuser=True)
+        client.force_login(admin)
+        with django_capture_on_commit_callbacks(execute=True):
+            client.post(reverse('admin:recipes_tag_add'),
+                        {'name': 'Десерт', 'slug': 'dessert'})
+        assert Tag.objects.filter(slug='dessert').exists()
+        digest = cache.get(catalogue.SNAPSHOT_KEY.format(
+            'tags', get_version(TAGS_VERSION)
+        ))
+        assert digest, 'Сохранение в админке должно публиковать снимок'
+        with default_storage.open(
+            catalogue.snapshot_path('tags', digest)
+        ) as snapshot:
+            assert json.loads(snapshot.read())[0]['slug'] == 'dessert'
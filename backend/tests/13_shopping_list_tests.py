@@ -0,0 +1,342 @@
+import csv
+import io
+import json
+import os
+import re
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+
+from api import pdf, shopping_list
+from recipes.models import (CartIngredient, Ingredient, IngredientInRecipe,
+                            ShoppingCart)
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture
+def cart(authenticated_client, create_recipe):
+    """Два рецепта в корзине: общий ингредиент суммируется."""
+    client, user = authenticated_client
+    salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+    for recipe in (create_recipe(user), create_recipe(user)):
+        ShoppingCart.objects.create(user=user, recipe=recipe)
+    IngredientInRecipe.objects.create(recipe=recipe, ingredient=salt,
+                                      amount=5)
+    return client, user
+
+
+def download(client, **kwargs):
+    return client.get(reverse('recipe-download-shopping-cart'), **kwargs)
+
+
+def content(response):
+    return b''.join(response.streaming_content)
+
+
+def totals(user):
+    """Суммы ингредиентов корзины пользователя по названиям."""
+    return dict(CartIngredient.objects.filter(user=user).values_list(
+        'ingredient__name', 'amount'
+    ))
+
+
+class TestShoppingListDownload:
+    """Тесты скачивания списка покупок."""
+
+    def test_text_format(self, cart):
+        client, _ = cart
+        response = download(client)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming, 'Список должен отдаваться потоком'
+        assert response['Content-Type'] == 'text/plain; charset=utf-8'
+        assert 'shopping_list.txt' in response['Content-Disposition']
+        assert b''.join(response.streaming_content).decode() == (
+            'Список покупок:\n\n'
+            'мука - 400 г\n'
+            'соль - 5 г\n'
+        ), 'Формат списка покупок не должен меняться'
+
+    def test_empty_cart(self, authenticated_client):
+        client, _ = authenticated_client
+        assert b''.join(download(client).streaming_content).decode() == (
+            'Список покупок:\n\n'
+        )
+
+    def test_chunks(self, cart, monkeypatch):
+        _, user = cart
+        monkeypatch.setattr(shopping_list, 'SHOPPING_LIST_CHUNK_SIZE', 1)
+        renderer = shopping_list.TextRenderer()
+        assert list(renderer.stream(shopping_list.items(user))) == [
+            'Список покупок:\n\n', 'мука - 400 г\n', 'соль - 5 г\n'
+        ], 'Заголовок отдается сразу, строки — кусками'
+
+    def test_anonymous(self, api_client):
+        response = download(api_client)
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+class TestShoppingListFormats:
+    """Тесты форматов выгрузки списка покупок."""
+
+    def test_csv(self, cart):
+        client, _ = cart
+        response = download(client, data={'format': 'csv'})
+        assert response['Content-Type'] == 'text/csv; charset=utf-8'
+        assert 'shopping_list.csv' in response['Content-Disposition']
+        text = content(response).decode('utf-8-sig')
+        assert list(csv.reader(io.StringIO(text))) == [
+            list(shopping_list.CSV_HEADER),
+            ['мука', '400', 'г'],
+            ['соль', '5', 'г'],
+        ]
+
+    def test_json(self, cart):
+        client, _ = cart
+        response = download(client, data={'format': 'json'})
+        assert response['Content-Type'] == 'application/json'
+        assert json.loads(content(response)) == [
+            {'name': 'мука', 'amount': 400, 'measurement_unit': 'г'},
+            {'name': 'соль', 'amount': 5, 'measurement_unit': 'г'},
+        ]
+
+    def test_pdf(self, cart):
+        client, _ = cart
+        response = download(client, data={'format': 'pdf'})
+        assert response['Content-Type'] == 'application/pdf'
+        assert 'shopping_list.pdf' in response['Content-Disposition']
+        document = content(response)
+        assert document.startswith(b'%PDF-1.4')
+        assert document.endswith(b'%%EOF\n')
+        assert 'мука - 400 г'.encode('cp1251').hex().encode() in document
+        offset = int(re.search(rb'startxref\n(\d+)', document).group(1))
+        assert document[offset:].startswith(b'xref'), (
+            'startxref должен указывать на таблицу xref'
+        )
+
+    @pytest.mark.parametrize('embedded', [True, False])
+    def test_pdf_text(self, settings, embedded):
+        pypdf = pytest.importorskip('pypdf')
+        if not embedded:
+            settings.PDF_FONT_PATH = '/nonexistent/font.ttf'
+        elif not os.path.exists(settings.PDF_FONT_PATH):
+            pytest.skip('Нет файла шрифта PDF_FONT_PATH')
+        lines = ['Список покупок:', '', 'Щука ёршистая — 2 шт',
+                 'Mozzarella «di bufala» - 125 г', 'ЁЖ 10%', '№ 5']
+        document = b''.join(pdf.document(lines))
+        reader = pypdf.PdfReader(io.BytesIO(document))
+        text = reader.pages[0].extract_text()
+        assert text.splitlines() == [
+            line for line in lines[:-1] if line
+        ] + ['? 5'], 'Текст должен извлекаться из PDF без искажений'
+        font = reader.pages[0]['/Resources']['/Font']['/F1']
+        assert ('/FontDescriptor' in font) == embedded, (
+            'Шрифт с кириллицей встраивается в документ'
+        )
+        if embedded:
+            file = font['/FontDescriptor']['/FontFile2'].get_data()
+            assert file.startswith(b'\x00\x01\x00\x00')
+
+    def test_pdf_pages(self):
+        lines = [f'строка {number}' for number in range(
+            pdf.LINES_PER_PAGE * 2 + 1
+        )]
+        document = b''.join(pdf.document(lines))
+        assert b'/Count 3' in document, 'Длинный список занимает 3 страницы'
+        # Смещения в xref указывают на начала объектов
+        table = document[document.rindex(b'xref'):]
+        for number, offset in enumerate(
+            re.findall(rb'(\d{10}) 00000 n', table), start=1
+        ):
+            assert document[int(offset):].startswith(b'%d 0 obj' % number)
+
+    @pytest.mark.parametrize('accept, media_type', [
+        ('text/csv', 'text/csv'),
+        ('application/pdf', 'application/pdf'),
+        ('*/*', 'text/plain'),
+    ])
+    def test_accept(self, cart, accept, media_type):
+        client, _ = cart
+        response = download(client, HTTP_ACCEPT=accept)
+        assert response['Content-Type'].startswith(media_type)
+        assert 'Accept' in response['Vary']
+
+    def test_unknown_format(self, cart):
+        client, _ = cart
+        response = download(client, data={'format': 'xlsx'})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+class TestShoppingListCache:
+    """Тесты кеширования сумм списка покупок."""
+
+    def test_repeat_and_format_switch(self, cart,
+                                      django_assert_num_queries):
+        client, _ = cart
+        expected = content(download(client))
+        for data in ({}, {'format': 'csv'}, {'format': 'pdf'}):
+            # Только проверка состояния корзины, без агрегации
+            with django_assert_num_queries(1):
+                response = download(client, data=data)
+                content(response)
+        assert content(download(client)) == expected
+
+    def test_rows_streamed_while_reading(self, cart, monkeypatch):
+        _, user = cart
+        read = []
+
+        def rows(user):
+            for name in ('мука', 'соль'):
+                read.append(name)
+                yield {'name': name, 'total_amount': 1, 'unit': 'г'}
+
+        monkeypatch.setattr(shopping_list, 'shopping_list_items', rows)
+        items = shopping_list.items(user)
+        assert next(items)[0] == 'мука'
+        assert read == ['мука'], (
+            'Строка отдается сразу, до чтения всего списка'
+        )
+
+    def test_long_list_not_cached(self, cart, monkeypatch,
+                                  django_assert_num_queries):
+        client, _ = cart
+        monkeypatch.setattr(shopping_list, 'SHOPPING_LIST_CACHE_MAX_ROWS',
+                            1)
+        expected = content(download(client))
+        # Проверка состояния корзины и повторная агрегация
+        with django_assert_num_queries(2):
+            assert content(download(client)) == expected
+
+    def test_cart_change(self, cart, create_recipe):
+        client, user = cart
+        content(download(client))
+        recipe = create_recipe(user)
+        client.post(reverse('recipe-shopping-cart', args=[recipe.id]))
+        assert 'мука - 600 г' in content(download(client)).decode()
+
+        client.delete(reverse('recipe-shopping-cart', args=[recipe.id]))
+        assert 'мука - 400 г' in content(download(client)).decode()
+
+    def test_bulk_cart_change(self, cart, create_recipe):
+        client, user = cart
+        content(download(client))
+        recipe = create_recipe(user)
+        client.post(reverse('recipe-shopping-cart-bulk'),
+                    {'recipes': [recipe.id]}, format='json')
+        assert 'мука - 600 г' in content(download(client)).decode()
+
+    def test_recipe_ingredients_change(self, cart):
+        client, _ = cart
+        content(download(client))
+        ingredient = IngredientInRecipe.objects.get(ingredient__name='соль')
+        ingredient.amount = 7
+        ingredient.save()
+        assert 'соль - 7 г' in content(download(client)).decode(), (
+            'Изменение рецепта в корзине должно обновлять список'
+        )
+
+    def test_ingredient_rename(self, cart):
+        client, _ = cart
+        content(download(client))
+        salt = Ingredient.objects.get(name='соль')
+        salt.name = 'соль морская'
+        salt.save()
+        assert 'соль морская - 5 г' in content(download(client)).decode()
+
+
+class TestCartTotals:
+    """Тесты поддержки сумм ингредиентов корзины (CartIngredient)."""
+
+    def test_cart_add_and_remove(self, cart, create_recipe):
+        client, user = cart
+        assert totals(user) == {'мука': 400, 'соль': 5}
+
+        recipe = create_recipe(user)
+        client.post(reverse('recipe-shopping-cart', args=[recipe.id]))
+        assert totals(user) == {'мука': 600, 'соль': 5}
+
+        salted = IngredientInRecipe.objects.get(
+            ingredient__name='соль'
+        ).recipe_id
+        client.delete(reverse('recipe-shopping-cart', args=[salted]))
+        assert totals(user) == {'мука': 400}, (
+            'Ингредиент без рецептов в корзине должен исчезать из сумм'
+        )
+
+    def test_bulk(self, cart, create_recipe):
+        client, user = cart
+        url = reverse('recipe-shopping-cart-bulk')
+        recipe_ids = [create_recipe(user).id, create_recipe(user).id]
+        client.post(url, {'recipes': recipe_ids}, format='json')
+        assert totals(user) == {'мука': 800, 'соль': 5}
+
+        client.delete(url, {'recipes': recipe_ids}, format='json')
+        assert totals(user) == {'мука': 400, 'соль': 5}
+
+    def test_recipe_ingredients_edit(self, cart, create_user):
+        _, user = cart
+        other = create_user(email='other@example.com', username='other')
+        salted = IngredientInRecipe.objects.get(ingredient__name='соль')
+        ShoppingCart.objects.create(user=other, recipe=salted.recipe)
+
+        salted.amount = 7
+        salted.save()
+        assert totals(user) == {'мука': 400, 'соль': 7}
+        assert totals(other) == {'мука': 200, 'соль': 7}
+
+        pepper = Ingredient.objects.create(name='перец', measurement_unit='г')
+        salted.ingredient = pepper
+        salted.save()
+        assert totals(user) == {'мука': 400, 'перец': 7}
+
+        salted.delete()
+        assert totals(other) == {'мука': 200}
+
+    def test_recipe_update_api(self, cart, ingredient_flour, tag_breakfast,
+                               test_image):
+        client, user = cart
+        recipe = IngredientInRecipe.objects.get(
+            ingredient__name='соль'
+        ).recipe
+        response = client.patch(
+            reverse('recipe-detail', args=[recipe.id]),
+            {'ingredients': [{'id': ingredient_flour.id, 'amount': 50}],
+             'tags': [tag_breakfast.id], 'image': test_image,
+             'name': 'Лепешки', 'text': 'Замесить', 'cooking_time': 10},
+            format='json'
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert totals(user) == {'мука': 250}
+
+    def test_cascades(self, cart):
+        _, user = cart
+        Ingredient.objects.filter(name='соль').delete()
+        assert totals(user) == {'мука': 400}
+
+        ShoppingCart.objects.filter(user=user).first().recipe.delete()
+        assert totals(user) == {'мука': 200}
+
+    def test_download_reads_totals(self, cart, django_assert_num_queries):
+        client, user = cart
+        # Суммы берутся из таблицы, а не пересчитываются из корзины
+        CartIngredient.objects.filter(
+            user=user, ingredient__name='соль'
+        ).update(amount=9)
+        with django_assert_num_queries(2):
+            text = content(download(client)).decode()
+        assert 'соль - 9 г' in text
+
+    def test_rebuild_command(self, cart, django_capture_on_commit_callbacks):
+        client, user = cart
+        content(download(client))
+        CartIngredient.objects.filter(user=user).update(amount=1)
+        CartIngredient.objects.filter(ingredient__name='соль').delete()
+
+        with django_capture_on_commit_callbacks(execute=True):
+            call_command('rebuild_cart_totals', stdout=io.StringIO())
+        assert totals(user) == {'мука': 400, 'соль': 5}
+        assert 'мука - 400 г' in content(download(client)).decode(), (
+            'После пересчета закешированный список должен сбрасываться'
+        )
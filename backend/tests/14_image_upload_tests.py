@@ -0,0 +1,142 @@
+import base64
+import hashlib
+import io
+
+import pytest
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+
+from api import utils
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    """Загруженные файлы пишутся во временный каталог."""
+    settings.MEDIA_ROOT = tmp_path
+    return tmp_path
+
+
+def data_url(image_format='PNG', size=(10, 10), mime='image/png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, image_format)
+    return f'data:{mime};base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+class TestDecodeBase64Image:
+    """Тесты потокового декодирования изображений (api.utils)."""
+
+    def test_decode(self, test_image):
+        file = utils.decode_base64_image(test_image)
+        content = base64.b64decode(test_image.split(',')[1])
+        assert file.name == (
+            hashlib.sha256(content).hexdigest()[:32] + '.png'
+        ), 'Имя файла — хеш содержимого'
+        assert file.temporary_file_path(), (
+            'Изображение должно декодироваться во временный файл'
+        )
+        assert file.read() == base64.b64decode(test_image.split(',')[1])
+        assert file.size == len(base64.b64decode(test_image.split(',')[1]))
+
+    def test_chunks(self, monkeypatch):
+        image = data_url(size=(40, 40))
+        whole = utils.decode_base64_image(image)
+        monkeypatch.setattr(utils, 'IMAGE_HEADER_SIZE', 64)
+        monkeypatch.setattr(utils, 'IMAGE_DECODE_CHUNK_SIZE', 8)
+        file = utils.decode_base64_image(image)
+        assert file.read() == base64.b64decode(image.split(',')[1]), (
+            'Куски должны склеиваться в исходный файл'
+        )
+        assert file.name == whole.name, (
+            'Хеш не зависит от размера кусков'
+        )
+
+    @pytest.mark.parametrize('separator', ['\n', '\r\n', ' '])
+    def test_wrapped(self, monkeypatch, separator):
+        image = data_url(size=(40, 40))
+        whole = utils.decode_base64_image(image)
+        prefix, payload = image.split(',')
+        # Строки по 76 символов, как в MIME, и перенос в конце
+        wrapped = prefix + ',' + separator.join(
+            payload[index:index + 76]
+            for index in range(0, len(payload), 76)
+        ) + separator
+        monkeypatch.setattr(utils, 'IMAGE_HEADER_SIZE', 64)
+        monkeypatch.setattr(utils, 'IMAGE_DECODE_CHUNK_SIZE', 10)
+        file = utils.decode_base64_image(wrapped)
+        assert file.read() == base64.b64decode(payload), (
+            'Переносы строк в base64 должны отбрасываться'
+        )
+        assert (file.name, file.size) == (whole.name, whole.size)
+
+    def test_extension_from_content(self):
+        file = utils.decode_base64_image(
+            data_url('JPEG', mime='image/png')
+        )
+        assert file.name.endswith('.jpeg'), (
+            'Расширение определяется по содержимому, а не по MIME'
+        )
+
+    def test_size_checked_before_decoding(self, monkeypatch):
+        monkeypatch.setattr(utils, 'IMAGE_MAX_SIZE', 10)
+        monkeypatch.setattr(utils.base64, 'b64decode', None)
+        with pytest.raises(ValueError, match='больше'):
+            utils.decode_base64_image(data_url())
+
+    def test_too_many_pixels(self, monkeypatch):
+        monkeypatch.setattr(utils, 'IMAGE_MAX_PIXELS', 99)
+        with pytest.raises(ValueError, match='разрешение'):
+            utils.decode_base64_image(data_url())
+
+    @pytest.mark.parametrize('value, message', [
+        ('data:image/png;base64,' + base64.b64encode(b'x' * 30).decode(),
+         'не является изображением'),
+        (data_url('BMP', mime='image/bmp'), 'не поддерживается'),
+        ('data:image/png;base64,!!!!', 'base64'),
+        ('data:image/png;base64,abc', 'base64'),
+        ('data:image/png,abcd', 'Неверный формат'),
+        ('text', 'Неверный формат'),
+    ])
+    def test_invalid(self, value, message):
+        with pytest.raises(ValueError, match=message):
+            utils.decode_base64_image(value)
+
+
+class TestImageUploadAPI:
+    """Ошибки изображения возвращаются как ошибки валидации."""
+
+    def test_recipe_image(self, authenticated_client, ingredient_flour,
+                          tag_breakfast):
+        client, _ = authenticated_client
+        response = client.post(reverse('recipe-list'), {
+            'ingredients': [{'id': ingredient_flour.id, 'amount': 10}],
+            'tags': [tag_breakfast.id],
+            'image': 'data:image/png;base64,' + 'A' * 40,
+            'name': 'Оладьи', 'text': 'Смешать', 'cooking_time': 5,
+        }, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'image' in response.data
+
+    def test_recipe_image_saved(self, authenticated_client, ingredient_flour,
+                                tag_breakfast, test_image, media_root):
+        client, _ = authenticated_client
+        response = client.post(reverse('recipe-list'), {
+            'ingredients': [{'id': ingredient_flour.id, 'amount': 10}],
+            'tags': [tag_breakfast.id], 'image': test_image,
+            'name': 'Оладьи', 'text': 'Смешать', 'cooking_time': 5,
+        }, format='json')
+        assert response.status_code == status.HTTP_201_CREATED
+        [saved] = (media_root / 'recipes').iterdir()
+        assert saved.suffix == '.png'
+
+    def test_avatar(self, authenticated_client, monkeypatch):
+        client, _ = authenticated_client
+        monkeypatch.setattr(utils, 'IMAGE_MAX_SIZE', 10)
+        response = client.put(reverse('user-avatar'),
+                              {'avatar': data_url()}, format='json')
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'avatar' in response.data
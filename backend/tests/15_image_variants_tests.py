@@ -0,0 +1,175 @@
+import base64
+import io
+
+import pytest
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+
+from api import image_variants
+from recipes.models import Recipe
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    """Файлы и копии пишутся во временный каталог."""
+    settings.MEDIA_ROOT = tmp_path
+    return tmp_path
+
+
+def png(size=(1000, 500), mode='RGB'):
+    buffer = io.BytesIO()
+    Image.new(mode, size, 'red').save(buffer, 'PNG')
+    return ContentFile(buffer.getvalue())
+
+
+@pytest.fixture
+def recipe(create_recipe, create_user):
+    recipe = create_recipe(create_user(
+        username='chef', email='chef@example.com'
+    ))
+    recipe.image.save('photo.png', png(), save=False)
+    Recipe.objects.filter(pk=recipe.pk).update(image=recipe.image.name)
+    return recipe
+
+
+class TestImageVariants:
+    """Тесты уменьшенных копий изображений (api.image_variants)."""
+
+    def test_fallback_before_generation(self, recipe):
+        urls = image_variants.recipe_image_urls(
+            recipe.image.name, recipe.image_variants, None
+        )
+        assert set(urls) == {'webp', 'jpeg'}
+        for widths in urls.values():
+            assert widths == {'320': recipe.image.url,
+                              '640': recipe.image.url}, (
+                'Пока копий нет, отдается исходный файл'
+            )
+
+    def test_generate(self, recipe, media_root):
+        image_variants.generate(Recipe, recipe.pk)
+        recipe.refresh_from_db()
+        assert recipe.image_variants == {
+            'name': recipe.image.name, 'widths': [320, 640]
+        }
+        urls = image_variants.recipe_image_urls(
+            recipe.image.name, recipe.image_variants, None
+        )
+        for variant_format, extension in (('webp', 'WEBP'),
+                                          ('jpeg', 'JPEG')):
+            for width in (320, 640):
+                name = image_variants.variant_name(
+                    recipe.image.name, width, variant_format
+                )
+                assert urls[variant_format][str(width)].endswith(name)
+                with Image.open(media_root / name) as image:
+                    assert image.format == extension
+                    assert image.size == (width, width // 2), (
+                        'Копия уменьшается с сохранением пропорций'
+                    )
+
+    def test_small_image_not_upscaled(self, recipe, media_root):
+        recipe.image.save('small.png', png((100, 50), 'RGBA'))
+        image_variants.generate(Recipe, recipe.pk)
+        name = image_variants.variant_name(recipe.image.name, 640, 'jpeg')
+        with Image.open(media_root / name) as image:
+            assert image.size == (100, 50)
+
+    def test_rotated_jpeg(self, recipe, media_root):
+        # Снимок 2000x1000 с EXIF-поворотом на 90°: показывается 1000x2000
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = io.BytesIO()
+        Image.new('RGB', (2000, 1000), 'red').save(buffer, 'JPEG', exif=exif)
+        recipe.image.save('rotated.jpg', ContentFile(buffer.getvalue()))
+        image_variants.generate(Recipe, recipe.pk)
+        name = image_variants.variant_name(recipe.image.name, 640, 'jpeg')
+        with Image.open(media_root / name) as image:
+            assert image.size == (640, 1280), (
+                'Копия повернутого снимка должна иметь заданную ширину'
+            )
+
+    def test_replaced_image_falls_back(self, recipe):
+        image_variants.generate(Recipe, recipe.pk)
+        recipe.refresh_from_db()
+        recipe.image.save('other.png', png())
+        urls = image_variants.recipe_image_urls(
+            recipe.image.name, recipe.image_variants, None
+        )
+        assert urls['webp']['320'] == recipe.image.url, (
+            'Копии прежнего файла не должны отдаваться для нового'
+        )
+
+    def test_delete_variants(self, recipe, media_root):
+        image_variants.generate(Recipe, recipe.pk)
+        recipe.refresh_from_db()
+        image_variants.delete_variants(
+            recipe.image.name, [320, 640], recipe.image.storage
+        )
+        assert not list((media_root / 'variants').rglob('*.*'))
+
+    def test_broken_image(self, recipe, media_root):
+        (media_root / recipe.image.name).write_bytes(b'broken')
+        image_variants.generate(Recipe, recipe.pk)
+        recipe.refresh_from_db()
+        assert recipe.image_variants == {}
+
+    def test_scheduled_after_commit(self, recipe, monkeypatch,
+                                    django_capture_on_commit_callbacks):
+        submitted = []
+        monkeypatch.setattr(image_variants, '_submit',
+                            lambda *args: submitted.append(args))
+        with django_capture_on_commit_callbacks(execute=True):
+            recipe.save()
+        assert submitted == [(Recipe, recipe.pk)]
+
+        submitted.clear()
+        with django_capture_on_commit_callbacks(execute=True):
+            recipe.save(update_fields=['name'])
+        assert not submitted, (
+            'Сохранение без изменения файла не запускает построение'
+        )
+
+    def test_backfill_command(self, recipe):
+        call_command('generate_image_variants')
+        recipe.refresh_from_db()
+        assert recipe.image_variants['widths'] == [320, 640], (
+            'Команда строит копии изображений, загруженных ранее'
+        )
+
+
+class TestImageVariantsAPI:
+    """Ссылки на копии в ответах API."""
+
+    def test_recipe(self, client, recipe):
+        image_variants.generate(Recipe, recipe.pk)
+        response = client.get(reverse('recipe-detail', args=[recipe.pk]))
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['image_variants']['webp']['640'].endswith(
+            image_variants.variant_name(recipe.image.name, 640, 'webp')
+        )
+
+    def test_avatar(self, authenticated_client):
+        client, user = authenticated_client
+        avatar = 'data:image/png;base64,' + base64.b64encode(
+            png((200, 200)).read()
+        ).decode()
+        response = client.put(reverse('user-avatar'), {'avatar': avatar},
+                              format='json')
+        assert response.status_code == status.HTTP_200_OK
+        user.refresh_from_db()
+        original = client.get(reverse('users-me')).data['avatar']
+        assert original.endswith(user.avatar.name)
+
+        image_variants.generate(type(user), user.pk)
+        # Клиент авторизован этим объектом: обновляем его из БД
+        user.refresh_from_db()
+        avatar = client.get(reverse('users-me')).data['avatar']
+        assert avatar.endswith(
+            image_variants.variant_name(user.avatar.name, 160, 'webp')
+        ), 'После построения копий отдается уменьшенная аватарка'
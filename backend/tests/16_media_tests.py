@@ -0,0 +1,158 @@
+import base64
+import io
+
+import pytest
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+
+from api import image_variants, media
+from recipes.models import Recipe
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path, monkeypatch):
+    """Файлы пишутся во временный каталог, копии не строятся."""
+    settings.MEDIA_ROOT = tmp_path
+    monkeypatch.setattr(image_variants, '_submit', lambda *args: None)
+    return tmp_path
+
+
+def data_url(color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (20, 20), color).save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()
+    ).decode()
+
+
+def files(path):
+    return sorted(
+        str(file.relative_to(path)) for file in path.rglob('*.*')
+    )
+
+
+class TestContentAddressedMedia:
+    """Тесты имен по хешу содержимого и удаления файлов (api.media)."""
+
+    @pytest.fixture
+    def payload(self, ingredient_flour, tag_breakfast):
+        return {
+            'ingredients': [{'id': ingredient_flour.id, 'amount': 10}],
+            'tags': [tag_breakfast.id],
+            'name': 'Оладьи', 'text': 'Смешать', 'cooking_time': 5,
+        }
+
+    @pytest.fixture
+    def post_recipe(self, authenticated_client, payload,
+                    django_capture_on_commit_callbacks):
+        client, _ = authenticated_client
+
+        def post(image):
+            with django_capture_on_commit_callbacks(execute=True):
+                response = client.post(reverse('recipe-list'),
+                                       {**payload, 'image': image},
+                                       format='json')
+            assert response.status_code == status.HTTP_201_CREATED
+            return Recipe.objects.get(pk=response.data['id'])
+        return post
+
+    @pytest.fixture
+    def patch(self, authenticated_client, payload,
+              django_capture_on_commit_callbacks):
+        client, _ = authenticated_client
+
+        def patch(recipe, image):
+            with django_capture_on_commit_callbacks(execute=True):
+                response = client.patch(
+                    reverse('recipe-detail', args=[recipe.pk]),
+                    {**payload, 'image': image}, format='json'
+                )
+            assert response.status_code == status.HTTP_200_OK
+            recipe.refresh_from_db()
+        return patch
+
+    def test_same_content_stored_once(self, post_recipe, media_root):
+        first = post_recipe(data_url())
+        second = post_recipe(data_url())
+        assert first.image.name == second.image.name, (
+            'Одинаковое содержимое должно давать одно имя'
+        )
+        assert files(media_root) == [first.image.name]
+
+    def test_patch_same_image_keeps_file(self, post_recipe, patch,
+                                         media_root, monkeypatch):
+        recipe = post_recipe(data_url())
+        name = recipe.image.name
+        storage = recipe.image.storage
+        monkeypatch.setattr(storage, 'save', None)
+        monkeypatch.setattr(storage, 'delete', None)
+        patch(recipe, data_url())
+        assert recipe.image.name == name
+        assert files(media_root) == [name], (
+            'Прежнее изображение не должно перезаписываться'
+        )
+
+    def test_replaced_image_deleted(self, post_recipe, patch, media_root):
+        recipe = post_recipe(data_url())
+        old_name = recipe.image.name
+        variant = media_root / image_variants.variant_name(
+            old_name, 320, 'webp'
+        )
+        variant.parent.mkdir(parents=True)
+        variant.write_bytes(b'variant')
+        patch(recipe, data_url('blue'))
+        assert recipe.image.name != old_name
+        assert files(media_root) == [recipe.image.name], (
+            'Неиспользуемый файл удаляется вместе с копиями'
+        )
+
+    def test_shared_file_kept(self, post_recipe, patch, media_root,
+                              django_capture_on_commit_callbacks):
+        recipe = post_recipe(data_url())
+        other = post_recipe(data_url())
+        patch(recipe, data_url('blue'))
+        assert other.image.name in files(media_root), (
+            'Файл другого рецепта не должен удаляться'
+        )
+
+        with django_capture_on_commit_callbacks(execute=True):
+            other.delete()
+        assert files(media_root) == [recipe.image.name], (
+            'Файл удаляется вместе с последним рецептом'
+        )
+
+    def test_collect(self, create_recipe, create_user, media_root):
+        recipe = create_recipe(create_user())
+        (media_root / 'recipes').mkdir()
+        (media_root / recipe.image.name).write_bytes(b'image')
+        assert not media.collect(Recipe, recipe.image.name)
+        Recipe.objects.filter(pk=recipe.pk).update(image='recipes/x.png')
+        assert media.collect(Recipe, recipe.image.name)
+        assert files(media_root) == []
+
+    def test_avatar(self, authenticated_client, media_root,
+                    django_capture_on_commit_callbacks):
+        client, user = authenticated_client
+        url = reverse('user-avatar')
+        with django_capture_on_commit_callbacks(execute=True):
+            client.put(url, {'avatar': data_url()}, format='json')
+        user.refresh_from_db()
+        first = user.avatar.name
+        assert first.startswith('avatars/') and len(first) == len(
+            'avatars/' + '0' * 32 + '.png'
+        ), 'Имя аватарки — хеш содержимого'
+
+        with django_capture_on_commit_callbacks(execute=True):
+            client.put(url, {'avatar': data_url('blue')}, format='json')
+        user.refresh_from_db()
+        assert files(media_root) == [user.avatar.name], (
+            'Прежняя аватарка удаляется'
+        )
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = client.delete(url)
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert files(media_root) == []
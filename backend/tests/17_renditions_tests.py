@@ -0,0 +1,199 @@
+import io
+import os
+import threading
+
+import pytest
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+
+from api import renditions
+
+NAME = 'recipes/photo.jpg'
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    """Исходные файлы и кеш копий — во временном каталоге."""
+    settings.MEDIA_ROOT = tmp_path
+    (tmp_path / 'recipes').mkdir()
+    Image.new('RGB', (1000, 500), 'red').save(tmp_path / NAME, 'JPEG')
+    return tmp_path
+
+
+def url(name=NAME, **params):
+    query = ''.join(f'?{key}={value}' for key, value in params.items())
+    return reverse('media-image', args=[name]) + query
+
+
+def content(response):
+    return b''.join(response.streaming_content)
+
+
+def size(data):
+    with Image.open(io.BytesIO(data)) as image:
+        return image.size
+
+
+class TestRenditions:
+    """Тесты копий изображений по запросу (api.renditions)."""
+
+    def test_resized(self, client, media_root):
+        response = client.get(url(w=320))
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'image/jpeg'
+        assert size(content(response)) == (320, 160)
+        assert (media_root / 'renditions' / '320' / NAME).exists(), (
+            'Копия должна сохраняться в кеш на диске'
+        )
+
+    def test_hit_without_pillow(self, client, monkeypatch):
+        first = content(client.get(url(w=320)))
+        monkeypatch.setattr(renditions.Image, 'open', None)
+        response = client.get(url(w=320))
+        assert response.status_code == status.HTTP_200_OK
+        assert content(response) == first, (
+            'Готовая копия должна отдаваться с диска без Pillow'
+        )
+
+    @pytest.mark.parametrize('value, width', [
+        (1, 160), (300, 320), (320, 320), (5000, 1280),
+    ])
+    def test_width_rounded_up(self, value, width):
+        assert renditions.rendition_width(value) == width
+
+    @pytest.mark.parametrize('value', ['0', '-5', 'abc', ''])
+    def test_invalid_width(self, client, value):
+        response = client.get(url(w=value))
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_missing_source(self, client):
+        response = client.get(url('recipes/missing.jpg', w=320))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.parametrize('name', ['recipes/..', 'recipes/.'])
+    def test_directory(self, client, name):
+        response = client.get(url(name, w=320))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_original(self, client, media_root):
+        response = client.get(url())
+        assert content(response) == (media_root / NAME).read_bytes()
+
+    def test_small_source_not_upscaled(self, client, media_root):
+        response = client.get(url(w=1280))
+        assert content(response) == (media_root / NAME).read_bytes()
+
+    def test_narrow_tall_source_copied(self, client, media_root):
+        Image.new('RGB', (200, 1000), 'red').save(media_root / NAME, 'JPEG')
+        response = client.get(url(w=320))
+        assert content(response) == (media_root / NAME).read_bytes(), (
+            'Исходный файл не шире копии отдается как есть, '
+            'даже если он выше нее'
+        )
+
+    def test_palette_png_keeps_transparency(self, client, media_root):
+        name = 'recipes/palette.png'
+        image = Image.new('P', (1000, 500), 0)
+        image.putpalette([255, 0, 0, 0, 0, 255])
+        image.paste(1, (500, 0, 1000, 500))
+        image.save(media_root / name, 'PNG', transparency=0)
+
+        response = client.get(url(name, w=320))
+        assert response['Content-Type'] == 'image/png'
+        with Image.open(io.BytesIO(content(response))) as rendition:
+            assert (rendition.format, rendition.mode) == ('PNG', 'RGBA'), (
+                'Палитра уменьшается в RGBA, а не по ближайшему соседу'
+            )
+            assert rendition.size == (320, 160)
+            assert rendition.getpixel((10, 80))[3] == 0, (
+                'Прозрачность палитры должна сохраняться'
+            )
+            assert rendition.getpixel((310, 80)) == (0, 0, 255, 255)
+
+    def test_gif(self, client, media_root):
+        name = 'recipes/photo.gif'
+        Image.new('RGB', (1000, 500), 'blue').save(media_root / name, 'GIF')
+        response = client.get(url(name, w=320))
+        assert response['Content-Type'] == 'image/gif'
+        with Image.open(io.BytesIO(content(response))) as rendition:
+            assert (rendition.format, rendition.size) == ('GIF', (320, 160))
+            assert rendition.convert('RGB').getpixel((160, 80)) == (
+                0, 0, 255
+            )
+
+    def test_animated_gif_copied(self, client, media_root):
+        name = 'recipes/animated.gif'
+        frames = [Image.new('RGB', (1000, 500), color)
+                  for color in ('red', 'blue')]
+        frames[0].save(media_root / name, 'GIF', save_all=True,
+                       append_images=frames[1:])
+        response = client.get(url(name, w=320))
+        assert content(response) == (media_root / name).read_bytes(), (
+            'Анимацию нельзя уменьшить одним кадром'
+        )
+
+    def test_stale_rendition_rebuilt(self, client, media_root):
+        client.get(url(w=320))
+        path = renditions.rendition_path(NAME, 320)
+        os.utime(path, (0, 0))
+        Image.new('RGB', (640, 640), 'blue').save(media_root / NAME, 'JPEG')
+        assert size(content(client.get(url(w=320)))) == (320, 320), (
+            'Копия старше исходного файла строится заново'
+        )
+
+    def test_immutable_cache_control(self, client, media_root):
+        name = 'recipes/' + 'a' * 32 + '.jpg'
+        (media_root / NAME).rename(media_root / name)
+        response = client.get(url(name, w=320))
+        assert 'immutable' in response['Cache-Control']
+        assert not client.get(url(name.replace('a', 'b', 1), w=320)).has_header(
+            'Cache-Control'
+        )
+
+    def test_concurrent_requests_coalesced(self, monkeypatch):
+        calls = []
+        resize = renditions.resize
+
+        def counting_resize(image, width):
+            calls.append(width)
+            return resize(image, width)
+
+        monkeypatch.setattr(renditions, 'resize', counting_resize)
+        barrier = threading.Barrier(8)
+
+        def request():
+            barrier.wait()
+            renditions.rendition(NAME, 320)
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert calls == [320], 'Копию должен построить один запрос'
+
+    def test_lru_eviction(self, monkeypatch, media_root):
+        paths = {
+            width: renditions.rendition(NAME, width)
+            for width in (160, 320, 480)
+        }
+        for age, width in enumerate((320, 160, 480)):
+            os.utime(paths[width], (age, age))
+        sizes = {width: os.path.getsize(path)
+                 for width, path in paths.items()}
+        monkeypatch.setattr(renditions, 'RENDITION_CACHE_MAX_SIZE',
+                            sum(sizes.values()) - 1)
+        monkeypatch.setattr(renditions, 'RENDITION_CACHE_LOW_WATER', 1)
+        assert renditions.evict() == sizes[160] + sizes[480]
+        assert not os.path.exists(paths[320]), (
+            'Удаляется копия, которую дольше всех не читали'
+        )
+        assert os.path.exists(paths[160]) and os.path.exists(paths[480])
+
+    def test_eviction_after_write(self, monkeypatch):
+        monkeypatch.setattr(renditions, 'RENDITION_CACHE_MAX_SIZE', 1)
+        path = renditions.rendition(NAME, 320)
+        assert not os.path.exists(path), (
+            'Превышение предела после записи запускает очистку'
+        )
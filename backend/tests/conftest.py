@@ -1,8 +1,59 @@
+import re
+from collections import Counter
+from contextlib import contextmanager
+
 import pytest
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 
-from recipes.models import Tag
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Кеш не должен переживать тест вместе с откатом базы."""
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def query_shape(sql):
+    """SQL без значений параметров: одинаковые запросы совпадают."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+    return re.sub(r'\(\?(, \?)*\)', '(...)', sql)
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Проверка бюджета запросов к БД.
+
+    with query_budget(5): ... — тест падает, если внутри блока выполнено
+    больше 5 запросов; в сообщении перечисляются повторяющиеся запросы.
+    """
+    @contextmanager
+    def check(max_queries):
+        with CaptureQueriesContext(connection) as queries:
+            yield queries
+        if len(queries) <= max_queries:
+            return
+        shapes = Counter(
+            query_shape(query['sql']) for query in queries.captured_queries
+        )
+        repeated = '\n'.join(
+            f'{count} x {shape}' for shape, count in shapes.most_common()
+            if count > 1
+        ) or 'нет'
+        pytest.fail(
+            f'Выполнено {len(queries)} запросов к БД при бюджете '
+            f'{max_queries}.\nПовторяющиеся запросы:\n{repeated}',
+            pytrace=False
+        )
+    return check
 
 
 @pytest.fixture
@@ -74,3 +125,36 @@ def tag_dinner():
         name='Ужин',
         slug='dinner'
     )
+
+
+@pytest.fixture
+def ingredient_flour():
+    """Фикстура для ингредиента 'Мука'."""
+    return Ingredient.objects.create(
+        name='мука',
+        measurement_unit='г'
+    )
+
+
+@pytest.fixture
+def create_recipe(tag_breakfast, ingredient_flour):
+    """Фабрика рецептов с одним тегом и одним ингредиентом."""
+
+    def make_recipe(author, **kwargs):
+        recipe_data = {
+            'name': 'Блины',
+            'text': 'Смешать и пожарить',
+            'cooking_time': 30,
+            'image': 'recipes/test.png',
+        }
+        recipe_data.update(kwargs)
+
+        recipe = Recipe.objects.create(author=author, **recipe_data)
+        recipe.tags.add(tag_breakfast)
+        IngredientInRecipe.objects.create(
+            recipe=recipe,
+            ingredient=ingredient_flour,
+            amount=200
+        )
+        return recipe
+    return make_recipe
@@ -21,12 +21,16 @@ class CustomUserAdmin(UserAdmin):
                     'subscriptions_count',
                     'subscribers_count')
 
+    # Счетчики хранятся в модели и не требуют COUNT на каждую строку
+    readonly_fields = ('recipes_count', 'favorites_count',
+                       'subscriptions_count', 'subscribers_count')
     list_filter = ('is_staff', 'is_active', 'date_joined')
     search_fields = ('username', 'email', 'first_name', 'last_name')
 
     # Добавляем avatar в fieldsets
     fieldsets = UserAdmin.fieldsets + (
         ('Аватар', {'fields': ('avatar',)}),
+        ('Счетчики', {'fields': readonly_fields}),
     )
 
     # Поля для создания пользователя
@@ -38,26 +42,6 @@ class CustomUserAdmin(UserAdmin):
         }),
     )
 
-    def recipes_count(self, obj):
-        """Количество рецептов пользователя."""
-        return obj.recipes.count()
-    recipes_count.short_description = 'Рецепты'
-
-    def favorites_count(self, obj):
-        """Количество избранных рецептов."""
-        return obj.favorites.count()
-    favorites_count.short_description = 'Избранное'
-
-    def subscriptions_count(self, obj):
-        """Количество подписок пользователя (на кого подписан)."""
-        return obj.subscriptions.count()
-    subscriptions_count.short_description = 'Подписки'
-
-    def subscribers_count(self, obj):
-        """Количество подписчиков пользователя (кто подписан на него)."""
-        return obj.subscribers.count()
-    subscribers_count.short_description = 'Подписчики'
-
 
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
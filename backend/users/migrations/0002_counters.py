@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-17 08:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Избранное'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Рецепты'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='shopping_cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Список покупок'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='subscribers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчики'),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='subscriptions_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписки'),
+        ),
+    ]
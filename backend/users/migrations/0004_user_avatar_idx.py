@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-17 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_customuser_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['avatar'], name='user_avatar_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 import core.constants as constants
+from core.models import CounterMixin
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
 from django.db import models
@@ -35,6 +36,27 @@ class CustomUser(AbstractUser):
         verbose_name='Аватарка',
         help_text='Загрузите изображение для аватара'
     )
+    # Заполняет api.image_variants, когда уменьшенные копии готовы
+    avatar_variants = models.JSONField(
+        'Копии аватарки', default=dict, blank=True, editable=False
+    )
+
+    # Счетчики обновляются CounterMixin связанных моделей
+    recipes_count = models.PositiveIntegerField(
+        'Рецепты', default=0, editable=False
+    )
+    favorites_count = models.PositiveIntegerField(
+        'Избранное', default=0, editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        'Список покупок', default=0, editable=False
+    )
+    subscriptions_count = models.PositiveIntegerField(
+        'Подписки', default=0, editable=False
+    )
+    subscribers_count = models.PositiveIntegerField(
+        'Подписчики', default=0, editable=False
+    )
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -43,6 +65,8 @@ class CustomUser(AbstractUser):
         indexes = [  # Добавляем индексы
             models.Index(fields=['email']),
             models.Index(fields=['username']),
+            # Проверка ссылок на файл перед удалением (api.media)
+            models.Index(fields=['avatar'], name='user_avatar_idx'),
         ]
 
     def clean(self):
@@ -59,9 +83,14 @@ class CustomUser(AbstractUser):
         return self.username
 
 
-class Subscription(models.Model):
+class Subscription(CounterMixin, models.Model):
     """Модель для подписок на пользователей."""
 
+    counted_relations = (
+        ('subscriber', 'subscriptions_count'),
+        ('author', 'subscribers_count'),
+    )
+
     subscriber = models.ForeignKey(
         CustomUser,
         on_delete=models.CASCADE,